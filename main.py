@@ -1,16 +1,19 @@
-from src.graph_builder import build_side_effect_graph
-from src.visualize_graph import visualize_graph, visualize_complete_graph
+from itertools import islice
+
+from src.graph_builder import load_or_build_graph
+from src.visualize_graph import visualize_graph, stream_edge_arrays_html
 from src.analytics import risk_scores  
 from src.risk_analyzer import calculate_and_add_risk_scores, export_risk_scores, visualize_risk_scores
 
 if __name__ == "__main__":
-    # 1. Build the graph
-    graph = build_side_effect_graph("data/processed/side_effects_clean.csv")
+    # 1. Build the graph (or reload the snapshot of an unchanged dataset);
+    #    the sparse form is used as is, without rebuilding an nx graph
+    graph = load_or_build_graph("data/processed/side_effects_clean.csv", as_networkx=False)
 
-    print("Total nodes:", len(graph.nodes()))
-    print("Total edges:", len(graph.edges()))
+    print("Total nodes:", graph.number_of_nodes())
+    print("Total edges:", graph.number_of_edges())
 
-    for u, v, d in list(graph.edges(data=True))[:5]:
+    for u, v, d in islice(graph.edges(data=True), 5):
         print(f"{u} --({d['relation']})--> {v}")
 
     # 2. Add risk scores to drug nodes
@@ -20,13 +23,14 @@ if __name__ == "__main__":
     export_risk_scores(graph, output_csv="drug_risk_scores.csv")
 
     # 4. Visualize with updated risk-based sizing (optional)
-    visualize_graph(graph, output_path="sideeffectnet_graph.html", max_nodes=300)
+    visualize_graph(graph.to_networkx(max_nodes=300), output_path="sideeffectnet_graph.html", max_nodes=300)
     visualize_risk_scores("drug_risk_scores.csv", output_html="risk_scores_graph.html")
     # 5. Visualize the complete graph (optional)
-    visualize_complete_graph(graph, output_path="complete_sideeffectnet_graph.html")
+    drugs, side_effects = graph.edge_endpoints()
+    stream_edge_arrays_html(drugs, side_effects, output_path="complete_sideeffectnet_graph.html", static_layout=True)
 
     print("\nTop Drugs by Risk Score (Weighted by freq_pct):")
-    for drug, score in risk_scores(graph)[:10]:
+    for drug, score in risk_scores(graph, top_k=10):
         print(f"{drug} — Risk Score: {score:.2f}")
 
         
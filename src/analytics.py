@@ -1,19 +1,98 @@
+import numpy as np
 import pandas as pd
 import networkx as nx
 
-def risk_scores(graph):
+def risk_scores(graph, top_k=None):
     """
     Calculate risk score = number of side effects per drug.
-    Returns a list of tuples (drug_name, risk_score) sorted by score descending.
+    Returns a list of tuples (drug_name, risk_score) sorted by score descending
+    (only the top_k when given).
     """
-    drug_scores = []
-    for node, data in graph.nodes(data=True):
-        if data.get("type") == "drug":
-            # Count side effects (out edges)
-            score = graph.out_degree(node)
-            drug_scores.append((node, score))
-    # Sort descending by risk score
-    return sorted(drug_scores, key=lambda x: x[1], reverse=True)
+    ranking = RiskRanking.from_graph(graph, model='degree')
+    if top_k is not None:
+        return ranking.top(top_k)
+    # Stable sort keeps graph node order among equal scores
+    order = np.argsort(-ranking.scores, kind='stable')
+    return list(zip([ranking.names[i] for i in order.tolist()], ranking.scores[order].tolist()))
+
+class RiskRanking:
+    """
+    Top-k queries over a precomputed per-drug score array.
+
+    Selection uses np.argpartition, so a query costs O(n) plus sorting the
+    k results instead of sorting every drug. Results are ordered by score
+    descending with ties in the original drug order, the same order as a
+    stable sort of the whole list.
+    """
+    def __init__(self, names, scores):
+        self.names = list(names)
+        self.scores = np.asarray(scores)
+        self.positions = {name: i for i, name in enumerate(self.names)}
+
+    @classmethod
+    def from_graph(cls, graph, model='degree'):
+        """
+        Rank the drugs of a graph by one of the risk_analyzer.score_drugs() models.
+        The degree model only reads the out-degrees.
+        """
+        from src.risk_analyzer import drug_degrees, score_drugs
+
+        if model == 'degree':
+            return cls(*drug_degrees(graph))
+        table = score_drugs(graph, models=[model])
+        return cls(table['drug_name'].tolist(), table[model].to_numpy())
+
+    @classmethod
+    def from_frame(cls, df, score_column='risk_score', name_column='drug_name'):
+        """
+        Rank the rows of a table such as drug_risk_scores.csv.
+        """
+        return cls(df[name_column].tolist(), df[score_column].to_numpy(dtype=float))
+
+    def _candidates(self, min_score=None, max_score=None, drugs=None):
+        if drugs is not None:
+            ids = np.array(sorted({self.positions[d] for d in drugs if d in self.positions}), dtype=np.int64)
+        else:
+            ids = np.arange(len(self.scores))
+        scores = self.scores[ids]
+        mask = np.ones(len(ids), dtype=bool)
+        if min_score is not None:
+            mask &= scores >= min_score
+        if max_score is not None:
+            mask &= scores <= max_score
+        return ids[mask], scores[mask]
+
+    def count(self, min_score=None, max_score=None, drugs=None):
+        """
+        Number of drugs passing the filters.
+        """
+        return len(self._candidates(min_score, max_score, drugs)[0])
+
+    def top(self, k, offset=0, min_score=None, max_score=None, drugs=None):
+        """
+        The drugs ranked offset .. offset + k, optionally restricted to a
+        score range and to a subset of drugs.
+
+        Returns:
+            list of (drug_name, score) tuples.
+        """
+        ids, scores = self._candidates(min_score, max_score, drugs)
+        end = offset + k
+        if end <= 0 or len(ids) == 0:
+            return []
+        if end < len(ids):
+            # Keep everything tied with the end-th score, then order exactly
+            threshold = np.partition(scores, len(scores) - end)[len(scores) - end]
+            keep = np.flatnonzero(scores >= threshold)
+            ids, scores = ids[keep], scores[keep]
+        order = np.lexsort((ids, -scores))[offset:end]
+        return list(zip([self.names[i] for i in ids[order].tolist()], scores[order].tolist()))
+
+    def page(self, page, page_size=25, **filters):
+        """
+        One page (0-based) of the leaderboard; filters as for top().
+        """
+        return self.top(page_size, offset=page * page_size, **filters)
 
 # Add test cases for analytics functions
 import unittest
@@ -81,6 +160,892 @@ class TestAnalytics(unittest.TestCase):
         self.assertEqual(side_effects["Nausea"], 10.5)
         self.assertEqual(side_effects["Headache"], 5.2)
 
+    def test_score_drugs_models(self):
+        # Test the vectorized risk models on a small graph
+        from src.risk_analyzer import score_drugs
+        graph = nx.DiGraph()
+        graph.add_node("Aspirin", type="drug")
+        graph.add_node("Warfarin", type="drug")
+        graph.add_edge("Aspirin", "Nausea", frequency=0.2)
+        graph.add_edge("Aspirin", "Headache", frequency=0.4)
+        graph.add_edge("Warfarin", "Bleeding")
+        scores = score_drugs(graph).set_index("drug_name")
+        self.assertAlmostEqual(scores.loc["Aspirin", "mean_frequency"], 0.3)
+        self.assertAlmostEqual(scores.loc["Aspirin", "max_frequency"], 0.4)
+        self.assertAlmostEqual(scores.loc["Aspirin", "weighted_count"], 0.6)
+        self.assertAlmostEqual(scores.loc["Aspirin", "quantile_score"], 0.75)
+        self.assertEqual(scores.loc["Warfarin", "degree"], 1)
+        self.assertEqual(scores.loc["Warfarin", "mean_frequency"], 0.0)
+
+    def test_risk_ranking_top_k(self):
+        # Test top-k selection, filters and paging against a full sort
+        names = [f"Drug{i}" for i in range(50)]
+        scores = [(i * 7) % 11 / 10 for i in range(50)]
+        ranking = RiskRanking(names, scores)
+        full = sorted(zip(names, scores), key=lambda x: x[1], reverse=True)
+        self.assertEqual(ranking.top(5), full[:5])
+        self.assertEqual(ranking.page(2, page_size=10), full[20:30])
+        in_range = [(n, s) for n, s in full if 0.2 <= s <= 0.5]
+        self.assertEqual(ranking.top(8, min_score=0.2, max_score=0.5), in_range[:8])
+        subset = [n for n, s in in_range]
+        self.assertEqual(ranking.top(100, drugs=subset), in_range)
+
+    def test_risk_scores_degree(self):
+        # Test the degree ranking against counting out edges per drug node
+        graph = nx.DiGraph()
+        for i in range(20):
+            graph.add_node(f"Drug{i}", type="drug")
+            for j in range(i % 7):
+                graph.add_edge(f"Drug{i}", f"SideEffect{j}")
+        graph.add_edge("SideEffect0", "SideEffect1")  # not a drug node
+        expected = sorted([(n, graph.out_degree(n)) for n, t in graph.nodes(data="type") if t == "drug"],
+                          key=lambda x: x[1], reverse=True)
+        self.assertEqual(risk_scores(graph), expected)
+        self.assertEqual(risk_scores(graph, top_k=5), expected[:5])
+
+    def test_sparse_graph_name_in_both_roles(self):
+        # Test a name that is both a drug and a side effect of another drug
+        from src.sparse_graph import SparseSideEffectGraph
+        from src.risk_analyzer import calculate_and_add_risk_scores
+        graph = nx.DiGraph()
+        graph.add_edge("Aspirin", "Nausea", frequency=0.2)
+        graph.add_edge("Warfarin", "Aspirin", frequency=0.4)
+        graph.add_edge("Nausea", "Rash")
+        for node in ("Aspirin", "Warfarin"):
+            graph.nodes[node]["type"] = "drug"
+        sparse = SparseSideEffectGraph.from_networkx(graph)
+        self.assertEqual(sparse.successors("Aspirin"), ["Nausea"])
+        self.assertEqual(sparse.predecessors("Aspirin"), ["Warfarin"])
+        self.assertEqual(sparse.number_of_edges(), 3)
+        calculate_and_add_risk_scores(graph)
+        self.assertAlmostEqual(graph.nodes["Aspirin"]["risk_score"], 0.2)
+        self.assertAlmostEqual(graph.nodes["Warfarin"]["risk_score"], 0.4)
+
+    def test_edge_delta_matches_full_rescore(self):
+        # Test that an added, removed and changed delta scores like a rebuild from the updated table
+        import os
+        import tempfile
+        from src.graph_builder import apply_edge_delta, build_side_effect_graph
+        from src.risk_analyzer import RISK_MODELS, calculate_and_add_risk_scores, update_risk_scores
+        added = pd.DataFrame({"drug_name": ["Heparin", "Ibuprofen"], "side_effect": ["Bleeding", "Rash"],
+                              "freq_pct": [0.5, 0.6]})
+        removed = pd.DataFrame({"drug_name": ["Warfarin", "Naproxen", "Naproxen"],
+                                "side_effect": ["Bleeding", "Nausea", "Rash"]})
+        changed = pd.DataFrame({"drug_name": ["Aspirin", "Ibuprofen"], "side_effect": ["Rash", "Nausea"],
+                                "freq_pct": [0.35, 0.15]})
+        updated = edge_table_fixture()
+        updated = updated[~updated.set_index(["drug_name", "side_effect"]).index.isin(
+            removed.set_index(["drug_name", "side_effect"]).index)]
+        for row in changed.itertuples():
+            updated.loc[(updated["drug_name"] == row.drug_name) & (updated["side_effect"] == row.side_effect),
+                        "freq_pct"] = row.freq_pct
+        updated = pd.concat([updated, added], ignore_index=True)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = os.path.join(tmp, "side_effects_clean.csv")
+            edge_table_fixture().to_csv(csv_path, index=False)
+            graph = calculate_and_add_risk_scores(build_side_effect_graph(csv_path))
+            updated.to_csv(csv_path, index=False)
+            expected = calculate_and_add_risk_scores(build_side_effect_graph(csv_path))
+
+        scores = update_risk_scores(graph, apply_edge_delta(graph, added, removed, changed))
+        self.assertEqual(scores["Heparin"], (None, 0.5))
+        self.assertEqual(scores["Naproxen"][1], None)
+        drugs = {node for node, node_type in graph.nodes(data="type") if node_type == "drug"}
+        self.assertEqual(drugs, {node for node, node_type in expected.nodes(data="type") if node_type == "drug"})
+        for drug in drugs:
+            for attr in ["risk_score"] + [f"risk_{model}" for model in RISK_MODELS]:
+                with self.subTest(drug=drug, attr=attr):
+                    self.assertAlmostEqual(graph.nodes[drug][attr], expected.nodes[drug][attr])
+
+    def test_side_effect_profiles_match_sets(self):
+        # Test packed bitset unions, overlaps and counts against Python sets, across several words
+        from src.bitsets import SideEffectProfiles, popcount
+        rng = np.random.default_rng(0)
+        side_effects = [f"SideEffect{j}" for j in range(150)]
+        lookup = {f"Drug{i}": list(rng.choice(side_effects, size=rng.integers(0, 80), replace=False))
+                  for i in range(30)}
+        lookup["Drug0"] = side_effects  # every bit, including the last partial word
+        profiles = SideEffectProfiles.from_lookup(lookup)
+        self.assertEqual(profiles.bits.shape, (30, 3))
+        for drug, effects in lookup.items():
+            self.assertEqual(profiles.count(profiles.rows([drug])[0]), len(set(effects)))
+        for _ in range(50):
+            regimen = list(rng.choice(list(lookup) + ["Unknown"], size=rng.integers(1, 5), replace=False))
+            sets = [set(lookup.get(drug, [])) for drug in regimen]
+            metrics = profiles.regimen_metrics(regimen)
+            with self.subTest(regimen=regimen):
+                self.assertEqual(set(profiles.names(metrics["union"])), set.union(*sets))
+                self.assertEqual(set(profiles.names(metrics["overlap"])), set.intersection(*sets))
+                self.assertEqual(metrics["union_count"], len(set.union(*sets)))
+                self.assertEqual(metrics["overlap_count"], len(set.intersection(*sets)))
+        np.testing.assert_array_equal(popcount(profiles.bits), [len(set(lookup[d])) for d in profiles.drug_names])
+
+    def test_static_layout_deterministic(self):
+        # Test that a fixed seed gives the same positions, whatever the repulsion block size
+        from unittest import mock
+        from src import graph_layout
+        from src.graph_layout import force_layout, node_positions
+        graph = nx.DiGraph()
+        for i in range(400):  # more nodes than the repulsion sample
+            graph.add_node(f"Drug{i}", type="drug")
+            graph.add_edge(f"Drug{i}", f"SideEffect{i % 37}")
+        positions = node_positions(graph, seed=3)
+        self.assertEqual(node_positions(graph, seed=3), positions)
+        self.assertNotEqual(node_positions(graph, seed=4), positions)
+        self.assertEqual(set(positions), set(graph.nodes))
+        self.assertTrue(np.isfinite(list(positions.values())).all())
+
+        nodes, src, dst = graph_layout.graph_edge_arrays(graph)
+        expected = force_layout(len(nodes), src, dst, seed=3)
+        with mock.patch.object(graph_layout, "LAYOUT_BLOCK_SIZE", 64):
+            np.testing.assert_allclose(force_layout(len(nodes), src, dst, seed=3), expected)
+
+    def test_streamed_html_matches_pyvis(self):
+        # Test that the streamed pages hold the same node and edge JSON as the PyVis page
+        import json
+        import os
+        import tempfile
+        from src.graph_builder import build_graph_from_columns, drug_node_attrs, side_effect_node_attrs
+        from src.visualize_graph import stream_edge_arrays_html, stream_graph_html, visualize_complete_graph
+
+        def vis_data(path):
+            with open(path, encoding="utf-8") as f:
+                lines = f.read().splitlines()
+            return [json.loads(line[line.index("DataSet(") + len("DataSet("):line.rindex(");")])
+                    for name in ("nodes", "edges") for line in lines if f"{name} = new vis.DataSet(" in line]
+
+        drugs = ["Aspirin", "Aspirin", "Warfarin", "Warfarin", "Aspirin", "Heparin"]
+        side_effects = ["Nausea", "Headache", "Bleeding", "Nausea", "Nausea", "Bleeding"]
+        graph = build_graph_from_columns(drugs, side_effects, [{} for _ in drugs],
+                                         drug_node_attrs, side_effect_node_attrs)
+        with tempfile.TemporaryDirectory() as tmp:
+            pyvis_path, stream_path = os.path.join(tmp, "pyvis.html"), os.path.join(tmp, "stream.html")
+            for static_layout in (True, False):
+                with self.subTest(static_layout=static_layout):
+                    visualize_complete_graph(graph, pyvis_path, static_layout=static_layout)
+                    stream_graph_html(graph, stream_path, static_layout=static_layout)
+                    expected = vis_data(pyvis_path)
+                    self.assertEqual([len(items) for items in expected], [6, 5])
+                    self.assertEqual(vis_data(stream_path), expected)
+            # The duplicate Aspirin -> Nausea row is drawn once, as in the graph; edges come sorted by node
+            stream_edge_arrays_html(drugs, side_effects, stream_path)
+            nodes, edges = vis_data(stream_path)
+            self.assertEqual(nodes, expected[0])
+            by_endpoints = lambda edge: (edge["from"], edge["to"])
+            self.assertEqual(sorted(edges, key=by_endpoints), sorted(expected[1], key=by_endpoints))
+
+    def test_graph_snapshot_round_trip(self):
+        # Test that a reloaded snapshot rebuilds the graph in the same order
+        import tempfile
+        from src.graph_builder import (build_graph_from_columns, drug_node_attrs, load_graph_snapshot,
+                                       save_graph_snapshot, side_effect_node_attrs)
+        edge_attrs = [
+            {"relation": "causes", "frequency": 0.25, "freq_min": 0.1, "freq_max": 0.4, "freq_count": 2},
+            {"relation": "causes"},
+            {"relation": "causes", "frequency": 0.5},
+            {"relation": "causes", "frequency": 0.05},
+        ]
+        graph = build_graph_from_columns(["Warfarin", "Aspirin", "Warfarin", "Bleeding"],
+                                         ["Bleeding", "Nausea", "Aspirin", "Anemia"],
+                                         edge_attrs, drug_node_attrs, side_effect_node_attrs)
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            save_graph_snapshot(graph, snapshot_dir, fingerprint="test")
+            snapshot = load_graph_snapshot(snapshot_dir, fingerprint="test", mmap=False)
+        rebuilt = snapshot.to_networkx()
+        self.assertEqual(list(rebuilt.nodes(data=True)), list(graph.nodes(data=True)))
+        self.assertEqual(list(rebuilt.edges(data=True)), list(graph.edges(data=True)))
+        self.assertEqual(list(snapshot.edges()), list(graph.edges()))
+        self.assertEqual(snapshot.number_of_nodes(), graph.number_of_nodes())
+        first = snapshot.to_networkx(max_nodes=3)
+        self.assertEqual(list(first.nodes), ["Warfarin", "Bleeding", "Aspirin"])
+        self.assertEqual(sorted(first.edges), sorted(graph.subgraph(list(graph.nodes)[:3]).edges))
+
+    def test_graph_snapshot_replaced_atomically(self):
+        # Test that re-saving leaves mapped readers and failed saves with an intact snapshot
+        import os
+        import tempfile
+        from unittest import mock
+        from src.graph_builder import load_graph_snapshot, save_graph_snapshot
+        from src.sparse_graph import SparseSideEffectGraph
+        old_graph = SparseSideEffectGraph.from_edge_table(edge_table_fixture(), dtype=np.float64)
+        new_table = edge_table_fixture().assign(freq_pct=lambda df: df["freq_pct"] * 2)
+        new_graph = SparseSideEffectGraph.from_edge_table(new_table.head(6), dtype=np.float64)
+        with tempfile.TemporaryDirectory() as tmp:
+            snapshot_dir = os.path.join(tmp, "graph_snapshot")
+            save_graph_snapshot(old_graph, snapshot_dir, fingerprint="v1")
+            mapped = load_graph_snapshot(snapshot_dir, fingerprint="v1")
+            self.assertIsNone(load_graph_snapshot(snapshot_dir, fingerprint=None))
+
+            save_graph_snapshot(new_graph, snapshot_dir, fingerprint="v2")
+            # The mapped arrays still hold the old snapshot
+            np.testing.assert_array_equal(mapped.matrix.data, old_graph.matrix.data)
+            np.testing.assert_array_equal(mapped.matrix.indices, old_graph.matrix.indices)
+            reloaded = load_graph_snapshot(snapshot_dir, fingerprint="v2")
+            np.testing.assert_array_equal(reloaded.matrix.data, new_graph.matrix.data)
+
+            saves = []
+            real_save = np.save
+
+            def failing_save(path, values):
+                # The first array is written, the second save fails
+                if saves:
+                    raise OSError("disk full")
+                saves.append(path)
+                real_save(path, values)
+
+            with mock.patch("src.graph_builder.np.save", failing_save):
+                with self.assertRaises(OSError):
+                    save_graph_snapshot(old_graph, snapshot_dir, fingerprint="v3")
+            self.assertIsNone(load_graph_snapshot(snapshot_dir, fingerprint="v3"))
+            intact = load_graph_snapshot(snapshot_dir, fingerprint="v2", mmap=False)
+            np.testing.assert_array_equal(intact.matrix.data, new_graph.matrix.data)
+            self.assertEqual(os.listdir(tmp), ["graph_snapshot"])
+
+    def test_render_drug_pages_manifest(self):
+        # Test that unchanged pages are skipped and stale pages are pruned
+        import os
+        import tempfile
+        from src.drug_pages import drug_page_name, load_manifest, render_drug_pages
+        lookup = {"Aspirin": ["Nausea", "Headache"], "Warfarin": ["Bleeding"], "Ibuprofen": ["Nausea"]}
+        with tempfile.TemporaryDirectory() as output_dir:
+            first = render_drug_pages(lookup, output_dir, workers=1)
+            self.assertEqual((first["rendered"], first["skipped"]), (3, 0))
+
+            lookup["Aspirin"] = ["Nausea"]
+            second = render_drug_pages(lookup, output_dir, workers=1)
+            self.assertEqual((second["rendered"], second["skipped"]), (1, 2))
+
+            del lookup["Warfarin"]
+            render_drug_pages(lookup, output_dir, drugs=["Aspirin"], workers=1)
+            self.assertIn("Warfarin", load_manifest(output_dir))
+            third = render_drug_pages(lookup, output_dir, workers=1)
+            self.assertEqual((third["rendered"], third["skipped"], third["removed"]), (0, 2, 1))
+            self.assertEqual(set(load_manifest(output_dir)), {"Aspirin", "Ibuprofen"})
+            self.assertFalse(os.path.exists(os.path.join(output_dir, drug_page_name("Warfarin"))))
+            self.assertFalse(os.path.exists(os.path.join(output_dir, "data", drug_page_name("Warfarin")[:-5] + ".js")))
+
+    def test_visualize_complete_graph_clustered(self):
+        # Test that a clustered page draws one node per cluster and each cluster file holds its members
+        import json
+        import os
+        import tempfile
+        from src.graph_builder import build_graph_from_columns, drug_node_attrs, side_effect_node_attrs
+        from src.visualize_graph import visualize_complete_graph
+        drugs = ["Aspirin", "Aspirin", "Ibuprofen", "Ibuprofen", "Warfarin", "Warfarin", "Heparin", "Aspirin"]
+        side_effects = ["Nausea", "Headache", "Nausea", "Headache", "</script>Bleeding", "Anemia", "Anemia",
+                        "</script>Bleeding"]
+        graph = build_graph_from_columns(drugs, side_effects, [{"frequency": 0.1}] * len(drugs),
+                                         drug_node_attrs, side_effect_node_attrs)
+        with tempfile.TemporaryDirectory() as output_dir:
+            output_path = os.path.join(output_dir, "complete_graph.html")
+            visualize_complete_graph(graph, output_path, clustered=True, max_cluster_size=4)
+            with open(output_path, encoding="utf-8") as f:
+                page = f.read()
+            self.assertEqual(page.count("</script>"), 2)  # only the page's own script tags
+            line = next(line for line in page.splitlines() if line.startswith("const GRAPH = "))
+            index = json.loads(line[len("const GRAPH = "):-1])
+            self.assertTrue(os.path.exists(os.path.join(output_dir, "assets", "vis-9.1.2", "vis-network.min.js")))
+
+            membership, edges = {}, set()
+            for node in index["nodes"]:
+                path = os.path.join(output_dir, index["clusterDir"], f"c{node['cluster']}.js")
+                with open(path, encoding="utf-8") as f:
+                    payload = json.loads(f.read()[len("sideEffectNetCluster("):-len(");\n")])
+                self.assertLessEqual(len(payload["nodes"]), 4)
+                membership.update((member["id"], node["cluster"]) for member in payload["nodes"])
+                edges.update((edge["from"], edge["to"]) for edge in payload["edges"] + payload["cross"])
+        self.assertEqual(sorted(membership), sorted(graph.nodes))
+        self.assertEqual(edges, set(graph.edges))
+        between = sum(1 for u, v in graph.edges if membership[u] != membership[v])
+        self.assertGreater(between, 0)
+        self.assertEqual(sum(edge["value"] for edge in index["edges"]), between)
+
+    def test_publish_assets_restores_changed_files(self):
+        # Test that an asset edited in place is copied again, even at the same size
+        import os
+        import tempfile
+        from src.visualize_graph import publish_assets
+        with tempfile.TemporaryDirectory() as output_dir:
+            asset_dir = publish_assets(output_dir)
+            loader = os.path.join(asset_dir, "graph_page.js")
+            with open(loader, "rb") as f:
+                content = f.read()
+            with open(loader, "wb") as f:
+                f.write(b"x" * len(content))
+            publish_assets(output_dir)
+            with open(loader, "rb") as f:
+                self.assertEqual(f.read(), content)
+
+def hypothesis_fixture_graph():
+    """
+    Small drug -> side effect graph with distinct edge frequencies.
+    """
+    graph = nx.DiGraph()
+    profiles = {
+        "Aspirin": ["Nausea", "Headache", "Rash"],
+        "Ibuprofen": ["Nausea", "Headache", "Dizziness"],
+        "Warfarin": ["Bleeding", "Dizziness"],
+        "Paracetamol": ["Rash"],
+        "Amoxicillin": ["Diarrhea"],
+        "Naproxen": ["Nausea", "Headache", "Rash", "Dizziness"],
+    }
+    for i, (drug, side_effects) in enumerate(profiles.items()):
+        graph.add_node(drug, type="drug")
+        for j, side_effect in enumerate(side_effects):
+            graph.add_edge(drug, side_effect, frequency=round(0.01 * (7 * i + j + 1), 2))
+    return graph
+
+class TestRiskHypotheses(unittest.TestCase):
+    def setUp(self):
+        self.graph = hypothesis_fixture_graph()
+        # Includes a drug that is not in the graph
+        self.drugs = ["Aspirin", "Ibuprofen", "Warfarin", "Unknown", "Paracetamol", "Amoxicillin", "Naproxen"]
+
+    @staticmethod
+    def summary(hypotheses):
+        return [(h["drug_pair"], h["overlap_count"], h["top_shared_effects"]) for h in hypotheses]
+
+    def test_bulk_matches_pairwise(self):
+        # Test bulk mode against pair-by-pair counting, at every threshold
+        from src.utils import generate_risk_hypotheses
+        for min_overlap in (-1, 0, 1, 2, 3, 5):
+            for top_k in (None, 0, 1, 4, 100):
+                with self.subTest(min_overlap=min_overlap, top_k=top_k):
+                    pairwise = generate_risk_hypotheses(self.graph, self.drugs, min_overlap, top_k=top_k)
+                    bulk = generate_risk_hypotheses(self.graph, self.drugs, min_overlap, bulk=True, top_k=top_k)
+                    self.assertEqual(self.summary(bulk), self.summary(pairwise))
+        everything = generate_risk_hypotheses(self.graph, self.drugs, 0, bulk=True)
+        self.assertEqual(len(everything), len(self.drugs) * (len(self.drugs) - 1) // 2)
+
+    def test_parallel_matches_pairwise(self):
+        # Test the process-pool mode against pair-by-pair counting
+        from src.utils import _parallel_risk_hypotheses, generate_risk_hypotheses, shard_bounds
+        for min_overlap in (0, 1, 2, 3):
+            for top_k in (None, 1, 4):
+                with self.subTest(min_overlap=min_overlap, top_k=top_k):
+                    pairwise = generate_risk_hypotheses(self.graph, self.drugs, min_overlap, top_k=top_k)
+                    parallel = _parallel_risk_hypotheses(self.graph, self.drugs, min_overlap, top_k,
+                                                         workers=2, shards=5)
+                    self.assertEqual(self.summary(parallel), self.summary(pairwise))
+        self.assertEqual(self.summary(generate_risk_hypotheses(self.graph, self.drugs, 2, workers=2)),
+                         self.summary(generate_risk_hypotheses(self.graph, self.drugs, 2)))
+        bounds = shard_bounds(len(self.drugs), 3)
+        self.assertEqual((bounds[0], bounds[-1]), (0, len(self.drugs)))
+        self.assertEqual(bounds, sorted(set(bounds)))
+
+    def minhash_index(self, **kwargs):
+        from src.minhash_index import MinHashLSHIndex
+        lookup = {drug: [se for _, se in self.graph.out_edges(drug)]
+                  for drug, node_type in self.graph.nodes(data="type") if node_type == "drug"}
+        return MinHashLSHIndex.from_lookup(lookup, **kwargs)
+
+    def test_minhash_pairs_match_pairwise(self):
+        # Test LSH pruning: with one row per band every overlapping pair is a candidate
+        from src.utils import generate_risk_hypotheses
+        index = self.minhash_index(num_perm=128, bands=128)
+        for min_overlap in (0, 1, 2, 3):
+            with self.subTest(min_overlap=min_overlap):
+                pairwise = generate_risk_hypotheses(self.graph, self.drugs, min_overlap)
+                pruned = generate_risk_hypotheses(self.graph, self.drugs, min_overlap, minhash_index=index)
+                self.assertEqual(self.summary(pruned), self.summary(pairwise))
+        # Fewer bands only ever drop pairs
+        coarse = generate_risk_hypotheses(self.graph, self.drugs, 1, minhash_index=self.minhash_index(bands=2))
+        pairwise = self.summary(generate_risk_hypotheses(self.graph, self.drugs, 1))
+        self.assertTrue(all(hypothesis in pairwise for hypothesis in self.summary(coarse)))
+
+    def test_safer_alternatives_from_minhash(self):
+        # Test that LSH candidates give the same alternatives as the inverted index
+        from src.side_effect_index import SideEffectIndex
+        from src.sparse_graph import SparseSideEffectGraph
+        from src.utils import find_safer_alternatives
+        index = SideEffectIndex.from_graph(SparseSideEffectGraph.from_networkx(self.graph))
+        minhash_index = self.minhash_index(num_perm=128, bands=128)
+        risk_map = {"Aspirin": 0.5, "Ibuprofen": 0.2, "Warfarin": 0.1, "Paracetamol": 0.4, "Naproxen": 0.9}
+        side_effects = ["Nausea", "Headache", "Rash"]
+        expected = find_safer_alternatives(index, "Aspirin", side_effects, risk_map)
+        found = find_safer_alternatives(None, "Aspirin", side_effects, risk_map, minhash_index=minhash_index)
+        key = lambda suggestion: suggestion["drug"]
+        self.assertEqual(sorted(found, key=key), sorted(expected, key=key))
+        self.assertEqual([s["drug"] for s in found], ["Ibuprofen", "Paracetamol"])
+        limited = find_safer_alternatives(None, "Aspirin", side_effects, risk_map, minhash_index=minhash_index,
+                                          max_candidates=1)
+        self.assertEqual([s["drug"] for s in limited], [])
+
+class TestCombinationMiner(unittest.TestCase):
+    def test_mine_matches_brute_force(self):
+        # Test mined combinations against checking every combination
+        from itertools import combinations
+        from src.combination_miner import CombinationMiner
+        rng = np.random.default_rng(0)
+        lookup = {f"Drug{i}": [f"SE{j}" for j in range(40) if rng.random() < 0.5] for i in range(9)}
+        lookup["Drug9"] = []
+        miner = CombinationMiner.from_lookup(lookup)
+        for min_shared in (1, 4, 6, 8):
+            for max_size in (3, 4, 5):
+                expected = set()
+                for size in range(3, max_size + 1):
+                    for drugs in combinations(lookup, size):
+                        shared = set.intersection(*(set(lookup[d]) for d in drugs))
+                        if len(shared) >= min_shared:
+                            expected.add((drugs, len(shared), tuple(sorted(shared))))
+                with self.subTest(min_shared=min_shared, max_size=max_size):
+                    mined = [(c["drugs"], c["overlap_count"], tuple(sorted(c["shared_effects"])))
+                             for c in miner.mine(min_shared, max_size=max_size)]
+                    self.assertEqual(len(mined), len(set(mined)))
+                    self.assertEqual(set(mined), expected)
+                    self.assertFalse(miner.truncated)
+        first = list(miner.mine(5, max_results=3))
+        self.assertEqual(len(first), 3)
+        self.assertTrue(miner.truncated)
+
+def edge_table_fixture():
+    """
+    Small clean edge table, with an unknown frequency and a repeated edge.
+    """
+    return pd.DataFrame({
+        "drug_name": ["Aspirin", "Aspirin", "Aspirin", "Ibuprofen", "Ibuprofen", "Warfarin", "Warfarin", "Naproxen",
+                      "Naproxen", "Aspirin"],
+        "side_effect": ["Nausea", "Headache", "Rash", "Nausea", "Headache", "Bleeding", "Nausea", "Nausea",
+                        "Rash", "Nausea"],
+        "freq_pct": [0.2, 0.1, np.nan, 0.4, np.nan, 0.3, 0.05, 0.1, 0.25, 0.3],
+    })
+
+class CacheTests:
+    """
+    Tests shared by the caches built from a clean table. Subclasses set
+    cache_name and implement build_cache(fingerprint), load_cache(fingerprint),
+    load_or_build_cache(**kwargs), assert_same_cache(loaded, built) and
+    assert_has_heparin(cache).
+    """
+    cache_name = None
+
+    def setUp(self):
+        import os
+        import tempfile
+        self.tmp = tempfile.TemporaryDirectory()
+        self.csv_path = os.path.join(self.tmp.name, "side_effects_clean.csv")
+        self.cache_path = os.path.join(self.tmp.name, "cache", self.cache_name)
+        edge_table_fixture().to_csv(self.csv_path, index=False)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_save_load_round_trip(self):
+        # Test that a saved cache loads back unchanged, and only for its fingerprint
+        import os
+        built = self.build_cache("v1")
+        built.save(self.cache_path)
+        loaded = self.load_cache("v1")
+        self.assertEqual(loaded.fingerprint, "v1")
+        self.assert_same_cache(loaded, built)
+        self.assertIsNone(self.load_cache("v2"))
+        # Data that could not be fingerprinted never matches
+        self.assertIsNone(self.load_cache(None))
+        os.remove(self.cache_path)
+        self.assertIsNone(self.load_cache("v1"))
+
+    def test_load_or_build_follows_the_data(self):
+        # Test that the saved cache is reused until the clean table changes
+        import os
+        first = self.load_or_build_cache()
+        saved = os.stat(self.cache_path).st_mtime_ns
+        again = self.load_or_build_cache()
+        self.assertEqual(os.stat(self.cache_path).st_mtime_ns, saved)
+        self.assertEqual(again.fingerprint, first.fingerprint)
+
+        with open(self.csv_path, "a") as f:
+            f.write("Heparin,Bleeding,0.5\n")
+        rebuilt = self.load_or_build_cache()
+        self.assertNotEqual(rebuilt.fingerprint, first.fingerprint)
+        self.assert_has_heparin(rebuilt)
+
+    def test_load_or_build_follows_parquet_only_data(self):
+        # Test that a Parquet copy without its CSV is fingerprinted, so changes to it rebuild the cache
+        import os
+        from src.data_store import columnar_path
+        edge_table_fixture().to_parquet(columnar_path(self.csv_path), index=False)
+        os.remove(self.csv_path)
+        first = self.load_or_build_cache()
+        self.assertIsNotNone(first.fingerprint)
+        self.assertEqual(self.load_or_build_cache().fingerprint, first.fingerprint)
+
+        heparin = pd.DataFrame({"drug_name": ["Heparin"], "side_effect": ["Bleeding"], "freq_pct": [0.5]})
+        pd.concat([edge_table_fixture(), heparin]).to_parquet(columnar_path(self.csv_path), index=False)
+        rebuilt = self.load_or_build_cache()
+        self.assertNotEqual(rebuilt.fingerprint, first.fingerprint)
+        self.assert_has_heparin(rebuilt)
+
+class TestSideEffectIndex(CacheTests, unittest.TestCase):
+    cache_name = "side_effect_index.npz"
+
+    def build_cache(self, fingerprint):
+        from src.side_effect_index import SideEffectIndex
+        return SideEffectIndex.from_edges(edge_table_fixture(), fingerprint=fingerprint)
+
+    def load_cache(self, fingerprint):
+        from src.side_effect_index import SideEffectIndex
+        return SideEffectIndex.load(self.cache_path, fingerprint=fingerprint)
+
+    def load_or_build_cache(self, **kwargs):
+        from src.side_effect_index import load_or_build_index
+        return load_or_build_index(self.csv_path, self.cache_path, **kwargs)
+
+    def assert_same_cache(self, loaded, built):
+        for name in ("indptr", "drug_ids", "freqs"):
+            np.testing.assert_array_equal(getattr(loaded, name), getattr(built, name))
+        self.assertEqual(loaded.drug_names, built.drug_names)
+        self.assertEqual(loaded.side_effect_names, built.side_effect_names)
+        self.assertEqual(loaded.shared_effect_counts(["Nausea", "Rash"]),
+                         built.shared_effect_counts(["Nausea", "Rash"]))
+
+    def assert_has_heparin(self, index):
+        self.assertEqual(index.drugs_for("Bleeding", top_k=1), [("Heparin", 0.5)])
+
+    def test_drugs_ranked_by_frequency(self):
+        # Test that postings are ranked by frequency, unknown frequencies last
+        index = self.build_cache(None)
+        self.assertEqual(index.drugs_for("Nausea"),
+                         [("Ibuprofen", 0.4), ("Aspirin", 0.3), ("Naproxen", 0.1), ("Warfarin", 0.05)])
+        self.assertEqual(index.drugs_for("Headache"), [("Aspirin", 0.1), ("Ibuprofen", None)])
+        self.assertEqual(index.drugs_for("Nausea", min_freq=0.3), [("Ibuprofen", 0.4), ("Aspirin", 0.3)])
+
+class TestSimilarityStore(CacheTests, unittest.TestCase):
+    cache_name = "similarity_store.npz"
+
+    def build_cache(self, fingerprint):
+        from src.similarity_store import SimilarityStore
+        from src.sparse_graph import SparseSideEffectGraph
+        graph = SparseSideEffectGraph.from_edge_table(edge_table_fixture(), dtype=np.float64)
+        return SimilarityStore.from_graph(graph, top_k=1, fingerprint=fingerprint)
+
+    def load_cache(self, fingerprint):
+        from src.similarity_store import SimilarityStore
+        return SimilarityStore.load(self.cache_path, fingerprint=fingerprint)
+
+    def load_or_build_cache(self, **kwargs):
+        from src.similarity_store import load_or_build_similarity_store
+        return load_or_build_similarity_store(self.csv_path, self.cache_path, **kwargs)
+
+    def assert_same_cache(self, loaded, built):
+        from src.similarity_store import METRICS
+        self.assertEqual(loaded.drug_names, built.drug_names)
+        self.assertEqual(loaded.top_k, built.top_k)
+        self.assertEqual((loaded.profiles != built.profiles).nnz, 0)
+        for metric in METRICS:
+            self.assertEqual((loaded.neighbors[metric] != built.neighbors[metric]).nnz, 0)
+            for drug in built.drug_names:
+                self.assertEqual(loaded.most_similar(drug, metric), built.most_similar(drug, metric))
+        self.assertEqual(loaded.similarities("Naproxen", "Warfarin"), built.similarities("Naproxen", "Warfarin"))
+
+    def assert_has_heparin(self, store):
+        self.assertEqual(store.most_similar("Heparin", top_k=1), [("Warfarin", 0.5)])
+
+    def test_similarities(self):
+        # Test stored and computed Jaccard similarities
+        store = self.build_cache(None)
+        # Aspirin {Nausea, Headache, Rash} and Ibuprofen {Nausea, Headache}
+        self.assertAlmostEqual(store.similarity("Aspirin", "Ibuprofen"), 2 / 3)
+        # Not among the single stored neighbour: computed from the profiles
+        self.assertAlmostEqual(store.similarity("Ibuprofen", "Warfarin"), 1 / 3)
+
+    def test_load_or_build_follows_top_k(self):
+        # Test that the saved store is reused for fewer neighbours and rebuilt for more
+        import os
+        first = self.load_or_build_cache(top_k=2)
+        saved = os.stat(self.cache_path).st_mtime_ns
+        fewer = self.load_or_build_cache(top_k=1)
+        self.assertEqual(os.stat(self.cache_path).st_mtime_ns, saved)
+        self.assertEqual((fewer.fingerprint, fewer.top_k), (first.fingerprint, 2))
+        self.assertEqual(self.load_or_build_cache(top_k=3).top_k, 3)
+
+    def test_pair_similarities(self):
+        # Test that one pair computed on its own matches the full store
+        from src.similarity_store import SimilarityStore, pair_similarities
+        from src.sparse_graph import SparseSideEffectGraph
+        edges = edge_table_fixture()
+        store = SimilarityStore.from_graph(SparseSideEffectGraph.from_edge_table(edges, dtype=np.float64), top_k=1)
+        drugs = store.drug_names + ["Unknown"]
+        for drug_a in drugs:
+            for drug_b in drugs:
+                with self.subTest(drug_a=drug_a, drug_b=drug_b):
+                    self.assertEqual(pair_similarities(edges, drug_a, drug_b), store.similarities(drug_a, drug_b))
+
+class TestMinHashLSHIndex(CacheTests, unittest.TestCase):
+    cache_name = "minhash_index.npz"
+
+    def build_cache(self, fingerprint, **kwargs):
+        from src.minhash_index import MinHashLSHIndex
+        from src.sparse_graph import SparseSideEffectGraph
+        graph = SparseSideEffectGraph.from_edge_table(edge_table_fixture())
+        return MinHashLSHIndex.from_graph(graph, fingerprint=fingerprint, **kwargs)
+
+    def load_cache(self, fingerprint):
+        from src.minhash_index import MinHashLSHIndex
+        return MinHashLSHIndex.load(self.cache_path, fingerprint=fingerprint)
+
+    def load_or_build_cache(self, **kwargs):
+        from src.minhash_index import load_or_build_minhash_index
+        return load_or_build_minhash_index(self.csv_path, self.cache_path, **kwargs)
+
+    def assert_same_cache(self, loaded, built):
+        for name in ("signatures", "band_keys", "band_order", "hash_a", "hash_b"):
+            np.testing.assert_array_equal(getattr(loaded, name), getattr(built, name))
+        self.assertEqual((loaded.bands, loaded.seed), (built.bands, built.seed))
+        self.assertEqual((loaded.sets != built.sets).nnz, 0)
+        self.assertEqual(loaded.query("Aspirin", exact=True), built.query("Aspirin", exact=True))
+
+    def assert_has_heparin(self, index):
+        self.assertEqual(index.query("Heparin", exact=True, top_k=1), [("Warfarin", 0.5)])
+
+    def test_load_or_build_follows_the_parameters(self):
+        # Test that the saved index is reused only for the num_perm, bands and seed it was built with
+        first = self.load_or_build_cache(num_perm=16, bands=4, seed=1)
+        again = self.load_or_build_cache(num_perm=16, bands=4, seed=1)
+        np.testing.assert_array_equal(again.hash_a, first.hash_a)
+        for kwargs in ({"num_perm": 16, "bands": 4, "seed": 2}, {"num_perm": 16, "bands": 8, "seed": 1},
+                       {"num_perm": 32, "bands": 4, "seed": 1}, {}):
+            with self.subTest(**kwargs):
+                rebuilt = self.load_or_build_cache(**kwargs)
+                expected = self.build_cache(None, **kwargs)
+                self.assertEqual((rebuilt.num_perm, rebuilt.bands, rebuilt.seed),
+                                 (expected.num_perm, expected.bands, expected.seed))
+                np.testing.assert_array_equal(rebuilt.signatures, expected.signatures)
+
+    def test_identical_profile_is_found(self):
+        # Test that a drug with the same side effects shares every bucket and estimates to 1.0
+        from src.minhash_index import MinHashLSHIndex
+        lookup = {"Aspirin": ["Nausea", "Headache", "Rash"], "Generic Aspirin": ["Rash", "Nausea", "Headache"],
+                  "Warfarin": ["Bleeding"]}
+        index = MinHashLSHIndex.from_lookup(lookup, num_perm=32, bands=8)
+        aspirin = index.signatures[index.drug_index["Aspirin"]]
+        self.assertIn(index.drug_index["Generic Aspirin"], index.candidates(aspirin).tolist())
+        self.assertNotIn(index.drug_index["Warfarin"], index.candidates(aspirin, bands=1).tolist())
+        self.assertEqual(index.query("Aspirin"), [("Generic Aspirin", 1.0)])
+        self.assertEqual(index.query(side_effects=["Headache", "Nausea", "Rash"], exact=True),
+                         [("Aspirin", 1.0), ("Generic Aspirin", 1.0)])
+
+    def test_exact_query_matches_brute_force(self):
+        # Test that exact mode returns the true Jaccard similarity of every candidate
+        from src.minhash_index import MinHashLSHIndex
+        rng = np.random.default_rng(0)
+        lookup = {f"Drug{i}": [f"SE{j}" for j in rng.choice(30, size=rng.integers(1, 12), replace=False)]
+                  for i in range(40)}
+        # Two rows per band: drugs with Jaccard >= 0.5 are near-certain candidates
+        index = MinHashLSHIndex.from_lookup(lookup, num_perm=128, bands=64)
+        for drug, side_effects in lookup.items():
+            with self.subTest(drug=drug):
+                expected = {other: len(set(side_effects) & set(others)) / len(set(side_effects) | set(others))
+                            for other, others in lookup.items() if other != drug}
+                result = index.query(drug, top_k=len(lookup), exact=True)
+                for other, similarity in result:
+                    self.assertAlmostEqual(similarity, expected[other])
+                found = dict(result)
+                self.assertTrue(all(other in found for other, sim in expected.items() if sim >= 0.5))
+                probe = index.query(side_effects=side_effects, top_k=len(lookup), exact=True)
+                self.assertEqual([(other, sim) for other, sim in probe if other != drug], result)
+
+def write_raw_fixture(raw_dir):
+    """
+    Write small SIDER raw tables: two drugs, PT and LLT side effect rows, and
+    frequencies listed at both MedDRA levels.
+    """
+    import os
+    se_rows = [
+        ("CID1", "CID01", "C1", "LLT", "C1", "Nausea"),
+        ("CID1", "CID01", "C1", "PT", "C1", "Nausea"),
+        ("CID1", "CID01", "C2", "LLT", "C2", "Sick headache"),
+        ("CID1", "CID01", "C2", "PT", "C3", "Headache"),
+        ("CID2", "CID02", "C4", "PT", "C4", "Bleeding"),
+        ("CID2", "CID02", "C1", "PT", "C1", "Nausea"),
+    ]
+    freq_rows = [
+        ("CID1", "CID01", "C1", "", "10%", 0.1, 0.1, "LLT", "C1", "Nausea"),
+        ("CID1", "CID01", "C1", "", "10%", 0.1, 0.1, "PT", "C1", "Nausea"),
+        ("CID1", "CID01", "C1", "", "30%", 0.3, 0.3, "LLT", "C1", "Nausea"),
+        ("CID1", "CID01", "C1", "", "30%", 0.3, 0.3, "PT", "C1", "Nausea"),
+        ("CID2", "CID02", "C4", "", "5%", 0.05, 0.05, "LLT", "C4", "Bleeding"),
+    ]
+    tables = {
+        "meddra_all_se.tsv": se_rows,
+        "meddra_freq.tsv": freq_rows,
+        "drug_names.tsv": [("CID1", "Aspirin"), ("CID2", "Warfarin")],
+    }
+    for name, rows in tables.items():
+        with open(os.path.join(raw_dir, name), "w") as f:
+            f.writelines("\t".join(map(str, row)) + "\n" for row in rows)
+
+class TestETL(unittest.TestCase):
+    def setUp(self):
+        import os
+        import tempfile
+        self.tmp = tempfile.TemporaryDirectory()
+        self.raw_dir = os.path.join(self.tmp.name, "raw")
+        self.output_csv = os.path.join(self.tmp.name, "processed", "side_effects_clean.csv")
+        os.makedirs(self.raw_dir)
+        os.makedirs(os.path.dirname(self.output_csv))
+        write_raw_fixture(self.raw_dir)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_frequency_levels_counted_once(self):
+        # Test that a frequency listed as LLT and PT is aggregated once
+        from src.data_processing import process
+        process(self.raw_dir, self.output_csv)
+        df = pd.read_csv(self.output_csv).set_index(["drug_name", "side_effect"])
+        self.assertEqual(df.loc[("Aspirin", "Nausea"), "freq_count"], 2)
+        self.assertAlmostEqual(df.loc[("Aspirin", "Nausea"), "freq_pct"], 0.2)
+        # A frequency listed only as an LLT is kept
+        self.assertEqual(df.loc[("Warfarin", "Bleeding"), "freq_count"], 1)
+        self.assertTrue(pd.isna(df.loc[("Aspirin", "Headache"), "freq_pct"]))
+
+    def read_outputs(self, output_csv):
+        import os
+        from src.data_store import DRUG_VOCAB_NAME, EDGES_NAME, SE_VOCAB_NAME
+        processed_dir = os.path.dirname(output_csv)
+        with open(output_csv) as f:
+            clean = f.read()
+        vocabularies = [pd.read_csv(os.path.join(processed_dir, name)) for name in (DRUG_VOCAB_NAME, SE_VOCAB_NAME)]
+        edges = np.load(os.path.join(processed_dir, EDGES_NAME))
+        return clean, vocabularies, {name: edges[name] for name in edges.files}
+
+    def assert_same_outputs(self, output_csv, expected_csv, same_ids=True):
+        # Without same_ids, the interned edges are compared by name
+        clean, vocabularies, edges = self.read_outputs(output_csv)
+        expected_clean, expected_vocabularies, expected_edges = self.read_outputs(expected_csv)
+        self.assertEqual(clean, expected_clean)
+        if not same_ids:
+            pd.testing.assert_frame_equal(self.named_edges(vocabularies, edges),
+                                          self.named_edges(expected_vocabularies, expected_edges))
+            return
+        for vocab, expected in zip(vocabularies, expected_vocabularies):
+            pd.testing.assert_frame_equal(vocab, expected)
+        self.assertEqual(set(edges), set(expected_edges))
+        for name, values in edges.items():
+            np.testing.assert_array_equal(values, expected_edges[name])
+
+    def named_edges(self, vocabularies, edges):
+        drug_vocab, se_vocab = vocabularies
+        named = pd.DataFrame({
+            "drug_name": drug_vocab.set_index("drug_id")["drug_name"].loc[edges["drug_id"]].to_numpy(),
+            "side_effect": se_vocab.set_index("se_id")["side_effect"].loc[edges["se_id"]].to_numpy(),
+            "freq": edges["freq"],
+        })
+        return named.sort_values(["drug_name", "side_effect"]).reset_index(drop=True)
+
+    def test_etl_modes_match_process(self):
+        # Test the streaming, parallel and incremental modes against process()
+        import os
+        from src.data_processing import MEDDRA_LEVELS, process, process_parallel, process_streaming, run_pipeline
+        for level in MEDDRA_LEVELS:
+            with self.subTest(meddra_level=level):
+                expected_csv = os.path.join(self.tmp.name, level, "expected", "clean.csv")
+                os.makedirs(os.path.dirname(expected_csv))
+                process(self.raw_dir, expected_csv, meddra_level=level)
+                runs = {
+                    "streaming": lambda out: process_streaming(self.raw_dir, out, chunksize=2, meddra_level=level),
+                    "parallel": lambda out: process_parallel(self.raw_dir, out, workers=2, partitions=3,
+                                                             meddra_level=level),
+                    "incremental": lambda out: run_pipeline(self.raw_dir, out, meddra_level=level),
+                }
+                for mode, run in runs.items():
+                    output_csv = os.path.join(self.tmp.name, level, mode, "clean.csv")
+                    os.makedirs(os.path.dirname(output_csv))
+                    run(output_csv)
+                    self.assert_same_outputs(output_csv, expected_csv)
+
+    def test_vocabulary_folds_edge_rows(self):
+        # Test that folding the collected edge rows as they grow keeps the last known frequency per pair
+        import os
+        from unittest import mock
+        from src import data_processing
+        chunks = [
+            pd.DataFrame({"stitch_id": ["CID1", "CID2"], "drug_name": ["Aspirin", "Warfarin"],
+                          "umls_id": ["C1", "C4"], "side_effect": ["Nausea", "Bleeding"], "freq_pct": [0.1, 0.05]}),
+            pd.DataFrame({"stitch_id": ["CID1", "CID1"], "drug_name": ["Aspirin", "Aspirin"],
+                          "umls_id": ["C1", "C3"], "side_effect": ["Nausea", "Headache"], "freq_pct": [0.3, np.nan]}),
+            pd.DataFrame({"stitch_id": ["CID1", "CID2"], "drug_name": ["Aspirin", "Warfarin"],
+                          "umls_id": ["C1", "C1"], "side_effect": ["Nausea", "Nausea"], "freq_pct": [np.nan, 0.2]}),
+        ]
+        edges = []
+        for compact_rows in (data_processing.EDGE_COMPACT_ROWS, 1):
+            out_dir = os.path.join(self.tmp.name, str(compact_rows))
+            os.makedirs(out_dir)
+            with mock.patch.object(data_processing, "EDGE_COMPACT_ROWS", compact_rows):
+                vocab = data_processing.VocabularyBuilder()
+                for chunk in chunks:
+                    vocab.add(chunk)
+                if compact_rows == 1:
+                    self.assertEqual(len(vocab.edge_parts), 1)
+                vocab.save(out_dir)
+            with np.load(os.path.join(out_dir, data_processing.EDGES_NAME)) as npz:
+                edges.append({name: npz[name] for name in npz.files})
+        for name, values in edges[0].items():
+            np.testing.assert_array_equal(edges[1][name], values)
+        np.testing.assert_allclose(edges[1]["freq"], [np.nan, 0.3, 0.05, 0.2], rtol=1e-6)
+
+    def test_incremental_manifest(self):
+        # Test that run_pipeline() skips, redoes the name join or rebuilds as the inputs require
+        import os
+        from src.data_processing import process, run_pipeline
+        self.assertEqual(run_pipeline(self.raw_dir, self.output_csv), "full")
+        self.assertEqual(run_pipeline(self.raw_dir, self.output_csv), "unchanged")
+        self.assertEqual(run_pipeline(self.raw_dir, self.output_csv, meddra_level="all"), "full")
+        self.assertEqual(run_pipeline(self.raw_dir, self.output_csv, meddra_level="all"), "unchanged")
+        self.assertEqual(run_pipeline(self.raw_dir, self.output_csv, meddra_level="all", force=True), "full")
+
+        expected_csv = os.path.join(self.tmp.name, "expected", "clean.csv")
+        os.makedirs(os.path.dirname(expected_csv))
+        with open(os.path.join(self.raw_dir, "drug_names.tsv"), "a") as f:
+            f.write("CID3\tHeparin\n")
+        with open(os.path.join(self.raw_dir, "drug_names.tsv")) as f:
+            names = f.read()
+        with open(os.path.join(self.raw_dir, "drug_names.tsv"), "w") as f:
+            f.write(names.replace("Warfarin", "Coumadin"))
+        self.assertEqual(run_pipeline(self.raw_dir, self.output_csv, meddra_level="all"), "names")
+        process(self.raw_dir, expected_csv, meddra_level="all")
+        # Ids differ: the output keeps Warfarin's id and appends the new names
+        self.assert_same_outputs(self.output_csv, expected_csv, same_ids=False)
+
+        with open(os.path.join(self.raw_dir, "meddra_all_se.tsv"), "a") as f:
+            f.write("CID2\tCID02\tC5\tPT\tC5\tRash\n")
+        self.assertEqual(run_pipeline(self.raw_dir, self.output_csv, meddra_level="all"), "full")
+        process(self.raw_dir, expected_csv, meddra_level="all")
+        self.assert_same_outputs(self.output_csv, expected_csv, same_ids=False)
+
+        # An output edited by hand is rewritten from the se/freq join cache
+        with open(self.output_csv, "a") as f:
+            f.write("tampered\n")
+        self.assertEqual(run_pipeline(self.raw_dir, self.output_csv, meddra_level="all"), "names")
+        self.assert_same_outputs(self.output_csv, expected_csv, same_ids=False)
+
+    def test_vocabulary_ids_stay_stable(self):
+        # Test that a rebuild keeps the ids of known names and appends new ones
+        import os
+        from src.data_processing import process
+        from src.data_store import load_vocabularies
+        process(self.raw_dir, self.output_csv)
+        drug_vocab, se_vocab = load_vocabularies(os.path.dirname(self.output_csv))
+        with open(os.path.join(self.raw_dir, "drug_names.tsv")) as f:
+            names = f.read()
+        with open(os.path.join(self.raw_dir, "drug_names.tsv"), "w") as f:
+            f.write(names.replace("Warfarin", "Coumadin"))
+        with open(os.path.join(self.raw_dir, "meddra_all_se.tsv"), "a") as f:
+            f.write("CID2\tCID02\tC5\tPT\tC5\tRash\n")
+        process(self.raw_dir, self.output_csv)
+
+        new_drug_vocab, new_se_vocab = load_vocabularies(os.path.dirname(self.output_csv))
+        pd.testing.assert_frame_equal(new_drug_vocab.loc[drug_vocab.index], drug_vocab)
+        pd.testing.assert_frame_equal(new_se_vocab.loc[se_vocab.index], se_vocab)
+        self.assertEqual(new_drug_vocab["drug_name"].tolist()[len(drug_vocab):], ["Coumadin"])
+        self.assertEqual(new_se_vocab["side_effect"].tolist()[len(se_vocab):], ["Rash"])
+
+        expected_csv = os.path.join(self.tmp.name, "expected", "clean.csv")
+        os.makedirs(os.path.dirname(expected_csv))
+        process(self.raw_dir, expected_csv)
+        self.assert_same_outputs(self.output_csv, expected_csv, same_ids=False)
+
 # Add test cases to validate data in CSV files
 import pandas as pd
 
@@ -95,8 +1060,10 @@ class TestCSVData(unittest.TestCase):
         self.assertTrue((df["risk_score"] <= 1).all(), "Risk scores exceed 1")
 
     def test_side_effects_clean_csv(self):
-        # Load side_effects_clean.csv
-        df = pd.read_csv("data/processed/side_effects_clean.csv")
+        # Load side_effects_clean.csv (or its Parquet copy)
+        from src.data_store import load_clean_table
+        df = load_clean_table("data/processed/side_effects_clean.csv",
+                              columns=["drug_name", "side_effect", "freq_pct"])
         self.assertFalse(df.empty, "side_effects_clean.csv is empty")
         self.assertIn("drug_name", df.columns, "Missing 'drug_name' column in side_effects_clean.csv")
         self.assertIn("side_effect", df.columns, "Missing 'side_effect' column in side_effects_clean.csv")
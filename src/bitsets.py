@@ -0,0 +1,124 @@
+import numpy as np
+
+# Popcount of every byte value, for numpy versions without np.bitwise_count
+_BYTE_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def pack_rows(matrix):
+    """
+    Pack the rows of a drug x side effect sparse matrix into bitsets: a
+    (n_rows, n_words) uint64 array with bit j of a row set when the row
+    has a stored entry in column j.
+    """
+    n_rows, n_cols = matrix.shape
+    n_words = max((n_cols + 63) // 64, 1)
+    dense = np.zeros((n_rows, n_words * 64), dtype=bool)
+    coo = matrix.tocoo()
+    dense[coo.row, coo.col] = True
+    return np.packbits(dense, axis=1, bitorder='little').view(np.uint64)
+
+
+def popcount(bits):
+    """
+    Number of set bits per bitset (along the last axis) of a uint64 array.
+    """
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(bits).sum(axis=-1, dtype=np.int64)
+    return _BYTE_POPCOUNT[bits.view(np.uint8)].sum(axis=-1, dtype=np.int64)
+
+
+def members(bits, n_cols=None):
+    """
+    Column ids of the set bits of one bitset.
+    """
+    flags = np.unpackbits(np.ascontiguousarray(bits).view(np.uint8), bitorder='little')
+    return np.flatnonzero(flags[:n_cols])
+
+
+class SideEffectProfiles:
+    """
+    Side effect profiles of all drugs as one packed bitset matrix: row i is
+    drug i's side effects over the side effect vocabulary, 64 per uint64
+    word. Regimen metrics (union, overlap and their sizes) are vectorized
+    OR / AND reductions plus popcount over the selected rows.
+    """
+    def __init__(self, drug_names, bits, side_effect_names):
+        self.drug_names = list(drug_names)
+        self.bits = np.asarray(bits, dtype=np.uint64)
+        self.side_effect_names = list(side_effect_names)
+        self.drug_index = {name: i for i, name in enumerate(self.drug_names)}
+        self._empty = np.zeros(self.bits.shape[1], dtype=np.uint64)
+
+    @classmethod
+    def from_matrix(cls, matrix, drug_names, side_effect_names):
+        """
+        Build from a drug x side effect sparse matrix.
+        """
+        return cls(drug_names, pack_rows(matrix), side_effect_names)
+
+    @classmethod
+    def from_graph(cls, graph):
+        """
+        Build from a SparseSideEffectGraph.
+        """
+        return cls.from_matrix(graph.matrix, graph.drug_names, graph.side_effect_names)
+
+    @classmethod
+    def from_lookup(cls, side_effect_lookup):
+        """
+        Build from a drug -> list of side effects dict.
+        """
+        import scipy.sparse as sp
+
+        drug_names = list(side_effect_lookup)
+        side_effect_names = sorted({se for effects in side_effect_lookup.values() for se in effects})
+        se_index = {name: j for j, name in enumerate(side_effect_names)}
+        indptr, indices = [0], []
+        for effects in side_effect_lookup.values():
+            indices.extend(se_index[se] for se in effects)
+            indptr.append(len(indices))
+        matrix = sp.csr_matrix((np.ones(len(indices), dtype=np.int8), indices, indptr),
+                               shape=(len(drug_names), len(side_effect_names)))
+        return cls.from_matrix(matrix, drug_names, side_effect_names)
+
+    def rows(self, drugs):
+        """
+        Bitsets of the given drugs; drugs without a profile get an empty one.
+        """
+        ids = [self.drug_index.get(drug, -1) for drug in drugs]
+        rows = self.bits[[max(i, 0) for i in ids]]
+        rows[np.array(ids) < 0] = 0
+        return rows
+
+    def union(self, drugs):
+        return np.bitwise_or.reduce(self.rows(drugs), axis=0) if len(drugs) else self._empty.copy()
+
+    def intersection(self, drugs):
+        return np.bitwise_and.reduce(self.rows(drugs), axis=0) if len(drugs) else self._empty.copy()
+
+    def count(self, bits):
+        return int(popcount(bits))
+
+    def names(self, bits):
+        """
+        Side effect names of a bitset, in vocabulary order.
+        """
+        return [self.side_effect_names[j] for j in members(bits, len(self.side_effect_names)).tolist()]
+
+    def regimen_metrics(self, drugs):
+        """
+        Union and overlap of a regimen's side effects.
+
+        Returns:
+            dict with union and overlap bitsets and their union_count and
+            overlap_count sizes.
+        """
+        rows = self.rows(drugs)
+        union = np.bitwise_or.reduce(rows, axis=0) if len(drugs) else self._empty.copy()
+        overlap = np.bitwise_and.reduce(rows, axis=0) if len(drugs) else self._empty.copy()
+        return {
+            "union": union,
+            "overlap": overlap,
+            "union_count": self.count(union),
+            "overlap_count": self.count(overlap),
+        }
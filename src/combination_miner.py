@@ -0,0 +1,117 @@
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+from src.bitsets import members, pack_rows, popcount
+
+
+class CombinationMiner:
+    """
+    Mine drug combinations that share many side effects.
+
+    Eclat-style depth-first search over drugs with side effect bitsets: a
+    combination's shared side effects are the AND of its drugs' bitsets,
+    and a combination is only extended while it still shares at least
+    min_shared side effects (adding a drug can only shrink the overlap), so
+    whole branches of the search are pruned at once. The extensions of a
+    combination are tested in one vectorized AND + popcount.
+
+    Usage:
+        miner = CombinationMiner.from_lookup(side_effect_lookup, drugs)
+        for combination in miner.mine(min_shared=10, max_results=100):
+            ...
+        miner.truncated  # True if a budget cut the search short
+    """
+    def __init__(self, drug_names, bits, side_effect_names):
+        self.drug_names = list(drug_names)
+        self.side_effect_names = list(side_effect_names)
+        self.bits = np.asarray(bits, dtype=np.uint64)
+        self.truncated = False
+
+    @classmethod
+    def from_lookup(cls, side_effect_lookup, drugs=None):
+        """
+        Build from a drug -> list of side effects dict, for the given drugs
+        (all of the dict by default; unknown drugs have no side effects).
+        """
+        drugs = list(side_effect_lookup if drugs is None else dict.fromkeys(drugs))
+        side_effect_names = sorted({se for drug in drugs for se in side_effect_lookup.get(drug, [])})
+        se_index = {name: j for j, name in enumerate(side_effect_names)}
+        indptr, indices = [0], []
+        for drug in drugs:
+            indices.extend({se_index[se] for se in side_effect_lookup.get(drug, [])})
+            indptr.append(len(indices))
+        matrix = sp.csr_matrix((np.ones(len(indices), dtype=np.int8), indices, indptr),
+                               shape=(len(drugs), len(side_effect_names)))
+        return cls(drugs, pack_rows(matrix), side_effect_names)
+
+    @classmethod
+    def from_graph(cls, G, drugs):
+        """
+        Build from an nx.DiGraph or SparseSideEffectGraph for the given drugs.
+        """
+        from src.utils import selected_drug_matrix
+
+        drugs = list(dict.fromkeys(drugs))
+        matrix, side_effect_names = selected_drug_matrix(G, drugs)
+        return cls(drugs, pack_rows(matrix), side_effect_names)
+
+    @classmethod
+    def from_profiles(cls, profiles, drugs):
+        """
+        Build from the rows of a SideEffectProfiles bitset matrix.
+        """
+        drugs = list(dict.fromkeys(drugs))
+        return cls(drugs, profiles.rows(drugs), profiles.side_effect_names)
+
+    def mine(self, min_shared, min_size=3, max_size=5, max_results=None, time_budget=None):
+        """
+        Stream the drug combinations of min_size to max_size drugs sharing at
+        least min_shared side effects.
+
+        Combinations come in depth-first order of the drug list: each
+        combination is followed by its extensions. The search stops early
+        after max_results combinations or time_budget seconds, and sets
+        self.truncated when it does.
+
+        Yields:
+            dict with drugs (tuple of names), overlap_count and
+            shared_effects (list of side effect names).
+        """
+        self.truncated = False
+        min_shared = max(min_shared, 1)
+        deadline = None if time_budget is None else time.monotonic() + time_budget
+        produced = 0
+
+        support = popcount(self.bits)
+        frequent = np.flatnonzero(support >= min_shared)
+
+        # Depth-first stack of (combination, its bitset, candidate extensions)
+        stack = [((i,), self.bits[i], frequent[k + 1:]) for k, i in reversed(list(enumerate(frequent.tolist())))]
+        while stack:
+            if deadline is not None and time.monotonic() > deadline:
+                self.truncated = True
+                return
+            combination, bits, candidates = stack.pop()
+
+            if len(combination) >= min_size:
+                yield {
+                    "drugs": tuple(self.drug_names[i] for i in combination),
+                    "overlap_count": int(popcount(bits)),
+                    "shared_effects": [self.side_effect_names[j]
+                                       for j in members(bits, len(self.side_effect_names)).tolist()],
+                }
+                produced += 1
+                if max_results is not None and produced >= max_results:
+                    self.truncated = bool(stack) or (len(combination) < max_size and len(candidates) > 0)
+                    return
+
+            if len(combination) == max_size or len(candidates) == 0:
+                continue
+            shared = bits[None, :] & self.bits[candidates]
+            keep = np.flatnonzero(popcount(shared) >= min_shared)
+            extensions = candidates[keep]
+            # Push in reverse so the first extension is explored first
+            for k in range(len(keep) - 1, -1, -1):
+                stack.append((combination + (int(extensions[k]),), shared[keep[k]], extensions[k + 1:]))
@@ -21,6 +21,20 @@ import tempfile
 from google import genai
 from dotenv import load_dotenv
 import os
+import sys
+
+# Make the `src` package importable under `streamlit run src/dashboard.py`
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from src.data_store import load_clean_table
+from src.graph_builder import load_or_build_graph
+from src.side_effect_index import load_or_build_index
+from src.utils import find_safer_alternatives
+from src.combination_miner import CombinationMiner
+from src.bitsets import SideEffectProfiles
+from src.sparse_graph import SparseSideEffectGraph
+from src.minhash_index import load_or_build_minhash_index
+from src.similarity_store import load_or_build_similarity_store
+from src.analytics import RiskRanking
 
 load_dotenv()
 
@@ -36,40 +50,48 @@ RISK_CSV = DATA_DIR / "drug_risk_scores.csv"
 
 @st.cache_data(show_spinner="Loading data...")
 def load_data():
-    edges = pd.read_csv(EDGE_CSV, usecols=["drug_name", "side_effect", "freq_pct"])
-    risks = pd.read_csv(RISK_CSV, usecols=["drug_name", "risk_score"])
+    edges = load_clean_table(EDGE_CSV, columns=["drug_name", "side_effect", "freq_pct"])
+    risks = load_clean_table(RISK_CSV, columns=["drug_name", "risk_score"])
     return edges, risks
 
-@st.cache_data(show_spinner="Building graph...")
-def build_graph(edges_df: pd.DataFrame) -> nx.DiGraph:
-    G = nx.DiGraph()
-    for _, row in edges_df.iterrows():
-        drug = row["drug_name"].strip()
-        se = row["side_effect"].strip()
-        freq_raw = row.get("freq_pct", None)
+@st.cache_resource(show_spinner="Loading side effect index...")
+def load_side_effect_index():
+    return load_or_build_index(EDGE_CSV)
 
-        try:
-            freq = float(freq_raw)
-        except (ValueError, TypeError):
-            freq = "N/A"
+@st.cache_resource(show_spinner="Loading drug similarities...")
+def load_similarity_store():
+    return load_or_build_similarity_store(EDGE_CSV)
 
-        G.add_node(drug, type="drug", color="#636EFA", size=20) 
-        G.add_node(se, type="side_effect", color="#EF553B", size=15)
-        G.add_edge(drug, se, frequency=freq, title=f"Frequency: {freq}%")
-    return G
+@st.cache_resource(show_spinner="Indexing similar drugs...")
+def load_minhash_index():
+    return load_or_build_minhash_index(EDGE_CSV)
+
+@st.cache_resource(show_spinner="Indexing the graph...")
+def load_sparse_graph():
+    return load_or_build_graph(EDGE_CSV, as_networkx=False)
+
+@st.cache_resource(show_spinner="Packing side effect profiles...")
+def load_side_effect_profiles(_graph: SparseSideEffectGraph):
+    return SideEffectProfiles.from_graph(_graph)
 
 @st.cache_data(show_spinner="Computing centrality...")
 def compute_centrality(_G: nx.DiGraph):
     return nx.betweenness_centrality(_G, k=min(100, len(_G.nodes)))
 
 edges_df, risk_df = load_data()
-G = build_graph(edges_df.head(500))  # Reduced size for performance
+se_index = load_side_effect_index()
+similarity_store = load_similarity_store()
+minhash_index = load_minhash_index()
+sparse_graph = load_sparse_graph()
+se_profiles = load_side_effect_profiles(sparse_graph)
+G = sparse_graph.to_networkx(max_nodes=500)  # Reduced size for performance (centrality only)
 
 # Precompute lookup dictionaries
 risk_map = risk_df.set_index("drug_name")["risk_score"].to_dict()
+risk_ranking = RiskRanking.from_frame(risk_df)
 side_effect_lookup = {
     drug: list(group["side_effect"])
-    for drug, group in edges_df.groupby("drug_name")
+    for drug, group in edges_df.groupby("drug_name", observed=True)
 }
 
 ############################
@@ -214,10 +236,9 @@ with tab1:
                 
                 for se in se_list[:20]:  # Limit to 20 for performance
                     sg.add_node(se, color="#EF553B", size=20, title=f"Side Effect: {se}")
-                    if G.has_edge(drug, se):
-                        freq = G.edges[drug, se].get("frequency", "N/A")
-                        sg.add_edge(drug, se, value=freq if isinstance(freq, (int, float)) else 1, 
-                                  title=f"Frequency: {freq}%")
+                    freq = sparse_graph.edge_frequency(drug, se)
+                    if freq is not None:
+                        sg.add_edge(drug, se, value=freq, title=f"Frequency: {freq}%")
                     else:
                         sg.add_edge(drug, se, value=1, title="Frequency: N/A")
 
@@ -295,34 +316,27 @@ with tab2:
     
     if 'drug' in locals() and drug and drug in side_effect_lookup:
         target_set = set(side_effect_lookup[drug])
-        risk_query = risk_map[drug]
         
         with st.spinner("Analyzing alternatives..."):
-            suggestions = []
-            for other, se_list in side_effect_lookup.items():
-                if other == drug:
-                    continue
-                overlap = len(target_set & set(se_list))
-                if overlap == 0:
-                    continue
-                risk_other = risk_map.get(other, float("inf"))
-                if risk_other < risk_query:
-                    suggestions.append({
-                        "Drug": other,
-                        "Shared Effects": overlap,
-                        "Risk Score": risk_other,
-                        "Risk Reduction": risk_query - risk_other
-                    })
+            suggestions = find_safer_alternatives(se_index, drug, target_set, risk_map, similarity_store,
+                                                  minhash_index=minhash_index)
             
             if suggestions:
-                sugg_df = pd.DataFrame(suggestions).sort_values(
+                sugg_df = pd.DataFrame(suggestions).rename(columns={
+                    "drug": "Drug",
+                    "shared_effects": "Shared Effects",
+                    "risk_score": "Risk Score",
+                    "risk_reduction": "Risk Reduction",
+                    "jaccard_similarity": "Profile Similarity",
+                    "cosine_similarity": "Frequency Similarity"
+                }).sort_values(
                     ["Shared Effects", "Risk Reduction"], 
                     ascending=[False, False]
                 )
 
                 st.dataframe(sugg_df, use_container_width=True)
             else:
-                st.info("No safer alternatives with overlapping side effects found.")
+                st.info("No safer alternatives with a similar side effect profile found.")
     else:
         st.info("Please select a drug in the 'Drug Lookup' tab first.")
 
@@ -363,8 +377,8 @@ with tab3:
 
         # Top 5 highest risk
         st.markdown("**Highest Risk in Range**")
-        for _, row in filtered.nlargest(5, "risk_score").iterrows():
-            st.markdown(f"- {row['drug_name']} ({row['risk_score']:.3f})")
+        for drug_name, score in risk_ranking.top(5, min_score=risk_filter[0], max_score=risk_filter[1]):
+            st.markdown(f"- {drug_name} ({score:.3f})")
 
     with col2:
         # Interactive histogram
@@ -383,6 +397,16 @@ with tab3:
         )
         st.plotly_chart(fig, use_container_width=True)
 
+    # Paged leaderboard of the drugs in range
+    st.markdown("### Risk Leaderboard")
+    page_size = 25
+    page_count = max((len(filtered) + page_size - 1) // page_size, 1)
+    page = st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1)
+    leaderboard = risk_ranking.page(page - 1, page_size, min_score=risk_filter[0], max_score=risk_filter[1])
+    st.dataframe(pd.DataFrame(leaderboard, columns=["Drug", "Risk Score"]).assign(
+        Rank=range((page - 1) * page_size + 1, (page - 1) * page_size + len(leaderboard) + 1)
+    ).set_index("Rank"), use_container_width=True)
+
     # Consistent table theme
     st.markdown("### Drug Risk Data")
     st.dataframe(filtered, use_container_width=True)
@@ -424,15 +448,8 @@ with tab4:
         
         with col1:
             # Calculate combined metrics
-            combined_effects = set()
-            overlap_effects = None
-            combined_score = 0
-
-            for d in selected_drugs:
-                se_set = set(side_effect_lookup.get(d, []))
-                combined_effects |= se_set
-                overlap_effects = se_set if overlap_effects is None else overlap_effects & se_set
-                combined_score += risk_map.get(d, 0)
+            regimen = se_profiles.regimen_metrics(selected_drugs)
+            combined_score = sum(risk_map.get(d, 0) for d in selected_drugs)
 
             avg_score = combined_score / len(selected_drugs)
             max_score = max(risk_map.get(d, 0) for d in selected_drugs)
@@ -455,14 +472,14 @@ with tab4:
             st.markdown(f"""
             <div style="border-radius: 0.5rem; padding: 1rem; background-color: #ffffff; border-left: 0.3rem solid green; margin-bottom: 1rem;">
                 <div style="font-size: 1rem; color: #57606a;">Total Unique Side Effects</div>
-                <div style="font-size: 1.5rem; font-weight: bold; color: green;">{len(combined_effects)}</div>
+                <div style="font-size: 1.5rem; font-weight: bold; color: green;">{regimen["union_count"]}</div>
             </div>
             """, unsafe_allow_html=True)
 
             st.markdown(f"""
             <div style="border-radius: 0.5rem; padding: 1rem; background-color: #ffffff; border-left: 0.3rem solid orange; margin-bottom: 1rem;">
                 <div style="font-size: 1rem; color: #57606a;">Overlapping Side Effects</div>
-                <div style="font-size: 1.5rem; font-weight: bold; color: orange;">{len(overlap_effects) if overlap_effects else 0}</div>
+                <div style="font-size: 1.5rem; font-weight: bold; color: orange;">{regimen["overlap_count"]}</div>
             </div>
             """, unsafe_allow_html=True)
         
@@ -482,17 +499,27 @@ with tab4:
                 st.warning("⚠️ Combining more than 2 drugs increases risk exponentially")
         
         # Visualizations
-        tab1, tab2 = st.tabs(["Side Effect Overlap", "Risk Comparison"])
+        tab1, tab2, tab3 = st.tabs(["Side Effect Overlap", "Risk Comparison", "Risky Sub-combinations"])
         
         with tab1:
-            if overlap_effects:
+            if regimen["overlap_count"]:
+                overlap_effects = se_profiles.names(regimen["overlap"])
                 st.markdown("### Overlapping Side Effects")
-                for i, effect in enumerate(list(overlap_effects)[:20], start=1):
+                for i, effect in enumerate(overlap_effects[:20], start=1):
                     st.markdown(f"- {effect}")
                 if len(overlap_effects) > 20:
                     st.markdown(f"... and {len(overlap_effects)-20} more")
             else:
                 st.success("No overlapping side effects detected among selected drugs.")
+
+            st.markdown("### Pairwise Profile Similarity")
+            st.dataframe(pd.DataFrame([
+                {"Drug A": a, "Drug B": b, **similarity_store.similarities(a, b)}
+                for i, a in enumerate(selected_drugs) for b in selected_drugs[i + 1:]
+            ]).rename(columns={
+                "jaccard_similarity": "Profile Similarity",
+                "cosine_similarity": "Frequency Similarity"
+            }), use_container_width=True)
         
         with tab2:
             # Radar chart for risk comparison
@@ -520,6 +547,28 @@ with tab4:
                 title="Individual Drug Risk Scores"
             )
             st.plotly_chart(fig, use_container_width=True)
+
+        with tab3:
+            if len(selected_drugs) >= 3:
+                min_shared = st.slider("Minimum shared side effects", min_value=1, max_value=50, value=5)
+                miner = CombinationMiner.from_profiles(se_profiles, selected_drugs)
+                combinations_found = [
+                    {
+                        "Drugs": " + ".join(combination["drugs"]),
+                        "Size": len(combination["drugs"]),
+                        "Shared Effects": combination["overlap_count"],
+                    }
+                    for combination in miner.mine(min_shared, min_size=3, max_results=500, time_budget=2.0)
+                ]
+                if combinations_found:
+                    st.dataframe(
+                        pd.DataFrame(combinations_found).sort_values("Shared Effects", ascending=False),
+                        use_container_width=True
+                    )
+                else:
+                    st.success(f"No combination of 3 or more drugs shares {min_shared} side effects.")
+            else:
+                st.info("Select at least 3 drugs to find risky sub-combinations.")
     else:
         st.info("Please select at least 2 drugs to analyze combinations")
 
@@ -720,6 +769,12 @@ with tab6:
                         <div style="font-size: 1.5rem; font-weight: bold; color: {overlap_color};">{len(overlapping)}</div>
                     </div>
                     """, unsafe_allow_html=True)
+
+                similarities = similarity_store.similarities(drug_a, drug_b)
+                st.caption(
+                    f"Profile similarity (Jaccard): {similarities['jaccard_similarity']:.3f} · "
+                    f"Frequency similarity (cosine): {similarities['cosine_similarity']:.3f}"
+                )
                 
                 # Section 3: Hypothesis Generation
                 st.subheader("3. AI-Generated Hypotheses")
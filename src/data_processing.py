@@ -1,46 +1,619 @@
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import pandas as pd
 
+# Allow running as `python src/data_processing.py` from the project root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from src.data_store import (
+    ColumnarWriter, columnar_path, file_fingerprint, load_vocabularies,
+    DRUG_VOCAB_NAME, SE_VOCAB_NAME, EDGES_NAME, MANIFEST_NAME,
+)
+
+RAW_DIR = 'data/raw'
+OUTPUT_CSV = 'data/processed/side_effects_clean.csv'
+
+SE_COLUMNS = ['stitch_flat', 'stitch_stereo', 'umls_id', 'type', 'umls_id_dup', 'side_effect']
+FREQ_COLUMNS = [
+    'stitch_flat', 'stitch_stereo', 'umls_id', 'placebo_freq',
+    'freq_str', 'freq_float', 'freq_adjusted',
+    'type', 'umls_id_dup', 'side_effect'
+]
+SE_DTYPES = {col: str for col in SE_COLUMNS}
+FREQ_DTYPES = {'stitch_flat': str, 'umls_id': str, 'freq_float': float}
+
+# Rough upper bound on how much a chunk grows while it is merged and written
+# (merge result, renamed copy and CSV buffer all live at the same time).
+CHUNK_OVERHEAD_FACTOR = 4
+MIN_CHUNKSIZE = 1_000
+
+# Raw edge rows VocabularyBuilder collects before folding them into one row
+# per (drug, side effect) pair
+EDGE_COMPACT_ROWS = 1_000_000
+
+FREQ_STAT_COLUMNS = ['freq_min', 'freq_max', 'freq_count']
+
+# MedDRA term levels kept by the ETL. meddra_all_se.tsv lists every label
+# concept both as a Lowest Level Term and as its Preferred Term.
+MEDDRA_LEVELS = ['PT', 'LLT', 'collapse', 'all']
+PT_KEY_COLUMNS = ['stitch_flat', 'stitch_stereo', 'umls_id']
+
+RAW_FILES = ['meddra_all_se.tsv', 'meddra_freq.tsv', 'drug_names.tsv']
+# Bump when the clean table changes for the same inputs and options, so
+# run_pipeline() rebuilds it
+ETL_FORMAT = 2
+JOIN_CACHE_NAME = 'se_freq_join.csv'
+
+
 # === Load raw data ===
 
-# 1. Load all side effects (meddra_all_se)
-se_df = pd.read_csv('data/raw/meddra_all_se.tsv', sep='\t', header=None,
-                    names=['stitch_flat', 'stitch_stereo', 'umls_id', 'type', 'umls_id_dup', 'side_effect'])
+def load_side_effects(path, chunksize=None):
+    """
+    Load meddra_all_se.tsv. Returns a DataFrame, or an iterator of DataFrames
+    when chunksize is given.
+    """
+    reader = pd.read_csv(path, sep='\t', header=None, names=SE_COLUMNS,
+                         dtype=SE_DTYPES, chunksize=chunksize)
+    if chunksize is None:
+        # Drop duplicate UMLS column
+        return reader.drop(columns=['umls_id_dup'])
+    return (chunk.drop(columns=['umls_id_dup']) for chunk in reader)
+
+
+def load_frequencies(path, chunksize=None):
+    """
+    Load meddra_freq.tsv, keeping only stitch_flat, umls_id and freq_float.
+    When chunksize is given the file is read piecewise so that only the
+    kept columns are ever held in memory.
+
+    meddra_freq.tsv repeats every reported frequency as an LLT row and as
+    the PT row of the same label concept; the duplicate LLT rows are
+    dropped (see dedupe_frequency_levels()).
+    """
+    keep = ['stitch_flat', 'umls_id', 'freq_float']
+    usecols = keep + ['stitch_stereo', 'type']
+    dtypes = dict(FREQ_DTYPES, stitch_stereo=str, type='category')
+    reader = pd.read_csv(path, sep='\t', header=None, names=FREQ_COLUMNS,
+                         usecols=usecols, dtype=dtypes, chunksize=chunksize)
+    freq_df = reader if chunksize is None else pd.concat(list(reader), ignore_index=True)
+    return dedupe_frequency_levels(freq_df)[keep].reset_index(drop=True)
+
+
+def dedupe_frequency_levels(freq_df):
+    """
+    Drop the LLT rows of meddra_freq whose label concept also has PT rows,
+    so each reported frequency is counted once whatever MedDRA level the
+    side effect rows are filtered to (frequencies are joined on the label
+    concept's umls_id, which both levels share).
+    """
+    return filter_meddra_level(freq_df, 'collapse')
+
+
+def load_drug_names(path):
+    """
+    Load drug_names.tsv as (stitch_id, drug_name).
+    """
+    return pd.read_csv(path, sep='\t', header=None, names=['stitch_id', 'drug_name'])
+
+
+# === MedDRA term level ===
+
+def pt_label_keys(se_df):
+    """
+    Hashes of the (stitch_flat, stitch_stereo, umls_id) label concepts that
+    have a PT row, as a sorted array.
+    """
+    pt_rows = se_df.loc[se_df['type'] == 'PT', PT_KEY_COLUMNS]
+    return np.unique(pd.util.hash_pandas_object(pt_rows, index=False).to_numpy())
+
+
+def filter_meddra_level(se_df, level='PT', pt_keys=None):
+    """
+    Keep side effect rows of one MedDRA level.
+
+    'PT' and 'LLT' keep only rows of that type. 'collapse' folds each LLT
+    into its PT: an LLT row is dropped when the same label concept has a PT
+    row (looked up in pt_keys, see pt_label_keys()), and kept otherwise.
+    'all' keeps both levels.
+    """
+    if level == 'all':
+        return se_df
+    if level in ('PT', 'LLT'):
+        return se_df[se_df['type'] == level]
+    if level == 'collapse':
+        if pt_keys is None:
+            pt_keys = pt_label_keys(se_df)
+        llt = (se_df['type'] == 'LLT').to_numpy()
+        hashes = pd.util.hash_pandas_object(se_df[PT_KEY_COLUMNS], index=False).to_numpy()
+        return se_df[~(llt & np.isin(hashes, pt_keys))]
+    raise ValueError(f"Unknown MedDRA level: {level!r} (expected one of {MEDDRA_LEVELS})")
+
 
-# Drop duplicate UMLS column
-se_df.drop(columns=['umls_id_dup'], inplace=True)
+# === Aggregate frequencies ===
 
-# 2. Load frequency data (meddra_freq)
-freq_df = pd.read_csv('data/raw/meddra_freq.tsv', sep='\t', header=None,
-                      names=[
-                          'stitch_flat', 'stitch_stereo', 'umls_id', 'placebo_freq',
-                          'freq_str', 'freq_float', 'freq_adjusted',
-                          'type', 'umls_id_dup', 'side_effect'
-                      ])
+def aggregate_frequencies(freq_df):
+    """
+    Reduce meddra_freq to one row per (stitch_flat, umls_id) pair.
 
-# Keep only stitch_flat, umls_id, freq_float
-freq_df = freq_df[['stitch_flat', 'umls_id', 'freq_float']]
+    meddra_freq.tsv has a row per label and placebo arm, so joining it as-is
+    multiplies the side effect rows. The aggregate keeps the mean frequency
+    in freq_float plus freq_min, freq_max and freq_count (number of reported
+    frequencies for the pair).
+    """
+    grouped = freq_df.groupby(['stitch_flat', 'umls_id'], sort=False)['freq_float']
+    agg_df = grouped.agg(['mean', 'min', 'max', 'count']).reset_index()
+    agg_df.rename(columns={
+        'mean': 'freq_float',
+        'min': 'freq_min',
+        'max': 'freq_max',
+        'count': 'freq_count'
+    }, inplace=True)
+    agg_df['freq_count'] = agg_df['freq_count'].astype('Int64')
+    return agg_df
 
-# 3. Load drug names
-names_df = pd.read_csv('data/raw/drug_names.tsv', sep='\t', header=None, names=['stitch_id', 'drug_name'])
 
 # === Merge data ===
 
-# Merge se_df with drug names
-merged_df = se_df.merge(names_df, left_on='stitch_flat', right_on='stitch_id', how='left')
+def join_frequencies(se_df, freq_df):
+    """
+    Left-join frequency info onto side effect rows.
+    """
+    return se_df.merge(freq_df, on=['stitch_flat', 'umls_id'], how='left')
+
+
+def join_drug_names(se_freq_df, names_df):
+    """
+    Left-join drug names onto the output of join_frequencies() and select
+    the output columns.
+    """
+    merged_df = se_freq_df.merge(names_df, left_on='stitch_flat', right_on='stitch_id', how='left')
+
+    # Rename columns for clarity
+    merged_df.rename(columns={
+        'stitch_flat': 'stitch_id',
+        'freq_float': 'freq_pct'
+    }, inplace=True)
+
+    # Reorder and select final columns
+    columns = ['stitch_id', 'drug_name', 'umls_id', 'side_effect', 'type', 'freq_pct']
+    columns += [col for col in FREQ_STAT_COLUMNS if col in merged_df.columns]
+    return merged_df[columns]
+
+
+def clean_side_effects(se_df, names_df, freq_df):
+    """
+    Join side effects with frequency info and drug names and select the
+    output columns. Works on the full table or on any row chunk of it.
+
+    freq_df is either the raw frequency table or the output of
+    aggregate_frequencies(), in which case the frequency statistics
+    columns are kept in the output.
+    """
+    return join_drug_names(join_frequencies(se_df, freq_df), names_df)
+
+
+def joined_chunks(se_chunks, freq_df, names_df, cache_csv=None):
+    """
+    Yield clean-table chunks for an iterable of side effect chunks. If
+    cache_csv is given, the intermediate se/freq join is written there too,
+    so a later run can redo only the drug name join.
+    """
+    se_freq_chunks = (join_frequencies(se_chunk, freq_df) for se_chunk in se_chunks)
+    return joined_chunks_from_join(se_freq_chunks, names_df, cache_csv)
+
+
+def joined_chunks_from_join(se_freq_chunks, names_df, cache_csv=None):
+    """
+    Like joined_chunks(), for chunks that already carry the frequency join.
+    """
+    header = True
+    for se_freq_df in se_freq_chunks:
+        if cache_csv is not None:
+            se_freq_df.to_csv(cache_csv, index=False, mode='w' if header else 'a', header=header)
+        header = False
+        yield join_drug_names(se_freq_df, names_df)
+
+
+def load_join_cache(cache_csv, chunksize=None):
+    """
+    Read back the se/freq join written by joined_chunks(). Always returns an
+    iterable of chunks.
+    """
+    dtypes = {col: str for col in SE_COLUMNS}
+    dtypes['freq_count'] = 'Int64'
+    reader = pd.read_csv(cache_csv, dtype=dtypes, float_precision='round_trip', chunksize=chunksize)
+    return [reader] if chunksize is None else reader
+
+
+def write_clean_table(chunks, output_csv):
+    """
+    Write clean-table chunks to output_csv and its Parquet copy, and the
+    interned vocabularies and edge table next to them.
+    Returns the number of rows written.
+    """
+    rows = 0
+    header = True
+    processed_dir = os.path.dirname(output_csv)
+    if all(os.path.exists(os.path.join(processed_dir, name)) for name in (DRUG_VOCAB_NAME, SE_VOCAB_NAME)):
+        vocab = VocabularyBuilder(*load_vocabularies(processed_dir))
+    else:
+        vocab = VocabularyBuilder()
+    with ColumnarWriter(output_csv) as writer:
+        for out in chunks:
+            out.to_csv(output_csv, index=False, sep=',', encoding='utf-8',
+                       mode='w' if header else 'a', header=header)
+            writer.write(out)
+            vocab.add(out)
+            header = False
+            rows += len(out)
+    vocab.save(processed_dir)
+    return rows
+
+
+# === Interned vocabularies ===
+
+class VocabularyBuilder:
+    """
+    Collect integer vocabularies and an integer edge table from clean-table
+    chunks.
+
+    Drugs are interned by drug_name and side effects by side_effect name,
+    the same keys the graph uses for its nodes. Names of the previous
+    vocabularies (as returned by load_vocabularies()) keep their ids, and
+    new names are appended in sorted order, so ids stay stable across runs
+    and never depend on row order or chunking. Names no longer in the data
+    keep their ids, without edges. Each vocabulary also records one source
+    id (the smallest stitch_id / umls_id seen for the name, or the previous
+    one for names not seen).
+
+    The edge table has one row per (drug_id, se_id) pair, sorted by ids,
+    with the last non-null frequency for the pair, which is what
+    build_side_effect_graph() leaves on the edge. The collected edge rows
+    are folded into that form whenever they outgrow the folded table (and
+    EDGE_COMPACT_ROWS), so they take memory per distinct pair rather than
+    per row added.
+    """
+    def __init__(self, drug_vocab=None, se_vocab=None):
+        self.drug_vocab = drug_vocab
+        self.se_vocab = se_vocab
+        self.drugs = {}
+        self.side_effects = {}
+        self.drug_keys = {}
+        self.se_keys = {}
+        self.edge_parts = []
+        self._pending_rows = 0
+        self._folded_rows = 0
+
+    @staticmethod
+    def _intern(values, keys, table, key_table):
+        codes, uniques = pd.factorize(values)
+        provisional = np.empty(len(uniques), dtype=np.int64)
+        first_keys = keys.groupby(codes).min()
+        for code, name in enumerate(uniques):
+            provisional[code] = table.setdefault(name, len(table))
+            key = first_keys.iloc[code]
+            if name not in key_table or key < key_table[name]:
+                key_table[name] = key
+        return provisional[codes]
+
+    def add(self, chunk):
+        # Column 0 is the flat STITCH id; the clean table repeats the
+        # 'stitch_id' header for the drug-name join key.
+        df = pd.DataFrame({
+            'stitch_id': chunk.iloc[:, 0].to_numpy(),
+            'drug_name': chunk['drug_name'].to_numpy(),
+            'umls_id': chunk['umls_id'].to_numpy(),
+            'side_effect': chunk['side_effect'].to_numpy(),
+            'freq_pct': chunk['freq_pct'].to_numpy(dtype=float),
+        }).dropna(subset=['drug_name', 'side_effect'])
+        if df.empty:
+            return
+        drug_ids = self._intern(df['drug_name'], df['stitch_id'], self.drugs, self.drug_keys)
+        se_ids = self._intern(df['side_effect'], df['umls_id'], self.side_effects, self.se_keys)
+        self.edge_parts.append((drug_ids, se_ids, df['freq_pct'].to_numpy()))
+        self._pending_rows += len(df)
+        if self._pending_rows > max(self._folded_rows, EDGE_COMPACT_ROWS):
+            edges = self._last_frequencies(*map(np.concatenate, zip(*self.edge_parts)), sort=False)
+            self.edge_parts = [tuple(edges[col].to_numpy() for col in ['drug_id', 'se_id', 'freq'])]
+            self._pending_rows = 0
+            self._folded_rows = len(edges)
+
+    @staticmethod
+    def _last_frequencies(drug_ids, se_ids, freq, sort=True):
+        edges = pd.DataFrame({'drug_id': drug_ids, 'se_id': se_ids, 'freq': freq})
+        # last() skips NaN, matching how repeated add_edge calls keep the last frequency
+        return edges.groupby(['drug_id', 'se_id'], sort=sort)['freq'].last().reset_index()
+
+    @staticmethod
+    def _finalize(table, key_table, previous, id_col, name_col, key_col):
+        names, keys = [], {}
+        if previous is not None:
+            previous = previous.sort_index()
+            names = previous[name_col].tolist()
+            keys = dict(zip(names, previous[key_col].tolist()))
+        known = set(names)
+        names += sorted(name for name in table if name not in known)
+        ids = {name: i for i, name in enumerate(names)}
+        remap = np.empty(len(table), dtype=np.int64)
+        for name, provisional in table.items():
+            remap[provisional] = ids[name]
+        keys.update(key_table)
+        vocab_df = pd.DataFrame({
+            id_col: np.arange(len(names), dtype=np.int32),
+            name_col: names,
+            key_col: [keys[name] for name in names],
+        })
+        return vocab_df, remap
+
+    def save(self, processed_dir):
+        drug_vocab, drug_remap = self._finalize(self.drugs, self.drug_keys, self.drug_vocab,
+                                                'drug_id', 'drug_name', 'stitch_id')
+        se_vocab, se_remap = self._finalize(self.side_effects, self.se_keys, self.se_vocab,
+                                            'se_id', 'side_effect', 'umls_id')
+
+        if self.edge_parts:
+            drug_ids, se_ids, freq = map(np.concatenate, zip(*self.edge_parts))
+            edges = self._last_frequencies(drug_remap[drug_ids], se_remap[se_ids], freq)
+        else:
+            edges = pd.DataFrame({'drug_id': [], 'se_id': [], 'freq': []})
+
+        drug_vocab.to_csv(os.path.join(processed_dir, DRUG_VOCAB_NAME), index=False)
+        se_vocab.to_csv(os.path.join(processed_dir, SE_VOCAB_NAME), index=False)
+        np.savez(os.path.join(processed_dir, EDGES_NAME),
+                 drug_id=edges['drug_id'].to_numpy(dtype=np.int32),
+                 se_id=edges['se_id'].to_numpy(dtype=np.int32),
+                 freq=edges['freq'].to_numpy(dtype=np.float32))
+
+
+def estimate_chunksize(se_path, broadcast_bytes, max_memory_mb, sample_rows=10_000):
+    """
+    Pick a chunk size for meddra_all_se.tsv so that a chunk and its merge
+    intermediates fit into max_memory_mb next to the broadcast tables.
+    """
+    sample = pd.read_csv(se_path, sep='\t', header=None, names=SE_COLUMNS,
+                         dtype=SE_DTYPES, nrows=sample_rows)
+    if sample.empty:
+        return MIN_CHUNKSIZE
+    row_bytes = sample.memory_usage(deep=True).sum() / len(sample)
+    budget = max_memory_mb * 1024 * 1024 - broadcast_bytes
+    return max(MIN_CHUNKSIZE, int(budget / (row_bytes * CHUNK_OVERHEAD_FACTOR)))
+
+
+def process(raw_dir=RAW_DIR, output_csv=OUTPUT_CSV, aggregate_freq=True, meddra_level='PT', cache_csv=None):
+    """
+    One-shot ETL: load every raw table, merge in memory and write the clean CSV
+    (plus its Parquet copy when pyarrow is installed).
+
+    With aggregate_freq=False the raw frequency rows are joined as-is, which
+    yields one output row per reported frequency (the legacy layout).
+    meddra_level selects the MedDRA term level, see filter_meddra_level().
+    """
+    # 1. Load all side effects (meddra_all_se)
+    se_df = filter_meddra_level(load_side_effects(os.path.join(raw_dir, 'meddra_all_se.tsv')), meddra_level)
+    # 2. Load frequency data (meddra_freq)
+    freq_df = load_frequencies(os.path.join(raw_dir, 'meddra_freq.tsv'))
+    # 3. Load drug names
+    names_df = load_drug_names(os.path.join(raw_dir, 'drug_names.tsv'))
+    if aggregate_freq:
+        freq_df = aggregate_frequencies(freq_df)
+
+    # Save cleaned data
+    return write_clean_table(joined_chunks([se_df], freq_df, names_df, cache_csv), output_csv)
+
+
+def process_streaming(raw_dir=RAW_DIR, output_csv=OUTPUT_CSV, chunksize=None, max_memory_mb=512,
+                      aggregate_freq=True, meddra_level='PT', cache_csv=None):
+    """
+    Streaming ETL: read meddra_all_se.tsv in bounded chunks, join each chunk
+    against the drug-name and frequency tables held in memory, and append the
+    result to the clean CSV. The output is identical to process().
+
+    If chunksize is not given it is derived from max_memory_mb. With
+    meddra_level='collapse' an extra pass over meddra_all_se.tsv collects
+    the label concepts that have a PT row.
+
+    max_memory_mb only bounds the meddra_all_se.tsv chunks. The frequency
+    table (aggregated unless aggregate_freq=False) and the drug names are
+    held in memory in full, and their size is taken off the budget before
+    the chunk size is picked. The vocabularies and the edge table of
+    write_clean_table() grow with the number of distinct names and
+    (drug, side effect) pairs.
+    """
+    se_path = os.path.join(raw_dir, 'meddra_all_se.tsv')
+    freq_df = load_frequencies(os.path.join(raw_dir, 'meddra_freq.tsv'), chunksize=chunksize or 100_000)
+    names_df = load_drug_names(os.path.join(raw_dir, 'drug_names.tsv'))
+    if aggregate_freq:
+        freq_df = aggregate_frequencies(freq_df)
+
+    if chunksize is None:
+        broadcast_bytes = (freq_df.memory_usage(deep=True).sum()
+                           + names_df.memory_usage(deep=True).sum())
+        chunksize = estimate_chunksize(se_path, broadcast_bytes, max_memory_mb)
+
+    pt_keys = None
+    if meddra_level == 'collapse':
+        pt_keys = np.unique(np.concatenate(
+            [pt_label_keys(chunk) for chunk in load_side_effects(se_path, chunksize=chunksize)]
+            or [np.empty(0, dtype=np.uint64)]))
+
+    se_chunks = (filter_meddra_level(chunk, meddra_level, pt_keys)
+                 for chunk in load_side_effects(se_path, chunksize=chunksize))
+    return write_clean_table(joined_chunks(se_chunks, freq_df, names_df, cache_csv), output_csv)
+
+
+def _process_partition(args):
+    """
+    Worker for process_parallel(): MedDRA filter, frequency aggregation and
+    frequency join for the rows of one drug partition.
+    """
+    se_part, freq_part, aggregate_freq, meddra_level = args
+    se_part = filter_meddra_level(se_part, meddra_level)
+    if aggregate_freq:
+        freq_part = aggregate_frequencies(freq_part)
+    return join_frequencies(se_part, freq_part)
+
+
+def partition_ids(stitch_ids, partitions):
+    """
+    Stable hash partition of STITCH ids into `partitions` buckets.
+    """
+    hashes = pd.util.hash_array(stitch_ids.to_numpy(dtype=object))
+    return (hashes % np.uint64(partitions)).astype(np.int64)
+
+
+def process_parallel(raw_dir=RAW_DIR, output_csv=OUTPUT_CSV, workers=None, partitions=None,
+                     aggregate_freq=True, meddra_level='PT', cache_csv=None):
+    """
+    Partitioned ETL: hash-partition the side effect and frequency tables by
+    stitch_flat and run the MedDRA filter, frequency aggregation and
+    frequency join for each partition in a process pool.
+
+    Every step before the drug-name join only relates rows of the same drug,
+    so the partitions are independent. Results are put back in input row
+    order before the name join, so the output is identical to process().
+    """
+    workers = workers or os.cpu_count() or 1
+    partitions = partitions or workers * 4
+
+    se_df = load_side_effects(os.path.join(raw_dir, 'meddra_all_se.tsv'))
+    freq_df = load_frequencies(os.path.join(raw_dir, 'meddra_freq.tsv'))
+    names_df = load_drug_names(os.path.join(raw_dir, 'drug_names.tsv'))
+
+    # Remember input order so concatenated partitions can be put back in it
+    se_df = se_df.assign(_row=np.arange(len(se_df)))
+    se_parts = se_df.groupby(partition_ids(se_df['stitch_flat'], partitions), sort=True)
+    freq_parts = dict(list(freq_df.groupby(partition_ids(freq_df['stitch_flat'], partitions), sort=True)))
+    tasks = [
+        (se_part, freq_parts.get(part, freq_df.iloc[:0]), aggregate_freq, meddra_level)
+        for part, se_part in se_parts
+    ] or [(se_df, freq_df, aggregate_freq, meddra_level)]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(_process_partition, tasks))
+
+    se_freq_df = pd.concat(results, ignore_index=True)
+    se_freq_df = se_freq_df.sort_values('_row', kind='stable').drop(columns='_row')
+    return write_clean_table(joined_chunks_from_join([se_freq_df], names_df, cache_csv), output_csv)
+
+
+def process_names_only(raw_dir=RAW_DIR, output_csv=OUTPUT_CSV, cache_csv=None, chunksize=None):
+    """
+    Redo only the drug name join, starting from the cached se/freq join.
+    """
+    names_df = load_drug_names(os.path.join(raw_dir, 'drug_names.tsv'))
+    chunks = (join_drug_names(se_freq_df, names_df) for se_freq_df in load_join_cache(cache_csv, chunksize))
+    return write_clean_table(chunks, output_csv)
+
+
+# === Incremental runs ===
+
+def manifest_path(output_csv):
+    return os.path.join(os.path.dirname(output_csv), MANIFEST_NAME)
+
+
+def cache_path(output_csv):
+    return os.path.join(os.path.dirname(output_csv), 'cache', JOIN_CACHE_NAME)
+
+
+def load_manifest(output_csv):
+    try:
+        with open(manifest_path(output_csv)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def output_fingerprints(output_csv):
+    processed_dir = os.path.dirname(output_csv)
+    paths = [output_csv, columnar_path(output_csv)]
+    paths += [os.path.join(processed_dir, name) for name in (DRUG_VOCAB_NAME, SE_VOCAB_NAME, EDGES_NAME)]
+    return {os.path.basename(p): file_fingerprint(p) for p in paths if os.path.exists(p)}
+
+
+def run_pipeline(raw_dir=RAW_DIR, output_csv=OUTPUT_CSV, stream=False, chunksize=None, max_memory_mb=512,
+                 aggregate_freq=True, meddra_level='PT', workers=None, force=False):
+    """
+    Run the ETL only as far as the inputs require.
+
+    Content hashes of the raw inputs, the options and the outputs are kept
+    in etl_manifest.json next to the output. If nothing changed the run is
+    a no-op; if only drug_names.tsv changed the name join is redone from the
+    cached se/freq join; otherwise everything is rebuilt, with
+    process_parallel() when workers > 1, process_streaming() when stream is
+    set, and process() otherwise.
+
+    Returns one of "unchanged", "names", "full".
+    """
+    inputs = {name: file_fingerprint(os.path.join(raw_dir, name)) for name in RAW_FILES}
+    options = {'format': ETL_FORMAT, 'aggregate_freq': aggregate_freq, 'meddra_level': meddra_level}
+    manifest = load_manifest(output_csv)
+    cache_csv = cache_path(output_csv)
+
+    same_options = manifest.get('options') == options
+    old_inputs = manifest.get('inputs', {})
+    changed = {name for name in RAW_FILES if old_inputs.get(name) != inputs[name]}
+
+    if force or not same_options:
+        mode = 'full'
+    elif not changed and manifest.get('outputs') and manifest['outputs'] == output_fingerprints(output_csv):
+        return 'unchanged'
+    elif changed <= {'drug_names.tsv'} and os.path.exists(cache_csv) \
+            and manifest.get('join_cache') == file_fingerprint(cache_csv):
+        mode = 'names'
+    else:
+        mode = 'full'
+
+    os.makedirs(os.path.dirname(cache_csv), exist_ok=True)
+    if mode == 'names':
+        process_names_only(raw_dir, output_csv, cache_csv, chunksize=chunksize if stream else None)
+    elif workers is not None and workers > 1:
+        process_parallel(raw_dir, output_csv, workers=workers, aggregate_freq=aggregate_freq,
+                         meddra_level=meddra_level, cache_csv=cache_csv)
+    elif stream:
+        process_streaming(raw_dir, output_csv, chunksize=chunksize, max_memory_mb=max_memory_mb,
+                          aggregate_freq=aggregate_freq, meddra_level=meddra_level, cache_csv=cache_csv)
+    else:
+        process(raw_dir, output_csv, aggregate_freq=aggregate_freq, meddra_level=meddra_level,
+                cache_csv=cache_csv)
 
-# Merge with frequency info
-merged_df = merged_df.merge(freq_df, on=['stitch_flat', 'umls_id'], how='left')
+    manifest = {
+        'inputs': inputs,
+        'options': options,
+        'join_cache': file_fingerprint(cache_csv),
+        'outputs': output_fingerprints(output_csv),
+    }
+    with open(manifest_path(output_csv), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return mode
 
-# Rename columns for clarity
-merged_df.rename(columns={
-    'stitch_flat': 'stitch_id',
-    'freq_float': 'freq_pct'
-}, inplace=True)
 
-# Reorder and select final columns
-final_df = merged_df[['stitch_id', 'drug_name', 'umls_id', 'side_effect', 'type', 'freq_pct']]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clean raw SIDER tables into side_effects_clean.csv")
+    parser.add_argument("--raw_dir", type=str, default=RAW_DIR, help="Directory holding the raw TSV files")
+    parser.add_argument("--output", type=str, default=OUTPUT_CSV, help="Path of the clean CSV to write")
+    parser.add_argument("--stream", action="store_true", help="Process meddra_all_se.tsv in bounded-size chunks")
+    parser.add_argument("--chunksize", type=int, help="Rows per chunk in streaming mode")
+    parser.add_argument("--max_memory_mb", type=int, default=512,
+                        help="Memory ceiling used to size chunks in streaming mode")
+    parser.add_argument("--no_aggregate_freq", action="store_true",
+                        help="Join every meddra_freq row instead of one aggregated row per drug/side effect")
+    parser.add_argument("--meddra_level", choices=MEDDRA_LEVELS, default="PT",
+                        help="MedDRA term level to keep: PT, LLT, collapse (LLTs folded into their PT) or all")
+    parser.add_argument("--workers", type=int,
+                        help="Run the joins per drug partition in this many worker processes")
+    parser.add_argument("--force", action="store_true",
+                        help="Rebuild even if the inputs match the last run's manifest")
+    args = parser.parse_args()
 
-# Save cleaned data
-final_df.to_csv('data/processed/side_effects_clean.csv', index=False, sep=',', encoding='utf-8')
+    mode = run_pipeline(args.raw_dir, args.output, stream=args.stream, chunksize=args.chunksize,
+                        max_memory_mb=args.max_memory_mb, aggregate_freq=not args.no_aggregate_freq,
+                        meddra_level=args.meddra_level, workers=args.workers, force=args.force)
 
-print("Cleaned data saved to data/processed/side_effects_clean.csv")
+    if mode == "unchanged":
+        print(f"Raw inputs unchanged, {args.output} is up to date")
+    else:
+        print(f"Cleaned data saved to {args.output}")
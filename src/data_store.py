@@ -0,0 +1,256 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional, loaders fall back to CSV
+    pa = None
+    pq = None
+
+# Columns stored dictionary-encoded in the columnar store; they are read
+# back as pandas categoricals.
+DICTIONARY_COLUMNS = ['drug_name', 'side_effect']
+
+MANIFEST_NAME = 'etl_manifest.json'
+
+# Interned vocabularies and integer edge table written by the ETL
+DRUG_VOCAB_NAME = 'drug_vocab.csv'
+SE_VOCAB_NAME = 'side_effect_vocab.csv'
+EDGES_NAME = 'side_effect_edges.npz'
+
+
+def file_fingerprint(path, chunk_size=1 << 20):
+    """
+    SHA-256 hex digest of a file's contents, or None if it does not exist.
+    """
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def dataset_fingerprint(csv_path):
+    """
+    Fingerprint of a processed table: of the file load_clean_table() reads,
+    which is the Parquet copy when has_columnar_store() (also without the
+    CSV) and the CSV otherwise. Uses the output hash recorded in the ETL
+    manifest when the manifest is at least as new as that file, and hashes
+    the file otherwise. None if there is no data.
+    """
+    csv_path = str(csv_path)
+    path = columnar_path(csv_path) if has_columnar_store(csv_path) else csv_path
+    manifest = os.path.join(os.path.dirname(path), MANIFEST_NAME)
+    if os.path.exists(manifest) and os.path.exists(path) \
+            and os.path.getmtime(manifest) >= os.path.getmtime(path):
+        with open(manifest) as f:
+            try:
+                recorded = json.load(f).get('outputs', {}).get(os.path.basename(path))
+            except json.JSONDecodeError:
+                recorded = None
+        if recorded:
+            return recorded
+    return file_fingerprint(path)
+
+
+def cache_is_current(stored_format, stored_fingerprint, cache_format, fingerprint):
+    """
+    Whether a cache written with stored_format and stored_fingerprint can be
+    reused: it must have the current cache_format and have been built from
+    data with the given fingerprint. A None fingerprint (data that could
+    not be fingerprinted) never matches.
+    """
+    return stored_format == cache_format and fingerprint is not None and stored_fingerprint == fingerprint
+
+
+def save_cache(path, cache_format, fingerprint=None, **arrays):
+    """
+    Write a cache .npz of arrays, tagged with cache_format and the
+    fingerprint of the data it was built from. The file is written next to
+    path and moved into place, so a reader never sees it half written.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, format=cache_format, fingerprint=fingerprint or '', **arrays)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_cache(path, cache_format, fingerprint):
+    """
+    Load a cache written by save_cache().
+
+    Returns:
+        dict of its arrays, with the stored fingerprint (None if it had
+        none) under 'fingerprint'; None if there is no file or
+        cache_is_current() rejects it.
+    """
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        stored = str(data['fingerprint']) or None
+        if not cache_is_current(int(data['format']), stored, cache_format, fingerprint):
+            return None
+        arrays = {name: data[name] for name in data.files if name not in ('format', 'fingerprint')}
+    arrays['fingerprint'] = stored
+    return arrays
+
+
+def columnar_path(csv_path):
+    """
+    Path of the Parquet store that sits next to a processed CSV.
+    """
+    return os.path.splitext(str(csv_path))[0] + '.parquet'
+
+
+def has_columnar_store(csv_path):
+    """
+    True if a Parquet copy of csv_path exists, pyarrow can read it and it
+    is not older than the CSV.
+    """
+    if pq is None:
+        return False
+    parquet_path = columnar_path(csv_path)
+    if not os.path.exists(parquet_path):
+        return False
+    if os.path.exists(csv_path) and os.path.getmtime(parquet_path) < os.path.getmtime(csv_path):
+        return False
+    return True
+
+
+def load_clean_table(csv_path, columns=None):
+    """
+    Load a processed table, preferring its Parquet copy when present.
+
+    Args:
+        csv_path: Path of the processed CSV (e.g. side_effects_clean.csv).
+        columns: Optional list of columns to read; other columns are not parsed.
+
+    Returns:
+        pd.DataFrame. When read from Parquet, drug_name and side_effect are
+        categoricals.
+    """
+    if has_columnar_store(csv_path):
+        parquet_path = columnar_path(csv_path)
+        read_dictionary = [col for col in DICTIONARY_COLUMNS if columns is None or col in columns]
+        table = pq.read_table(parquet_path, columns=columns, read_dictionary=read_dictionary)
+        return table.to_pandas()
+    return pd.read_csv(csv_path, usecols=columns)
+
+
+def table_columns(csv_path):
+    """
+    Column names of a processed table without loading its rows.
+    """
+    if has_columnar_store(csv_path):
+        return list(pq.read_schema(columnar_path(csv_path)).names)
+    return list(pd.read_csv(csv_path, nrows=0).columns)
+
+
+def load_vocabularies(processed_dir):
+    """
+    Load the drug and side effect vocabularies written by the ETL.
+
+    Returns:
+        (drug_vocab, se_vocab): DataFrames indexed by drug_id / se_id with
+        drug_name, stitch_id and side_effect, umls_id columns.
+    """
+    drug_vocab = pd.read_csv(os.path.join(processed_dir, DRUG_VOCAB_NAME),
+                             dtype={'drug_id': np.int32, 'drug_name': str, 'stitch_id': str})
+    se_vocab = pd.read_csv(os.path.join(processed_dir, SE_VOCAB_NAME),
+                           dtype={'se_id': np.int32, 'side_effect': str, 'umls_id': str})
+    return drug_vocab.set_index('drug_id'), se_vocab.set_index('se_id')
+
+
+def load_edge_arrays(processed_dir):
+    """
+    Load the interned edge table: int32 drug_id and se_id arrays and a
+    float32 freq array (NaN where no frequency is known), sorted by
+    (drug_id, se_id).
+    """
+    with np.load(os.path.join(processed_dir, EDGES_NAME)) as data:
+        return {key: data[key] for key in ('drug_id', 'se_id', 'freq')}
+
+
+def dedupe_column_names(columns):
+    """
+    Rename repeated column names the way pd.read_csv does ('a', 'a.1', ...),
+    so CSV and Parquet loads expose the same column names.
+    """
+    seen = {}
+    result = []
+    for col in columns:
+        if col in seen:
+            seen[col] += 1
+            result.append(f"{col}.{seen[col]}")
+        else:
+            seen[col] = 0
+            result.append(col)
+    return result
+
+
+def arrow_schema(columns):
+    """
+    Arrow schema for the clean side effect table: frequencies are typed,
+    everything else is a string column.
+    """
+    fields = []
+    for col in columns:
+        if col == 'freq_count':
+            fields.append(pa.field(col, pa.int64()))
+        elif col.startswith('freq_'):
+            fields.append(pa.field(col, pa.float64()))
+        else:
+            fields.append(pa.field(col, pa.string()))
+    return pa.schema(fields)
+
+
+class ColumnarWriter:
+    """
+    Incrementally write DataFrame chunks to the Parquet copy of a processed
+    CSV. Does nothing when pyarrow is not installed.
+
+    Usage:
+        with ColumnarWriter(csv_path) as writer:
+            writer.write(chunk)
+    """
+    def __init__(self, csv_path):
+        self.path = columnar_path(csv_path)
+        self.writer = None
+        self.schema = None
+
+    def write(self, df):
+        if pq is None:
+            return
+        df = df.set_axis(dedupe_column_names(df.columns), axis=1)
+        if self.writer is None:
+            self.schema = arrow_schema(df.columns)
+            self.writer = pq.ParquetWriter(self.path, self.schema,
+                                           use_dictionary=DICTIONARY_COLUMNS)
+        table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        if exc_type is not None and os.path.exists(self.path):
+            # Never leave a half-written store that loaders would prefer
+            os.remove(self.path)
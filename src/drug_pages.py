@@ -0,0 +1,212 @@
+import hashlib
+import html
+import json
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from src.visualize_graph import DATA_DIR, DATA_FORMATS, publish_assets, write_vis_page
+
+MANIFEST_FILE = "manifest.json"
+# Bump when the look of the pages changes, to re-render them all
+DRUG_PAGE_FORMAT = 1
+# Pages per task sent to a worker
+DRUG_PAGE_CHUNK_SIZE = 64
+
+
+def drug_page_name(drug):
+    """
+    File name of a drug's page: its name made file-safe, plus a short hash
+    so distinct drug names never share a page.
+    """
+    slug = re.sub(r'[^A-Za-z0-9._-]+', '_', str(drug)).strip('_.')[:80] or 'drug'
+    return f"{slug}_{hashlib.sha1(str(drug).encode('utf-8')).hexdigest()[:8]}.html"
+
+
+def drug_page_digest(drug, side_effects, data_format):
+    """
+    Digest of everything a drug's page is rendered from.
+    """
+    payload = json.dumps([DRUG_PAGE_FORMAT, data_format, str(drug), [str(se) for se in side_effects]])
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def drug_page_elements(drug, side_effects):
+    """
+    vis.js nodes and edges of a drug's ego graph, styled as by
+    plugin.generate_graph_for_drug.
+    """
+    drug = str(drug)
+    nodes = [{"id": drug, "label": drug, "shape": "dot", "color": "#636EFA", "size": 30,
+              "title": f"Drug: {drug}", "font": {"color": "#000000"}}]
+    edges = []
+    seen = {drug}
+    for side_effect in map(str, side_effects):
+        if side_effect not in seen:
+            seen.add(side_effect)
+            nodes.append({"id": side_effect, "label": side_effect, "shape": "dot", "color": "#EF553B", "size": 20,
+                          "title": f"Side Effect: {side_effect}", "font": {"color": "#000000"}})
+            edges.append({"from": drug, "to": side_effect, "color": "#A3A3A3", "width": 2})
+    return nodes, edges
+
+
+def _render_drug_page_chunk(task):
+    output_dir, data_format, items = task
+    rendered = []
+    for drug, side_effects, page, digest in items:
+        nodes, edges = drug_page_elements(drug, side_effects)
+        write_vis_page(os.path.join(output_dir, page), nodes, edges, options={}, data_format=data_format,
+                       height="600px", bgcolor="#ffffff", assets=False)
+        rendered.append((drug, page, len(edges), digest))
+    return rendered
+
+
+def _page_is_current(output_dir, entry, digest, data_format):
+    if entry is None or entry.get("digest") != digest:
+        return False
+    stem = os.path.splitext(entry["page"])[0]
+    return (os.path.exists(os.path.join(output_dir, entry["page"]))
+            and os.path.exists(os.path.join(output_dir, DATA_DIR, stem + DATA_FORMATS[data_format])))
+
+
+def _remove_page(output_dir, page):
+    stem = os.path.splitext(page)[0]
+    paths = [os.path.join(output_dir, page)]
+    paths += [os.path.join(output_dir, DATA_DIR, stem + suffix) for suffix in DATA_FORMATS.values()]
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def load_manifest(output_dir):
+    """
+    Pages written by render_drug_pages(): drug -> {page, side_effects, digest}.
+    """
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_index_page(output_dir, manifest):
+    """
+    Write output_dir/index.html linking every page of the manifest.
+    """
+    rows = "\n".join(
+        f'<tr><td><a href="{html.escape(entry["page"])}">{html.escape(drug)}</a></td>'
+        f'<td>{entry["side_effects"]}</td></tr>'
+        for drug, entry in sorted(manifest.items(), key=lambda item: item[0].lower())
+    )
+    path = os.path.join(output_dir, "index.html")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"""<html>
+<head>
+<meta charset="utf-8">
+<title>SideEffectNet drug graphs</title>
+<style>
+  body {{ font-family: sans-serif; margin: 2rem; }}
+  table {{ border-collapse: collapse; }}
+  td, th {{ padding: 0.2rem 1rem; border-bottom: 1px solid #e1e4e8; text-align: left; }}
+</style>
+</head>
+<body>
+<h1>Drug side effect graphs</h1>
+<p>{len(manifest)} drugs</p>
+<input id="filter" placeholder="Filter drugs" oninput="filterRows(this.value)">
+<table>
+<tr><th>Drug</th><th>Side effects</th></tr>
+{rows}
+</table>
+<script>
+function filterRows(text) {{
+  text = text.toLowerCase();
+  document.querySelectorAll("tr").forEach(function (row, i) {{
+    if (i) row.style.display = row.textContent.toLowerCase().includes(text) ? "" : "none";
+  }});
+}}
+</script>
+</body>
+</html>
+""")
+    return path
+
+
+def render_drug_pages(side_effect_lookup, output_dir="drug_pages", drugs=None, workers=None,
+                      data_format="js", force=False):
+    """
+    Render the ego graph page of many drugs at once.
+
+    Pages share one asset directory and keep their data in data/ (see
+    visualize_graph.write_vis_page), and are rendered in chunks across a
+    process pool. A manifest records the digest of each page's inputs, so
+    drugs whose side effects did not change since the last run are skipped
+    unless force is set. When all drugs are rendered, pages of drugs no
+    longer in side_effect_lookup are deleted. An index page links all
+    rendered drugs.
+
+    Args:
+        side_effect_lookup: dict of drug -> list of side effects.
+        drugs: Drugs to render (all of side_effect_lookup by default).
+        workers: Worker processes (os.cpu_count() by default; 1 renders in
+            this process).
+
+    Returns:
+        dict with rendered, skipped, missing (drugs not in the lookup) and
+        removed (stale pages deleted) counts, seconds, pages_per_second and
+        the index path.
+    """
+    start = time.perf_counter()
+    render_all = drugs is None
+    drugs = list(side_effect_lookup) if render_all else list(dict.fromkeys(drugs))
+    os.makedirs(output_dir, exist_ok=True)
+    publish_assets(output_dir)
+    manifest = load_manifest(output_dir)
+
+    pending, skipped, missing = [], 0, 0
+    for drug in drugs:
+        if drug not in side_effect_lookup:
+            missing += 1
+            continue
+        side_effects = list(side_effect_lookup[drug])
+        digest = drug_page_digest(drug, side_effects, data_format)
+        if not force and _page_is_current(output_dir, manifest.get(str(drug)), digest, data_format):
+            skipped += 1
+            continue
+        pending.append((drug, side_effects, drug_page_name(drug), digest))
+
+    tasks = [(output_dir, data_format, pending[i:i + DRUG_PAGE_CHUNK_SIZE])
+             for i in range(0, len(pending), DRUG_PAGE_CHUNK_SIZE)]
+    workers = min(workers or os.cpu_count() or 1, max(len(tasks), 1))
+    if workers > 1:
+        ctx = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as executor:
+            results = list(executor.map(_render_drug_page_chunk, tasks))
+    else:
+        results = [_render_drug_page_chunk(task) for task in tasks]
+
+    for chunk in results:
+        for drug, page, count, digest in chunk:
+            manifest[str(drug)] = {"page": page, "side_effects": count, "digest": digest}
+    removed = 0
+    if render_all:
+        current = {str(drug) for drug in side_effect_lookup}
+        for drug in [drug for drug in manifest if drug not in current]:
+            _remove_page(output_dir, manifest.pop(drug)["page"])
+            removed += 1
+    with open(os.path.join(output_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    index_path = write_index_page(output_dir, manifest)
+
+    seconds = time.perf_counter() - start
+    return {
+        "rendered": len(pending),
+        "skipped": skipped,
+        "missing": missing,
+        "removed": removed,
+        "seconds": round(seconds, 3),
+        "pages_per_second": round(len(pending) / seconds, 1) if seconds > 0 else 0.0,
+        "index": index_path,
+    }
@@ -1,30 +1,309 @@
-import pandas as pd
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
 import networkx as nx
+import pandas as pd
+
+from src.data_store import cache_is_current, dataset_fingerprint, load_clean_table, table_columns
+
+FREQ_STAT_COLUMNS = ['freq_min', 'freq_max', 'freq_count']
+
+SNAPSHOT_DIR = 'data/processed/cache/graph_snapshot'
+SNAPSHOT_FORMAT = 2
 
-def build_side_effect_graph(csv_path):
-    df = pd.read_csv(csv_path)
 
-    G = nx.DiGraph()  # Directed graph
+def drug_node_attrs(name):
+    return {'label': name, 'type': "drug", 'color': "#63b6e5"}  # Blue
 
-    for _, row in df.iterrows():
-        drug = row['drug_name']
-        side_effect = row['side_effect']
-        freq = row['freq_pct']
 
-        # Add nodes
-        # Drug nodes
-        G.add_node(drug, label=drug, type="drug", color="#63b6e5")  # Blue
+def side_effect_node_attrs(name):
+    return {'label': name, 'type': "side_effect", 'color': "#f26c6c"}  # Red
 
-        # Side effect nodes
-        G.add_node(side_effect, label=side_effect, type="side_effect", color="#f26c6c")  # Red
 
-        # Optional: Add for genes later
-        # graph.add_node(gene, label=gene, type="gene", color="#a6e22e")  # Green
+def build_graph_from_columns(drugs, side_effects, edge_attrs, drug_attrs, side_effect_attrs, graph=None):
+    """
+    Bulk-build a drug -> side effect graph from column arrays.
 
-        # Add edge with optional frequency
-        if pd.notnull(freq):
-            G.add_edge(drug, side_effect, relation='causes', frequency=float(freq))
-        else:
-            G.add_edge(drug, side_effect, relation='causes')
+    The result is identical to adding the rows one at a time with
+    add_node(drug), add_node(side_effect), add_edge(drug, side_effect):
+    same node and edge order, and repeated edges update their attributes
+    in row order.
 
+    Args:
+        drugs, side_effects: Sequences of node names, one entry per edge row.
+        edge_attrs: List of attribute dicts, one per edge row.
+        drug_attrs, side_effect_attrs: Callables returning the attribute
+            dict for a drug / side effect node name.
+        graph: Optional graph to add to; a new nx.DiGraph by default.
+
+    Returns:
+        nx.DiGraph
+    """
+    G = nx.DiGraph() if graph is None else graph
+
+    # Row order interleaves drug and side effect nodes
+    names = np.empty(2 * len(drugs), dtype=object)
+    names[0::2] = drugs
+    names[1::2] = side_effects
+    is_drug = np.zeros(len(names), dtype=bool)
+    is_drug[0::2] = True
+
+    # A name used as both kinds keeps the attributes of its last use
+    last_is_drug = dict(zip(names.tolist(), is_drug.tolist()))
+    G.add_nodes_from(
+        (name, drug_attrs(name) if last_is_drug[name] else side_effect_attrs(name))
+        for name in dict.fromkeys(names.tolist())
+    )
+    G.add_edges_from(zip(names[0::2].tolist(), names[1::2].tolist(), edge_attrs))
     return G
+
+
+def side_effect_edge_attributes(df):
+    """
+    Edge attribute dicts for build_side_effect_graph(): relation, and when
+    freq_pct is known, frequency plus the aggregated frequency statistics
+    written by the ETL (freq_min, freq_max, freq_count). Missing statistics
+    columns are skipped so older clean tables still load.
+    """
+    freqs = df['freq_pct'].to_numpy(dtype=float)
+    stat_cols = [col for col in FREQ_STAT_COLUMNS if col in df.columns]
+    stat_values = [df[col].to_numpy(dtype=float).tolist() for col in stat_cols]
+
+    attrs = []
+    for i, freq in enumerate(freqs.tolist()):
+        if np.isnan(freq):
+            attrs.append({'relation': 'causes'})
+            continue
+        edge = {'relation': 'causes', 'frequency': freq}
+        for col, values in zip(stat_cols, stat_values):
+            value = values[i]
+            if not np.isnan(value):
+                edge[col] = int(value) if col == 'freq_count' else float(value)
+        attrs.append(edge)
+    return attrs
+
+
+def build_side_effect_graph(csv_path):
+    available = table_columns(csv_path)
+    columns = [col for col in ['drug_name', 'side_effect', 'freq_pct'] + FREQ_STAT_COLUMNS if col in available]
+    df = load_clean_table(csv_path, columns=columns)
+
+    # Optional: Add for genes later
+    # graph.add_node(gene, label=gene, type="gene", color="#a6e22e")  # Green
+    return build_graph_from_columns(
+        df['drug_name'].to_numpy(dtype=object),
+        df['side_effect'].to_numpy(dtype=object),
+        side_effect_edge_attributes(df),
+        drug_attrs=drug_node_attrs,
+        side_effect_attrs=side_effect_node_attrs,
+    )
+
+
+# === Incremental updates ===
+
+def _delta_rows(df):
+    if df is None or len(df) == 0:
+        return []
+    columns = ['drug_name', 'side_effect'] + [col for col in ['freq_pct'] + FREQ_STAT_COLUMNS if col in df.columns]
+    return df[columns].to_dict('records')
+
+
+def _edge_frequency(graph, drug, side_effect):
+    if graph.has_edge(drug, side_effect):
+        return graph.edges[drug, side_effect].get('frequency')
+    return None
+
+
+def _frame_from_row(row):
+    frame = pd.DataFrame([row])
+    if 'freq_pct' not in frame:
+        frame['freq_pct'] = np.nan
+    return frame
+
+
+def apply_edge_delta(graph, added=None, removed=None, changed=None):
+    """
+    Apply an edge delta to a graph built by build_side_effect_graph(), in
+    place, so that it matches a rebuild from the updated clean table.
+
+    Args:
+        graph: nx.DiGraph to update.
+        added: DataFrame of new rows (drug_name, side_effect, freq_pct and
+            optionally freq_min/freq_max/freq_count). Like rows of the clean
+            table, a row for an existing edge only overwrites attributes it
+            has a frequency for.
+        removed: DataFrame of (drug_name, side_effect) edges to drop. Nodes
+            left without edges are dropped too.
+        changed: DataFrame of existing edges with their new frequency
+            columns; a missing freq_pct clears the edge's frequency.
+
+    Returns:
+        list of (drug, old_frequency, new_frequency) for every edge the delta
+        touched, with None for a missing edge or frequency. Pass it to
+        risk_analyzer.update_risk_scores() to refresh risk scores.
+    """
+    edge_changes = []
+
+    for row in _delta_rows(removed):
+        drug, side_effect = row['drug_name'], row['side_effect']
+        if not graph.has_edge(drug, side_effect):
+            continue
+        edge_changes.append((drug, _edge_frequency(graph, drug, side_effect), None))
+        graph.remove_edge(drug, side_effect)
+        for node in (drug, side_effect):
+            if graph.degree(node) == 0:
+                graph.remove_node(node)
+
+    for row in _delta_rows(added):
+        drug, side_effect = row['drug_name'], row['side_effect']
+        old = _edge_frequency(graph, drug, side_effect)
+        frame = _frame_from_row(row)
+        build_graph_from_columns([drug], [side_effect], side_effect_edge_attributes(frame),
+                                 drug_node_attrs, side_effect_node_attrs, graph=graph)
+        edge_changes.append((drug, old, _edge_frequency(graph, drug, side_effect)))
+
+    for row in _delta_rows(changed):
+        drug, side_effect = row['drug_name'], row['side_effect']
+        if not graph.has_edge(drug, side_effect):
+            continue
+        old = _edge_frequency(graph, drug, side_effect)
+        edge = graph.edges[drug, side_effect]
+        for key in ['frequency'] + FREQ_STAT_COLUMNS:
+            edge.pop(key, None)
+        edge.update(side_effect_edge_attributes(_frame_from_row(row))[0])
+        edge_changes.append((drug, old, edge.get('frequency')))
+
+    return edge_changes
+
+
+# === Graph snapshots ===
+
+def save_graph_snapshot(graph, snapshot_dir=SNAPSHOT_DIR, fingerprint=None):
+    """
+    Save a built graph as a binary snapshot directory: the CSR arrays of its
+    SparseSideEffectGraph form as .npy files (so they can be memory-mapped),
+    its node and edge order, and a meta.json with the node vocabularies and
+    the dataset fingerprint.
+
+    The snapshot is written to a temporary directory next to snapshot_dir
+    and renamed into place, so a failed save leaves the previous snapshot
+    intact. Files are never rewritten in place: processes that still have
+    the previous snapshot memory-mapped keep reading its (unlinked) files.
+
+    Args:
+        graph: nx.DiGraph from build_side_effect_graph() or a SparseSideEffectGraph.
+        snapshot_dir: Directory to write; created if needed.
+        fingerprint: Dataset fingerprint the graph was built from.
+    """
+    from src.sparse_graph import SparseSideEffectGraph
+
+    if isinstance(graph, nx.DiGraph):
+        graph = SparseSideEffectGraph.from_networkx(graph, dtype=np.float64, edge_attributes=FREQ_STAT_COLUMNS)
+    snapshot_dir = os.path.abspath(snapshot_dir)
+    parent = os.path.dirname(snapshot_dir)
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=f'.{os.path.basename(snapshot_dir)}-', dir=parent)
+    # mkdtemp() makes the directory private; snapshots are shared
+    os.chmod(tmp_dir, 0o755)
+    old_dir = None
+    try:
+        _write_snapshot(graph, tmp_dir, fingerprint)
+        # A directory cannot be renamed over a non-empty one: move the old
+        # snapshot aside first, then drop it
+        if os.path.exists(snapshot_dir):
+            old_dir = tmp_dir + '.old'
+            os.replace(snapshot_dir, old_dir)
+        os.replace(tmp_dir, snapshot_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    if old_dir is not None:
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def _write_snapshot(graph, snapshot_dir, fingerprint):
+    matrix = graph.matrix
+    index_dtype = np.int32 if matrix.nnz < np.iinfo(np.int32).max else np.int64
+    arrays = {
+        'indptr': matrix.indptr.astype(index_dtype),
+        'indices': matrix.indices.astype(index_dtype),
+        'freq': matrix.data,
+    }
+    arrays.update({f'edge_{name}': values for name, values in graph.edge_data.items()})
+    if graph.node_order is not None:
+        arrays['node_order'] = graph.node_order
+        arrays['edge_order'] = graph.edge_order.astype(index_dtype)
+    for name, values in arrays.items():
+        np.save(os.path.join(snapshot_dir, f'{name}.npy'), values)
+
+    meta = {
+        'format': SNAPSHOT_FORMAT,
+        'fingerprint': fingerprint,
+        'shape': list(matrix.shape),
+        'edge_data': list(graph.edge_data),
+        'ordered': graph.node_order is not None,
+        'drug_names': graph.drug_names,
+        'side_effect_names': graph.side_effect_names,
+    }
+    with open(os.path.join(snapshot_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+
+def load_graph_snapshot(snapshot_dir=SNAPSHOT_DIR, fingerprint=None, mmap=True):
+    """
+    Load a snapshot written by save_graph_snapshot() as a SparseSideEffectGraph.
+
+    With mmap=True the arrays are memory-mapped read-only, so processes that
+    load the same snapshot share its pages.
+
+    Returns:
+        SparseSideEffectGraph, or None if there is no snapshot or
+        data_store.cache_is_current() rejects it.
+    """
+    import scipy.sparse as sp
+    from src.sparse_graph import SparseSideEffectGraph
+
+    try:
+        with open(os.path.join(snapshot_dir, 'meta.json')) as f:
+            meta = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if not cache_is_current(meta.get('format'), meta.get('fingerprint'), SNAPSHOT_FORMAT, fingerprint):
+        return None
+
+    def load(name):
+        return np.load(os.path.join(snapshot_dir, f'{name}.npy'), mmap_mode='r' if mmap else None)
+
+    matrix = sp.csr_matrix((load('freq'), load('indices'), load('indptr')), shape=tuple(meta['shape']), copy=False)
+    edge_data = {name: load(f'edge_{name}') for name in meta['edge_data']}
+    order = {name: load(name) for name in ('node_order', 'edge_order')} if meta.get('ordered') else {}
+    return SparseSideEffectGraph(matrix, meta['drug_names'], meta['side_effect_names'], edge_data, **order)
+
+
+def load_or_build_graph(csv_path, snapshot_dir=SNAPSHOT_DIR, as_networkx=True):
+    """
+    Return the graph for a clean table, reusing the snapshot when it was
+    built from the same data, and building and saving it otherwise.
+
+    Args:
+        as_networkx: Return an nx.DiGraph; with False the
+            SparseSideEffectGraph is returned as is, which skips rebuilding
+            the nx graph when the snapshot is reused.
+
+    Returns:
+        nx.DiGraph equivalent to build_side_effect_graph(csv_path), with the
+        same node and edge order, or its SparseSideEffectGraph.
+    """
+    from src.sparse_graph import SparseSideEffectGraph
+
+    fingerprint = dataset_fingerprint(csv_path)
+    snapshot = load_graph_snapshot(snapshot_dir, fingerprint)
+    if snapshot is not None:
+        return snapshot.to_networkx() if as_networkx else snapshot
+
+    G = build_side_effect_graph(csv_path)
+    sparse = SparseSideEffectGraph.from_networkx(G, dtype=np.float64, edge_attributes=FREQ_STAT_COLUMNS)
+    save_graph_snapshot(sparse, snapshot_dir, fingerprint)
+    return G if as_networkx else sparse
@@ -0,0 +1,60 @@
+import networkx as nx
+import numpy as np
+
+
+def detect_clusters(graph, max_cluster_size=500, seed=0):
+    """
+    Split a drug-side effect graph into communities of at most
+    max_cluster_size nodes.
+
+    Louvain communities of the undirected graph; a community that is still
+    too big is split by Louvain on its own subgraph, and cut into chunks
+    when that does not split it any further.
+
+    Returns:
+        list of node lists, largest cluster first.
+    """
+    undirected = nx.Graph(graph)
+    pending = [list(graph.nodes)]
+    clusters = []
+    while pending:
+        nodes = pending.pop()
+        if len(nodes) <= max_cluster_size:
+            clusters.append(nodes)
+            continue
+        subgraph = undirected if len(nodes) == len(undirected) else undirected.subgraph(nodes).copy()
+        parts = nx.community.louvain_communities(subgraph, seed=seed)
+        if len(parts) > 1:
+            pending.extend(list(part) for part in parts)
+        else:
+            clusters.extend(nodes[start:start + max_cluster_size]
+                            for start in range(0, len(nodes), max_cluster_size))
+    order = {node: i for i, node in enumerate(graph.nodes)}
+    clusters = [sorted(cluster, key=order.__getitem__) for cluster in clusters if cluster]
+    return sorted(clusters, key=lambda cluster: (-len(cluster), order[cluster[0]]))
+
+
+def cluster_edges(graph, clusters):
+    """
+    Count the edges within and between clusters.
+
+    Returns:
+        (membership, counts): node -> cluster id dict, and a dict of
+        (cluster id, cluster id) -> edge count with the smaller id first.
+    """
+    membership = {node: c for c, cluster in enumerate(clusters) for node in cluster}
+    ids = np.array([(membership[u], membership[v]) for u, v in graph.edges()], dtype=np.int64).reshape(-1, 2)
+    ids.sort(axis=1)
+    pairs, counts = np.unique(ids, axis=0, return_counts=True)
+    return membership, {(int(a), int(b)): int(n) for (a, b), n in zip(pairs.tolist(), counts.tolist())}
+
+
+def cluster_risk(graph, cluster):
+    """
+    Mean and max risk_score of the drugs of a cluster (None without any).
+    """
+    scores = [graph.nodes[node]['risk_score'] for node in cluster
+              if graph.nodes[node].get('type') == 'drug' and graph.nodes[node].get('risk_score') is not None]
+    if not scores:
+        return None, None
+    return float(np.mean(scores)), float(np.max(scores))
@@ -0,0 +1,82 @@
+import numpy as np
+
+# Nodes whose repulsion is computed per block of the force layout
+LAYOUT_BLOCK_SIZE = 2048
+
+
+def graph_edge_arrays(graph):
+    """
+    Nodes of a networkx graph and its edges as node id arrays.
+
+    Returns:
+        (nodes, src, dst): node list and int64 arrays of edge endpoint ids.
+    """
+    nodes = list(graph.nodes)
+    index = {node: i for i, node in enumerate(nodes)}
+    edges = np.array([(index[u], index[v]) for u, v in graph.edges()], dtype=np.int64).reshape(-1, 2)
+    return nodes, edges[:, 0], edges[:, 1]
+
+
+def force_layout(n_nodes, src, dst, iterations=50, sample_size=256, gravity=0.05, seed=0):
+    """
+    Fruchterman-Reingold force-directed layout, vectorized with NumPy.
+
+    Edges pull their endpoints together (d^2 / k) and nodes push each other
+    apart (k^2 / d). Repulsion is estimated each iteration against a random
+    sample of sample_size nodes, scaled up to the whole graph, so an
+    iteration costs O(n * sample_size + edges) instead of O(n^2). A weak
+    gravity towards the origin keeps disconnected components together.
+
+    Returns:
+        (n_nodes, 2) float64 array of positions with an ideal edge length of 1.
+    """
+    rng = np.random.default_rng(seed)
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    extent = np.sqrt(max(n_nodes, 1))
+    pos = rng.uniform(-extent, extent, size=(n_nodes, 2))
+    if n_nodes < 2:
+        return pos * 0.0
+
+    sample_size = min(sample_size, n_nodes)
+    scale = n_nodes / sample_size
+    temperature = extent / 5
+    cooling = temperature / (iterations + 1)
+    for _ in range(iterations):
+        disp = np.zeros_like(pos)
+
+        sample = pos[rng.choice(n_nodes, sample_size, replace=False)]
+        for start in range(0, n_nodes, LAYOUT_BLOCK_SIZE):
+            block = pos[start:start + LAYOUT_BLOCK_SIZE]
+            dx = block[:, 0, None] - sample[None, :, 0]
+            dy = block[:, 1, None] - sample[None, :, 1]
+            # A node never repels itself: its own sample entry has dx = dy = 0
+            inverse = scale / np.maximum(dx * dx + dy * dy, 1e-2)
+            disp[start:start + LAYOUT_BLOCK_SIZE, 0] += (dx * inverse).sum(axis=1)
+            disp[start:start + LAYOUT_BLOCK_SIZE, 1] += (dy * inverse).sum(axis=1)
+
+        if len(src):
+            delta = pos[src] - pos[dst]
+            pull = delta * np.sqrt(np.einsum('ij,ij->i', delta, delta))[:, None]
+            for axis in range(2):
+                disp[:, axis] -= np.bincount(src, weights=pull[:, axis], minlength=n_nodes)
+                disp[:, axis] += np.bincount(dst, weights=pull[:, axis], minlength=n_nodes)
+
+        disp -= gravity * pos
+        # Move each node along its displacement, by at most the temperature
+        length = np.maximum(np.sqrt(np.einsum('ij,ij->i', disp, disp)), 1e-9)
+        pos += disp * (np.minimum(length, temperature) / length)[:, None]
+        temperature -= cooling
+    return pos - pos.mean(axis=0)
+
+
+def node_positions(graph, iterations=50, spacing=60.0, seed=0):
+    """
+    Force layout of a networkx graph in vis.js canvas coordinates.
+
+    Returns:
+        dict of node -> (x, y), with edges about spacing pixels long.
+    """
+    nodes, src, dst = graph_edge_arrays(graph)
+    pos = force_layout(len(nodes), src, dst, iterations=iterations, seed=seed) * spacing
+    return {node: (round(float(x), 1), round(float(y), 1)) for node, (x, y) in zip(nodes, pos.tolist())}
@@ -0,0 +1,355 @@
+import numpy as np
+import scipy.sparse as sp
+
+from src.data_store import dataset_fingerprint, load_cache, load_clean_table, save_cache
+from src.sparse_graph import SparseSideEffectGraph
+
+MINHASH_PATH = 'data/processed/cache/minhash_index.npz'
+MINHASH_FORMAT = 2
+# Default signature length, bands and hash seed of from_sets()
+MINHASH_NUM_PERM = 128
+MINHASH_BANDS = 32
+MINHASH_SEED = 0
+
+# Universal hashing h(x) = (a * x + b) mod p stays within uint64 for
+# element ids below 2**31
+MERSENNE_PRIME = (1 << 31) - 1
+EMPTY_HASH = MERSENNE_PRIME
+
+# Permutations hashed per pass in the bulk build
+PERMUTATION_BLOCK = 16
+
+
+class MinHashLSHIndex:
+    """
+    Approximate similar-drug index over side effect sets: MinHash signatures
+    with LSH banding.
+
+    Every drug gets a num_perm MinHash signature of its side effect ids. The
+    signature is cut into `bands` bands of num_perm // bands rows, and drugs
+    whose signatures agree on a whole band share a bucket. A query only
+    looks at the drugs sharing a bucket with it, so its cost depends on the
+    number of candidates rather than on the catalogue size.
+
+    Recall / latency trade-off: drugs with Jaccard similarity s become
+    candidates with probability 1 - (1 - s**r)**b (r rows per band, b bands),
+    which rises steeply around threshold() ~ (1 / b) ** (1 / r). More bands
+    (fewer rows each) find more distant neighbours at the cost of more
+    candidates; queries can also use only the first `bands` bands.
+
+    Drugs without side effects are never returned.
+    """
+    def __init__(self, signatures, band_keys, band_order, drug_names, side_effect_names,
+                 hash_a, hash_b, bands, sets=None, fingerprint=None, seed=None):
+        self.signatures = np.asarray(signatures)
+        self.band_keys = np.asarray(band_keys)
+        self.band_order = np.asarray(band_order)
+        self.drug_names = list(drug_names)
+        self.side_effect_names = list(side_effect_names)
+        self.hash_a = np.asarray(hash_a, dtype=np.uint64)
+        self.hash_b = np.asarray(hash_b, dtype=np.uint64)
+        self.bands = int(bands)
+        self.sets = sets
+        self.fingerprint = fingerprint
+        self.seed = seed
+        self.drug_index = {name: i for i, name in enumerate(self.drug_names)}
+        self.side_effect_index = {name: j for j, name in enumerate(self.side_effect_names)}
+        self._band_mixers = _band_mixers(self.rows_per_band)
+
+    @property
+    def num_perm(self):
+        return self.signatures.shape[1]
+
+    @property
+    def rows_per_band(self):
+        return self.num_perm // self.bands
+
+    def threshold(self):
+        """
+        Jaccard similarity at which a pair becomes a candidate with
+        probability of about one half.
+        """
+        return (1.0 / self.bands) ** (1.0 / self.rows_per_band)
+
+    # === Construction ===
+
+    @classmethod
+    def from_sets(cls, matrix, drug_names, side_effect_names, num_perm=MINHASH_NUM_PERM, bands=MINHASH_BANDS,
+                  seed=MINHASH_SEED, fingerprint=None):
+        """
+        Bulk-build from a drug x side effect sparse matrix (any stored entry
+        is a member of the drug's set).
+
+        Args:
+            num_perm: Signature length; must be a multiple of bands.
+            bands: Number of LSH bands.
+            seed: Seed of the hash functions.
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        sets = sp.csr_matrix(matrix, copy=True)
+        sets.sum_duplicates()
+        sets.sort_indices()
+        sets.data = np.ones(len(sets.indices), dtype=np.int8)
+
+        rng = np.random.default_rng(seed)
+        hash_a = rng.integers(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        hash_b = rng.integers(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        signatures = _minhash_rows(sets.indices, sets.indptr, hash_a, hash_b)
+        band_keys, band_order = _bucket_bands(signatures, bands)
+        return cls(signatures, band_keys, band_order, drug_names, side_effect_names,
+                   hash_a, hash_b, bands, sets, fingerprint, seed)
+
+    @classmethod
+    def from_graph(cls, graph, **kwargs):
+        """
+        Bulk-build from a SparseSideEffectGraph.
+        """
+        return cls.from_sets(graph.matrix, graph.drug_names, graph.side_effect_names, **kwargs)
+
+    @classmethod
+    def from_lookup(cls, side_effect_lookup, **kwargs):
+        """
+        Bulk-build from a drug -> list of side effects dict, like the
+        dashboard's side_effect_lookup.
+        """
+        drug_names = list(side_effect_lookup)
+        side_effect_names = sorted({se for effects in side_effect_lookup.values() for se in effects})
+        se_index = {name: j for j, name in enumerate(side_effect_names)}
+        indptr, indices = [0], []
+        for effects in side_effect_lookup.values():
+            indices.extend(se_index[se] for se in effects)
+            indptr.append(len(indices))
+        matrix = sp.csr_matrix((np.ones(len(indices), dtype=np.int8), indices, indptr),
+                               shape=(len(drug_names), len(side_effect_names)))
+        return cls.from_sets(matrix, drug_names, side_effect_names, **kwargs)
+
+    # === Persistence ===
+
+    def save(self, path=MINHASH_PATH):
+        arrays = {}
+        if self.sets is not None:
+            arrays = {'set_indptr': self.sets.indptr, 'set_indices': self.sets.indices}
+        save_cache(path, MINHASH_FORMAT, self.fingerprint, bands=self.bands,
+                   seed=-1 if self.seed is None else self.seed,
+                   signatures=self.signatures, band_keys=self.band_keys, band_order=self.band_order,
+                   hash_a=self.hash_a, hash_b=self.hash_b,
+                   drug_names=np.array(self.drug_names, dtype=str),
+                   side_effect_names=np.array(self.side_effect_names, dtype=str), **arrays)
+
+    @classmethod
+    def load(cls, path=MINHASH_PATH, fingerprint=None):
+        """
+        Load an index written by save(); None unless data_store.load_cache()
+        accepts the file.
+        """
+        data = load_cache(path, MINHASH_FORMAT, fingerprint)
+        if data is None:
+            return None
+        drug_names = data['drug_names'].tolist()
+        side_effect_names = data['side_effect_names'].tolist()
+        sets = None
+        if 'set_indptr' in data:
+            indices = data['set_indices']
+            sets = sp.csr_matrix((np.ones(len(indices), dtype=np.int8), indices, data['set_indptr']),
+                                 shape=(len(drug_names), len(side_effect_names)))
+        seed = int(data['seed'])
+        return cls(data['signatures'], data['band_keys'], data['band_order'], drug_names,
+                   side_effect_names, data['hash_a'], data['hash_b'], int(data['bands']), sets,
+                   data['fingerprint'], None if seed < 0 else seed)
+
+    # === Queries ===
+
+    def signature(self, side_effects):
+        """
+        MinHash signature of a set of side effect names. Names outside the
+        vocabulary count as elements no indexed drug has.
+        """
+        ids, unknown = [], 0
+        for se in set(side_effects):
+            j = self.side_effect_index.get(se)
+            if j is None:
+                j = len(self.side_effect_names) + unknown
+                unknown += 1
+            ids.append(j)
+        ids = np.array(sorted(ids), dtype=np.int64)
+        return _minhash_rows(ids, np.array([0, len(ids)]), self.hash_a, self.hash_b)[0]
+
+    def candidates(self, signature, bands=None):
+        """
+        Ids of the drugs sharing at least one band bucket with a signature,
+        looking at the first `bands` bands (all by default).
+        """
+        bands = self.bands if bands is None else min(bands, self.bands)
+        if (signature == EMPTY_HASH).all():
+            return np.empty(0, dtype=np.int64)
+        keys = _band_hashes(signature[None, :], self.bands, self._band_mixers)[0][:bands]
+        lo = np.searchsorted(self.band_keys, keys, side='left')
+        hi = np.searchsorted(self.band_keys, keys, side='right')
+        return np.unique(self.band_order[_ranges(lo, hi)]).astype(np.int64)
+
+    def query(self, drug=None, side_effects=None, top_k=10, min_similarity=0.0, bands=None, exact=False):
+        """
+        Drugs whose side effect profile resembles a drug's or a given set.
+
+        Args:
+            drug: Indexed drug name to find neighbours of (it is excluded
+                from the result), or
+            side_effects: Iterable of side effect names.
+            top_k: Maximum number of neighbours.
+            min_similarity: Minimum (estimated or exact) Jaccard similarity.
+            bands: Use only the first `bands` bands: faster, lower recall.
+            exact: Rank candidates by exact Jaccard similarity instead of the
+                MinHash estimate (needs the stored sets).
+
+        Returns:
+            list of (drug_name, similarity) tuples, most similar first, ties
+            in drug id order.
+        """
+        if drug is not None:
+            if drug not in self.drug_index:
+                return []
+            query_id = self.drug_index[drug]
+            signature = self.signatures[query_id]
+        else:
+            query_id = None
+            signature = self.signature(side_effects)
+
+        ids = self.candidates(signature, bands)
+        if query_id is not None:
+            ids = ids[ids != query_id]
+        if len(ids) == 0:
+            return []
+
+        if exact:
+            similarity = self._exact_jaccard(ids, query_id, side_effects)
+        else:
+            similarity = (self.signatures[ids] == signature).mean(axis=1)
+        keep = similarity >= min_similarity
+        ids, similarity = ids[keep], similarity[keep]
+        order = np.lexsort((ids, -similarity))[:top_k]
+        return [(self.drug_names[i], float(s)) for i, s in zip(ids[order].tolist(), similarity[order].tolist())]
+
+    def overlap_counts(self, drugs, side_effects):
+        """
+        Number of the given side effects each indexed drug has (needs the
+        stored sets).
+
+        Returns:
+            dict of drug_name -> count, in the order of drugs.
+        """
+        drugs = [drug for drug in drugs if drug in self.drug_index]
+        ids = np.array([self.drug_index[drug] for drug in drugs], dtype=np.int64)
+        shared, _ = self._shared_counts(ids, None, side_effects)
+        return dict(zip(drugs, shared.astype(int).tolist()))
+
+    def _shared_counts(self, ids, query_id, side_effects):
+        if self.sets is None:
+            raise ValueError("exact similarity needs an index built with its sets")
+        indptr, indices = self.sets.indptr, self.sets.indices
+        if query_id is not None:
+            query = indices[indptr[query_id]:indptr[query_id + 1]]
+            query_size = len(query)
+        else:
+            side_effects = set(side_effects)
+            query = np.array(sorted(self.side_effect_index[se] for se in side_effects
+                                    if se in self.side_effect_index), dtype=indices.dtype)
+            query_size = len(side_effects)
+        starts, ends = indptr[ids], indptr[ids + 1]
+        members = np.isin(indices[_ranges(starts, ends)], query, assume_unique=True)
+        sizes = ends - starts
+        shared = np.add.reduceat(members, np.r_[0, np.cumsum(sizes)[:-1]]) if len(ids) else members
+        shared = np.where(sizes > 0, shared, 0)
+        return shared, sizes + query_size - shared
+
+    def _exact_jaccard(self, ids, query_id, side_effects):
+        shared, union = self._shared_counts(ids, query_id, side_effects)
+        return shared / np.maximum(union, 1)
+
+
+def _ranges(starts, ends):
+    """
+    Concatenation of np.arange(start, end) for every (start, end) pair.
+    """
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.r_[0, np.cumsum(lengths)[:-1]], lengths)
+    return np.arange(total) + offsets
+
+
+def _minhash_rows(indices, indptr, hash_a, hash_b):
+    """
+    MinHash signatures (uint32, EMPTY_HASH for empty sets) of the CSR rows
+    given by indices / indptr, hashed PERMUTATION_BLOCK permutations at a
+    time to bound memory.
+    """
+    n_rows = len(indptr) - 1
+    num_perm = len(hash_a)
+    signatures = np.full((n_rows, num_perm), EMPTY_HASH, dtype=np.uint32)
+    lengths = np.diff(indptr)
+    nonempty = np.flatnonzero(lengths > 0)
+    if len(nonempty) == 0:
+        return signatures
+    starts = np.asarray(indptr)[nonempty]
+    elements = np.asarray(indices, dtype=np.uint64)
+    for start in range(0, num_perm, PERMUTATION_BLOCK):
+        a = hash_a[start:start + PERMUTATION_BLOCK, None]
+        b = hash_b[start:start + PERMUTATION_BLOCK, None]
+        hashed = (a * elements[None, :] + b) % np.uint64(MERSENNE_PRIME)
+        signatures[nonempty, start:start + PERMUTATION_BLOCK] = np.minimum.reduceat(hashed, starts, axis=1).T
+    return signatures
+
+
+def _band_mixers(rows_per_band):
+    # Fixed odd multipliers, so band hashes agree across builds and loads
+    rng = np.random.default_rng(0x5EED)
+    return rng.integers(1, np.iinfo(np.int64).max, size=rows_per_band, dtype=np.uint64) | np.uint64(1)
+
+
+def _band_hashes(signatures, bands, mixers):
+    """
+    One uint64 key per (row, band): a multiply-add hash of the band's
+    signature values, salted with the band number so that the keys of all
+    bands can share one sorted array.
+    """
+    n_rows, num_perm = signatures.shape
+    rows = num_perm // bands
+    values = signatures.reshape(n_rows, bands, rows).astype(np.uint64)
+    salt = np.arange(bands, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    with np.errstate(over='ignore'):
+        return (values * mixers[None, None, :]).sum(axis=2, dtype=np.uint64) + salt[None, :]
+
+
+def _bucket_bands(signatures, bands):
+    """
+    The sorted bucket keys of all (non-empty drug, band) pairs and the drug
+    ids in the same order, so a bucket is a searchsorted range.
+    """
+    keys = _band_hashes(signatures, bands, _band_mixers(signatures.shape[1] // bands))
+    nonempty = np.flatnonzero((signatures != EMPTY_HASH).any(axis=1))
+    keys = keys[nonempty].ravel()
+    drug_ids = np.repeat(nonempty, bands).astype(np.int32)
+    order = np.argsort(keys, kind='stable')
+    return keys[order], drug_ids[order]
+
+
+def load_or_build_minhash_index(csv_path, index_path=MINHASH_PATH, **kwargs):
+    """
+    Return the MinHash index of a clean table, reusing the saved index when
+    it was built from the same data and parameters, and building and saving
+    it otherwise. kwargs are passed to MinHashLSHIndex.from_sets().
+    """
+    fingerprint = dataset_fingerprint(csv_path)
+    index = MinHashLSHIndex.load(index_path, fingerprint)
+    params = (kwargs.get('num_perm', MINHASH_NUM_PERM), kwargs.get('bands', MINHASH_BANDS),
+              kwargs.get('seed', MINHASH_SEED))
+    if index is not None and (index.num_perm, index.bands, index.seed) != params:
+        index = None
+    if index is None:
+        df = load_clean_table(csv_path, columns=['drug_name', 'side_effect', 'freq_pct'])
+        graph = SparseSideEffectGraph.from_edge_table(df)
+        index = MinHashLSHIndex.from_graph(graph, fingerprint=fingerprint, **kwargs)
+        index.save(index_path)
+    return index
@@ -62,9 +62,17 @@ class DrugRiskAnalysisPlugin(PluginBase):
 # Update the ElizaDashboardPlugin to use cleaned data from the workspace
 import pandas as pd
 import os
+import sys
 import json
 import tempfile
 
+# Allow running as `python src/plugin.py` from the project root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from src.data_store import dataset_fingerprint, has_columnar_store, load_clean_table
+from src.drug_pages import render_drug_pages
+from src.side_effect_index import load_or_build_index
+from src.similarity_store import SimilarityStore, pair_similarities
+
 class ElizaDashboardPlugin(PluginBase):
     """
     Plugin for integrating Eliza AI functionalities into the dashboard.
@@ -89,19 +97,28 @@ class ElizaDashboardPlugin(PluginBase):
         try:
             print("Attempting to load side effect lookup...")
             file_path = os.path.join(os.path.dirname(__file__), "../data/processed/side_effects_clean.csv")
-            print(f"Checking if file exists: {os.path.exists(file_path)}")
+            print(f"Checking if file exists: {os.path.exists(file_path) or has_columnar_store(file_path)}")
+            edges = load_clean_table(file_path, columns=["drug_name", "side_effect", "freq_pct"])
+            self.side_effect_edges = edges
             self.side_effect_lookup = {
                 drug: list(group["side_effect"])
-                for drug, group in pd.read_csv(file_path).groupby("drug_name")
+                for drug, group in edges.groupby("drug_name", observed=True)
             }
             print("Side effect lookup loaded successfully.")
         except FileNotFoundError:
+            self.side_effect_edges = None
             self.side_effect_lookup = {}
             print("Error: side_effects_clean.csv file not found.")
         except Exception as e:
+            self.side_effect_edges = None
             self.side_effect_lookup = {}
             print(f"Error loading side effect lookup: {e}")
 
+        # Side effect -> drugs index and similarity store, loaded on first use
+        self.side_effect_index = None
+        self.similarity_store = None
+        self.similarity_store_checked = False
+
     def execute(self, action, *args, **kwargs):
         """
         Execute specific actions related to the dashboard.
@@ -116,6 +133,10 @@ class ElizaDashboardPlugin(PluginBase):
             return self.generate_hypotheses(*args, **kwargs)
         elif action == "generate_pdf":
             return self.generate_pdf(*args, **kwargs)
+        elif action == "drugs_for_side_effect":
+            return self.drugs_for_side_effect(*args, **kwargs)
+        elif action == "render_drug_pages":
+            return self.render_drug_pages(*args, **kwargs)
         else:
             return {"error": "Unknown action."}
 
@@ -194,13 +215,69 @@ class ElizaDashboardPlugin(PluginBase):
         side_effects_b = set(self.side_effect_lookup.get(drug_b, []))
         overlapping = side_effects_a & side_effects_b
 
-        return {
+        result = {
             "drug_a": drug_a,
             "drug_b": drug_b,
             "risk_a": risk_a,
             "risk_b": risk_b,
             "shared_side_effects": list(overlapping)
         }
+        similarity_store = self.get_similarity_store()
+        if similarity_store is not None:
+            result.update(similarity_store.similarities(drug_a, drug_b))
+        elif self.side_effect_edges is not None:
+            result.update(pair_similarities(self.side_effect_edges, drug_a, drug_b))
+        return result
+
+    def get_similarity_store(self):
+        """
+        Drug-drug similarity store saved for the current clean data (e.g. by
+        the dashboard), loaded on first use. None if there is no such store;
+        this is checked once, and the store is never built here, as one pair
+        is cheaper to compute on its own.
+        """
+        if not self.similarity_store_checked:
+            self.similarity_store_checked = True
+            try:
+                file_path = os.path.join(os.path.dirname(__file__), "../data/processed/side_effects_clean.csv")
+                store_path = os.path.join(os.path.dirname(__file__), "../data/processed/cache/similarity_store.npz")
+                self.similarity_store = SimilarityStore.load(store_path, dataset_fingerprint(file_path))
+            except Exception as e:
+                print(f"Error loading similarity store: {e}")
+        return self.similarity_store
+
+    def drugs_for_side_effect(self, side_effect, top_k=10):
+        """
+        List the drugs causing a side effect, ranked by frequency.
+        """
+        if self.side_effect_index is None:
+            try:
+                file_path = os.path.join(os.path.dirname(__file__), "../data/processed/side_effects_clean.csv")
+                index_path = os.path.join(os.path.dirname(__file__), "../data/processed/cache/side_effect_index.npz")
+                self.side_effect_index = load_or_build_index(file_path, index_path)
+            except Exception as e:
+                return {"error": f"Error loading side effect index: {e}"}
+
+        if side_effect not in self.side_effect_index:
+            return {"error": f"Side effect '{side_effect}' not found in side effect index."}
+
+        return {
+            "side_effect": side_effect,
+            "drugs": [
+                {"drug_name": drug, "frequency": freq}
+                for drug, freq in self.side_effect_index.drugs_for(side_effect, top_k=top_k)
+            ]
+        }
+
+    def render_drug_pages(self, output_dir="drug_pages", drugs=None, workers=None, force=False):
+        """
+        Render the graph page of the given drugs (all by default) into
+        output_dir, skipping pages whose inputs did not change.
+        """
+        if not self.side_effect_lookup:
+            return {"error": "Side effect lookup is empty or failed to load."}
+        return render_drug_pages(self.side_effect_lookup, output_dir=output_dir, drugs=drugs,
+                                 workers=workers, force=force)
 
     # Update the generate_pdf method to include detailed risk scores and shared side effects
     def generate_pdf(self, drug_a, drug_b, hypotheses):
@@ -236,9 +313,11 @@ class ElizaDashboardPlugin(PluginBase):
         buffer.seek(0)
         return buffer
 
-def generate_graph_for_drug(drug_name, side_effect_lookup):
+def generate_graph_for_drug(drug_name, side_effect_lookup, output_dir=None):
         """
-        Generate graph visualization for a given drug and save it as an HTML file.
+        Generate graph visualization for a given drug and save it as an HTML file
+        in output_dir (the Downloads directory by default). See
+        drug_pages.render_drug_pages for rendering many drugs at once.
         """
         if drug_name not in side_effect_lookup:
             return {"error": f"Drug '{drug_name}' not found in side effect lookup."}
@@ -257,8 +336,9 @@ def generate_graph_for_drug(drug_name, side_effect_lookup):
 
         # Save graph visualization to an HTML file in the Downloads directory
         import os
-        downloads_dir = os.path.join(os.path.expanduser("~"), "Downloads")
-        html_file_path = os.path.join(downloads_dir, f"{drug_name}_graph.html")
+        if output_dir is None:
+            output_dir = os.path.join(os.path.expanduser("~"), "Downloads")
+        html_file_path = os.path.join(output_dir, f"{drug_name}_graph.html")
         net.save_graph(html_file_path)
 
         return html_file_path
@@ -273,19 +353,23 @@ class DrugInteractionPlugin(PluginBase):
     def __init__(self):
         super().__init__(name="DrugInteractionPlugin", version="1.0")
 
-    def execute(self, drug_a, drug_b, side_effect_lookup):
+    def execute(self, drug_a, drug_b, side_effect_lookup, similarity_store=None):
         """
         Analyze interactions between two drugs based on shared side effects.
+        With a SimilarityStore, the profile similarities are included.
         """
         side_effects_a = set(side_effect_lookup.get(drug_a, []))
         side_effects_b = set(side_effect_lookup.get(drug_b, []))
         shared_side_effects = side_effects_a & side_effects_b
 
-        return {
+        result = {
             "drug_a": drug_a,
             "drug_b": drug_b,
             "shared_side_effects": list(shared_side_effects)
         }
+        if similarity_store is not None:
+            result.update(similarity_store.similarities(drug_a, drug_b))
+        return result
 
 class RiskVisualizationPlugin(PluginBase):
     """
@@ -326,12 +410,18 @@ class ElizaCLI:
 
     def run(self):
         parser = argparse.ArgumentParser(description="Eliza AI Plugin CLI")
-        parser.add_argument("action", type=str, help="Action to perform (analyze_risk, generate_hypotheses, generate_pdf, validate_data, generate_graph)")
+        parser.add_argument("action", type=str, help="Action to perform (analyze_risk, generate_hypotheses, generate_pdf, validate_data, generate_graph, drugs_for_side_effect, render_drug_pages)")
         parser.add_argument("--drug_name", type=str, help="Drug name for risk analysis")
         parser.add_argument("--drug_a", type=str, help="First drug name for hypothesis generation")
         parser.add_argument("--drug_b", type=str, help="Second drug name for hypothesis generation")
         parser.add_argument("--file_path", type=str, help="Path to the data file for validation")
         parser.add_argument("--graph_data", type=str, help="Path to graph data JSON file")
+        parser.add_argument("--side_effect", type=str, help="Side effect name for drugs_for_side_effect")
+        parser.add_argument("--top_k", type=int, default=10, help="Number of drugs to list for drugs_for_side_effect")
+        parser.add_argument("--output_dir", type=str, default="drug_pages", help="Output directory for render_drug_pages")
+        parser.add_argument("--drugs", type=str, nargs="*", help="Drugs to render for render_drug_pages (all by default)")
+        parser.add_argument("--workers", type=int, help="Worker processes for render_drug_pages")
+        parser.add_argument("--force", action="store_true", help="Re-render unchanged pages in render_drug_pages")
 
         args = parser.parse_args()
 
@@ -375,6 +465,18 @@ class ElizaCLI:
             result = self.plugin.execute("generate_graph", graph_data)
             print(result)
 
+        elif args.action == "drugs_for_side_effect":
+            if not args.side_effect:
+                print("Error: --side_effect is required for drugs_for_side_effect.")
+                return
+            result = self.plugin.execute("drugs_for_side_effect", args.side_effect, top_k=args.top_k)
+            print(result)
+
+        elif args.action == "render_drug_pages":
+            result = self.plugin.execute("render_drug_pages", args.output_dir, drugs=args.drugs or None,
+                                         workers=args.workers, force=args.force)
+            print(result)
+
         else:
             print("Error: Unknown action.")
 
@@ -393,7 +495,7 @@ if __name__ == "__main__":
     cli = ElizaCLI()
 
     # Prompt user for action
-    action = input(Fore.CYAN + "Enter action (analyze_risk, generate_hypotheses, generate_pdf, validate_data, generate_graph): " + Style.RESET_ALL).strip().lower()
+    action = input(Fore.CYAN + "Enter action (analyze_risk, generate_hypotheses, generate_pdf, validate_data, generate_graph, drugs_for_side_effect, render_drug_pages): " + Style.RESET_ALL).strip().lower()
 
     if action in ["analyze_risk", "analyze risk"]:
         print(Fore.YELLOW + "Analyze Risk: This action allows you to analyze the risk score and side effects for a specific drug." + Style.RESET_ALL)
@@ -429,6 +531,16 @@ if __name__ == "__main__":
             print(Fore.RED + graph_file_path["error"] + Style.RESET_ALL)
         else:
             print(Fore.GREEN + f"Graph visualization saved to {graph_file_path}" + Style.RESET_ALL)
+    elif action in ["drugs_for_side_effect", "drugs for side effect"]:
+        print(Fore.YELLOW + "Drugs for Side Effect: This action lists the drugs causing a side effect, ranked by frequency." + Style.RESET_ALL)
+        side_effect = input(Fore.CYAN + "Enter the side effect: " + Style.RESET_ALL)
+        result = cli.plugin.execute("drugs_for_side_effect", side_effect)
+        print(Fore.GREEN + str(result) + Style.RESET_ALL)
+    elif action in ["render_drug_pages", "render drug pages"]:
+        print(Fore.YELLOW + "Render Drug Pages: This action renders the graph page of every drug, plus an index page, into a directory." + Style.RESET_ALL)
+        output_dir = input(Fore.CYAN + "Enter the output directory [drug_pages]: " + Style.RESET_ALL).strip() or "drug_pages"
+        result = cli.plugin.execute("render_drug_pages", output_dir)
+        print(Fore.GREEN + str(result) + Style.RESET_ALL)
     else:
         print(Fore.RED + "Unknown action." + Style.RESET_ALL)
 
@@ -1,45 +1,252 @@
+import numpy as np
 import pandas as pd
 import networkx as nx
 from pyvis.network import Network
 
+from src.sparse_graph import SparseSideEffectGraph, numeric_array
+
+# Per-drug risk models computed by score_drugs()
+RISK_MODELS = ['mean_frequency', 'degree', 'max_frequency', 'weighted_count', 'quantile_score']
+
+def score_drugs(graph, models=RISK_MODELS):
+    """
+    Compute several per-drug risk models in one vectorized pass over the
+    edge arrays.
+
+    Models:
+        mean_frequency: Mean known side effect frequency (the risk_score).
+        degree: Number of side effects.
+        max_frequency: Highest known side effect frequency.
+        weighted_count: Sum of known side effect frequencies.
+        quantile_score: Mean percentile rank (0-1) of the drug's known
+            frequencies among all edge frequencies in the graph.
+    Frequency based models are 0.0 for drugs without frequency info.
+
+    Args:
+        graph: nx.DiGraph or SparseSideEffectGraph.
+        models: Models to compute.
+
+    Returns:
+        pd.DataFrame with a drug_name column and one column per model, one
+        row per drug node in graph node order.
+    """
+    return _score_edge_arrays(*drug_edge_arrays(graph), models=models)
+
+def drug_degrees(graph):
+    """
+    Drug nodes of a graph in node order and their out-degrees (int64
+    array), without reading any edge data.
+    """
+    if isinstance(graph, SparseSideEffectGraph):
+        ids = graph.typed_drug_ids()
+        return [graph.drug_names[i] for i in ids.tolist()], graph.out_degrees()[ids].astype(np.int64)
+    names = [node for node, node_type in graph.nodes(data='type') if node_type == 'drug']
+    degrees = np.fromiter((degree for _, degree in graph.out_degree(names)), dtype=np.int64, count=len(names))
+    return names, degrees
+
+def drug_edge_arrays(graph):
+    """
+    Out-edges of the drug nodes of a graph as arrays, read straight from
+    the adjacency of an nx graph or the CSR matrix of a sparse one.
+
+    Returns:
+        (drug_names, degrees, rows, freq): drug nodes in graph node order,
+        their out-degrees, and the drug index and frequency (NaN where
+        unknown) of every edge.
+    """
+    if isinstance(graph, SparseSideEffectGraph):
+        ids = graph.typed_drug_ids()
+        degrees = graph.out_degrees()
+        rows = np.repeat(np.arange(len(degrees)), degrees)
+        freq = graph.matrix.data.astype(np.float64)
+        if len(ids) < len(degrees):
+            index = np.full(len(degrees), -1)
+            index[ids] = np.arange(len(ids))
+            rows = index[rows]
+            keep = rows >= 0
+            rows, freq = rows[keep], freq[keep]
+        return [graph.drug_names[i] for i in ids.tolist()], degrees[ids], rows, freq
+
+    names, degrees, edge_dicts = [], [], []
+    for node, nbrs in graph.adjacency():
+        if graph.nodes[node].get('type') == 'drug':
+            names.append(node)
+            degrees.append(len(nbrs))
+            edge_dicts.extend(nbrs.values())
+    degrees = np.array(degrees, dtype=np.int64)
+    rows = np.repeat(np.arange(len(names)), degrees)
+    return names, degrees, rows, numeric_array([data.get('frequency') for data in edge_dicts])
+
+def _score_edge_arrays(drug_names, degrees, rows, freq, models=RISK_MODELS):
+    n_drugs = len(drug_names)
+    known = ~np.isnan(freq)
+    rows, freq = rows[known], freq[known]
+
+    counts = np.bincount(rows, minlength=n_drugs)
+    sums = np.bincount(rows, weights=freq, minlength=n_drugs)
+    has_freq = counts > 0
+
+    table = pd.DataFrame({'drug_name': drug_names})
+    for model in models:
+        if model == 'mean_frequency':
+            values = np.round(np.where(has_freq, sums / np.maximum(counts, 1), 0.0), 4)
+        elif model == 'degree':
+            values = np.asarray(degrees, dtype=np.int64)
+        elif model == 'max_frequency':
+            values = np.full(n_drugs, -np.inf)
+            np.maximum.at(values, rows, freq)
+            values = np.where(has_freq, values, 0.0)
+        elif model == 'weighted_count':
+            values = sums
+        elif model == 'quantile_score':
+            ranks = np.searchsorted(np.sort(freq), freq, side='right') / max(len(freq), 1)
+            rank_sums = np.bincount(rows, weights=ranks, minlength=n_drugs)
+            values = np.where(has_freq, rank_sums / np.maximum(counts, 1), 0.0)
+        else:
+            raise ValueError(f"Unknown risk model: {model}")
+        table[model] = values
+    return table
+
+def add_risk_models(graph, table):
+    """
+    Write the model columns of a score_drugs() table onto the drug nodes of
+    an nx graph, as risk_<model> attributes.
+    """
+    names = table['drug_name'].tolist()
+    for model in table.columns.drop('drug_name'):
+        nx.set_node_attributes(graph, dict(zip(names, table[model].tolist())), f"risk_{model}")
+    return graph
+
 def calculate_and_add_risk_scores(graph):
     """
-    Calculate average frequency (risk score) for each drug and assign as a node attribute.
+    Calculate average frequency (risk score) for each drug and assign as a node attribute,
+    along with the other risk models from score_drugs().
+
+    A SparseSideEffectGraph gets them as drug_data arrays instead.
     """
-    drug_freqs = {}
-
-    for src, dst, edge_data in graph.edges(data=True):
-        freq = edge_data.get('frequency', None)
-        if freq is not None and graph.nodes[src]['type'] == 'drug':
-            if src not in drug_freqs:
-                drug_freqs[src] = {'total_freq': 0, 'count': 0}
-            drug_freqs[src]['total_freq'] += freq
-            drug_freqs[src]['count'] += 1
-
-    # Assign risk scores to drug nodes
-    for drug, stats in drug_freqs.items():
-        avg_freq = stats['total_freq'] / stats['count']
-        graph.nodes[drug]['risk_score'] = round(avg_freq, 4)
-
-    # Default risk score for drugs without frequency info
-    for node, data in graph.nodes(data=True):
-        if data.get('type') == 'drug' and 'risk_score' not in data:
-            graph.nodes[node]['risk_score'] = 0.0
+    if isinstance(graph, SparseSideEffectGraph):
+        table = score_drugs(graph)
+        ids = graph.typed_drug_ids()
+        for model in table.columns.drop('drug_name'):
+            values = np.zeros(len(graph.drug_names), dtype=table[model].dtype)
+            values[ids] = table[model].to_numpy()
+            graph.drug_data[f"risk_{model}"] = values
+        graph.drug_data['risk_score'] = graph.drug_data['risk_mean_frequency']
+        return graph
+
+    # One pass over the adjacency feeds both the models and the running sums
+    drug_names, degrees, rows, freq = drug_edge_arrays(graph)
+    table = _score_edge_arrays(drug_names, degrees, rows, freq)
+    add_risk_models(graph, table)
+    nx.set_node_attributes(graph, dict(zip(drug_names, table['mean_frequency'])), 'risk_score')
+
+    # Running sums per drug node (including drugs without frequencies) let
+    # update_risk_scores() apply edge deltas incrementally
+    known = ~np.isnan(freq)
+    counts = np.bincount(rows[known], minlength=len(drug_names)).tolist()
+    graph.graph['risk_stats'] = {
+        drug: {'total_freq': total, 'count': count}
+        for drug, total, count in zip(drug_names, table['weighted_count'].tolist(), counts)
+    }
     return graph
 
+def _score_from_stats(stats):
+    if stats is None:
+        return None
+    if stats['count'] == 0:
+        return 0.0
+    return round(stats['total_freq'] / stats['count'], 4)
+
+def update_risk_scores(graph, edge_changes):
+    """
+    Incrementally update risk scores after graph_builder.apply_edge_delta().
+    risk_score and the per-drug models are updated for the drugs the delta
+    touched, including drugs it added; quantile_score ranks every drug
+    against all edge frequencies, so it is recomputed for every drug in one
+    vectorized pass.
+
+    Args:
+        graph: Graph scored by calculate_and_add_risk_scores().
+        edge_changes: List of (drug, old_frequency, new_frequency) tuples.
+
+    Returns:
+        dict of drug -> (old_score, new_score) for the drugs whose risk score
+        changed; a score is None for a drug added to or removed from the graph.
+    """
+    if 'risk_stats' not in graph.graph:
+        # Not scored yet: score everything and report the delta's drugs
+        calculate_and_add_risk_scores(graph)
+        return {drug: (None, _score_from_stats(graph.graph['risk_stats'].get(drug)))
+                for drug in dict.fromkeys(drug for drug, _, _ in edge_changes) if drug in graph}
+
+    drug_freqs = graph.graph['risk_stats']
+    old_scores = {}
+    for drug, old_freq, new_freq in edge_changes:
+        if drug not in old_scores:
+            old_scores[drug] = _score_from_stats(drug_freqs.get(drug))
+        stats = drug_freqs.setdefault(drug, {'total_freq': 0, 'count': 0})
+        if old_freq is not None:
+            stats['total_freq'] -= old_freq
+            stats['count'] -= 1
+        if new_freq is not None:
+            stats['total_freq'] += new_freq
+            stats['count'] += 1
+
+    changed, touched = {}, []
+    for drug, old_score in old_scores.items():
+        stats = drug_freqs[drug]
+        if stats['count'] == 0:
+            # Drop floating point residue once a drug has no frequencies left
+            stats['total_freq'] = 0
+        if drug in graph:
+            new_score = _score_from_stats(stats)
+            graph.nodes[drug]['risk_score'] = new_score
+            touched.append(drug)
+        else:
+            del drug_freqs[drug]
+            new_score = None
+        if new_score != old_score:
+            changed[drug] = (old_score, new_score)
+
+    if edge_changes:
+        _update_risk_models(graph, touched)
+    return changed
+
+def _update_risk_models(graph, drugs):
+    # The per-drug models only read the drug's own edges
+    degrees = np.fromiter((degree for _, degree in graph.out_degree(drugs)), dtype=np.int64, count=len(drugs))
+    rows = np.repeat(np.arange(len(drugs)), degrees)
+    freq = numeric_array([data.get('frequency') for drug in drugs for data in graph[drug].values()])
+    models = [model for model in RISK_MODELS if model != 'quantile_score']
+    add_risk_models(graph, _score_edge_arrays(drugs, degrees, rows, freq, models=models))
+    add_risk_models(graph, score_drugs(graph, models=['quantile_score']))
+
 def export_risk_scores(graph, output_csv="drug_risk_scores.csv"):
     """
     Export drug names and risk scores to a CSV.
     """
-    drug_data = []
-    for node, data in graph.nodes(data=True):
-        if data.get('type') == 'drug':
-            drug_data.append({
-                'drug_name': data.get('label', node),
-                'risk_score': data.get('risk_score', 0.0)
-            })
-
-    df = pd.DataFrame(drug_data)
+    if isinstance(graph, SparseSideEffectGraph):
+        ids = graph.typed_drug_ids()
+        df = pd.DataFrame({'drug_name': [graph.drug_names[i] for i in ids.tolist()]})
+        scores = graph.drug_data.get('risk_score')
+        df['risk_score'] = 0.0 if scores is None else scores[ids]
+        for model in RISK_MODELS:
+            if f"risk_{model}" in graph.drug_data:
+                df[model] = graph.drug_data[f"risk_{model}"][ids]
+    else:
+        drug_data = []
+        for node, data in graph.nodes(data=True):
+            if data.get('type') == 'drug':
+                row = {
+                    'drug_name': data.get('label', node),
+                    'risk_score': data.get('risk_score', 0.0)
+                }
+                for model in RISK_MODELS:
+                    if f"risk_{model}" in data:
+                        row[model] = data[f"risk_{model}"]
+                drug_data.append(row)
+        df = pd.DataFrame(drug_data)
+
     df = df.sort_values(by='risk_score', ascending=False)
     df.to_csv(output_csv, index=False)
     print(f"[✓] Drug risk scores saved to: {output_csv}")
@@ -0,0 +1,139 @@
+import numpy as np
+
+from src.data_store import dataset_fingerprint, load_cache, load_clean_table, save_cache
+from src.sparse_graph import SparseSideEffectGraph
+
+INDEX_PATH = 'data/processed/cache/side_effect_index.npz'
+INDEX_FORMAT = 1
+
+
+class SideEffectIndex:
+    """
+    Inverted index from side effects to the drugs that cause them.
+
+    Each side effect has a posting list of drug ids sorted by freq_pct,
+    highest first; drugs without a known frequency come last, in drug id
+    order. Postings are stored CSR style: the drugs of side effect j are
+    drug_ids[indptr[j]:indptr[j + 1]], with their frequencies (NaN where
+    unknown) at the same positions of freqs.
+    """
+    def __init__(self, indptr, drug_ids, freqs, drug_names, side_effect_names, fingerprint=None):
+        self.indptr = np.asarray(indptr)
+        self.drug_ids = np.asarray(drug_ids)
+        self.freqs = np.asarray(freqs)
+        self.drug_names = list(drug_names)
+        self.side_effect_names = list(side_effect_names)
+        self.side_effect_index = {name: j for j, name in enumerate(self.side_effect_names)}
+        self.fingerprint = fingerprint
+
+    # === Construction ===
+
+    @classmethod
+    def from_graph(cls, graph, fingerprint=None):
+        """
+        Build from a SparseSideEffectGraph.
+        """
+        csc = graph.csc
+        se_ids = np.repeat(np.arange(csc.shape[1]), np.diff(csc.indptr))
+        freqs = csc.data.astype(np.float64)
+        # NaN sorts after every frequency once negated
+        order = np.lexsort((csc.indices, -freqs, se_ids))
+        return cls(csc.indptr.astype(np.int64), csc.indices[order].astype(np.int32), freqs[order],
+                   graph.drug_names, graph.side_effect_names, fingerprint)
+
+    @classmethod
+    def from_edges(cls, df, fingerprint=None):
+        """
+        Build from a clean edge table with drug_name, side_effect and
+        freq_pct columns. Drug and side effect ids follow sorted names, and
+        a repeated edge keeps its last known frequency.
+        """
+        graph = SparseSideEffectGraph.from_edge_table(df, dtype=np.float64)
+        return cls.from_graph(graph, fingerprint)
+
+    # === Persistence ===
+
+    def save(self, path=INDEX_PATH):
+        save_cache(path, INDEX_FORMAT, self.fingerprint,
+                   indptr=self.indptr, drug_ids=self.drug_ids, freqs=self.freqs,
+                   drug_names=np.array(self.drug_names, dtype=str),
+                   side_effect_names=np.array(self.side_effect_names, dtype=str))
+
+    @classmethod
+    def load(cls, path=INDEX_PATH, fingerprint=None):
+        """
+        Load an index written by save(); None unless data_store.load_cache()
+        accepts the file.
+        """
+        data = load_cache(path, INDEX_FORMAT, fingerprint)
+        if data is None:
+            return None
+        return cls(data['indptr'], data['drug_ids'], data['freqs'],
+                   data['drug_names'].tolist(), data['side_effect_names'].tolist(), data['fingerprint'])
+
+    # === Queries ===
+
+    def __contains__(self, side_effect):
+        return side_effect in self.side_effect_index
+
+    def posting(self, side_effect):
+        """
+        (drug_ids, freqs) arrays of a side effect's posting list; empty for
+        an unknown side effect.
+        """
+        j = self.side_effect_index.get(side_effect)
+        if j is None:
+            return self.drug_ids[:0], self.freqs[:0]
+        start, end = self.indptr[j], self.indptr[j + 1]
+        return self.drug_ids[start:end], self.freqs[start:end]
+
+    def drugs_for(self, side_effect, top_k=None, min_freq=None):
+        """
+        Drugs causing a side effect, ranked by frequency.
+
+        Args:
+            side_effect: Side effect name.
+            top_k: Optional maximum number of drugs to return.
+            min_freq: Optional minimum frequency; drugs without a known
+                frequency are then left out.
+
+        Returns:
+            list of (drug_name, frequency) tuples, frequency None if unknown.
+        """
+        drug_ids, freqs = self.posting(side_effect)
+        if min_freq is not None:
+            # Postings are sorted, so the qualifying drugs are a prefix
+            end = int(np.count_nonzero(freqs >= min_freq))
+            drug_ids, freqs = drug_ids[:end], freqs[:end]
+        drug_ids, freqs = drug_ids[:top_k], freqs[:top_k]
+        return [(self.drug_names[i], None if np.isnan(f) else f)
+                for i, f in zip(drug_ids.tolist(), freqs.astype(float).tolist())]
+
+    def shared_effect_counts(self, side_effects):
+        """
+        Number of the given side effects each drug causes, for the drugs
+        that cause at least one of them.
+
+        Returns:
+            dict of drug_name -> count, in drug id order.
+        """
+        postings = [self.posting(se)[0] for se in set(side_effects)]
+        if not postings:
+            return {}
+        counts = np.bincount(np.concatenate(postings), minlength=len(self.drug_names))
+        return {self.drug_names[i]: int(counts[i]) for i in np.flatnonzero(counts).tolist()}
+
+
+def load_or_build_index(csv_path, index_path=INDEX_PATH):
+    """
+    Return the side effect index of a clean table, reusing the saved index
+    when it was built from the same data, and building and saving it
+    otherwise.
+    """
+    fingerprint = dataset_fingerprint(csv_path)
+    index = SideEffectIndex.load(index_path, fingerprint)
+    if index is None:
+        df = load_clean_table(csv_path, columns=['drug_name', 'side_effect', 'freq_pct'])
+        index = SideEffectIndex.from_edges(df, fingerprint)
+        index.save(index_path)
+    return index
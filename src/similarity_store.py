@@ -0,0 +1,203 @@
+import numpy as np
+import scipy.sparse as sp
+
+from src.data_store import dataset_fingerprint, load_cache, load_clean_table, save_cache
+from src.sparse_graph import SparseSideEffectGraph
+
+SIMILARITY_PATH = 'data/processed/cache/similarity_store.npz'
+SIMILARITY_FORMAT = 1
+
+# jaccard: unweighted side effect sets; cosine: frequency-weighted profiles
+METRICS = ('jaccard', 'cosine')
+
+# Drugs per block of the all-pairs similarity computation
+SIMILARITY_BLOCK_SIZE = 256
+
+
+class SimilarityStore:
+    """
+    Precomputed drug-drug similarities: for every drug and metric, its top_k
+    most similar drugs as one row of a sparse neighbour matrix.
+
+    Metrics:
+        jaccard: |A & B| / |A | B| of the side effect sets.
+        cosine: Cosine of the side effect frequency vectors; side effects
+            without a known frequency weigh 0.
+
+    similarity() answers any pair: from the neighbour matrix when the pair
+    is in it, and exactly from the stored profiles otherwise.
+    """
+    def __init__(self, drug_names, profiles, neighbors, top_k, fingerprint=None):
+        self.drug_names = list(drug_names)
+        self.drug_index = {name: i for i, name in enumerate(self.drug_names)}
+        self.profiles = sp.csr_matrix(profiles)
+        self.neighbors = {metric: sp.csr_matrix(matrix) for metric, matrix in neighbors.items()}
+        self.top_k = int(top_k)
+        self.fingerprint = fingerprint
+        self._binary = None
+
+    # === Construction ===
+
+    @classmethod
+    def from_graph(cls, graph, top_k=50, block_size=SIMILARITY_BLOCK_SIZE, fingerprint=None):
+        """
+        Bulk-build from a SparseSideEffectGraph.
+        """
+        profiles = graph.matrix.astype(np.float64)
+        profiles.data = np.nan_to_num(profiles.data, nan=0.0)
+        store = cls(graph.drug_names, profiles, {}, top_k, fingerprint)
+        store.neighbors = {metric: store._top_k_matrix(metric, block_size) for metric in METRICS}
+        return store
+
+    def _top_k_matrix(self, metric, block_size):
+        n = len(self.drug_names)
+        k = min(self.top_k, max(n - 1, 0))
+        rows, cols, values = [], [], []
+        for start in range(0, n, block_size):
+            stop = min(start + block_size, n)
+            sims = self._block_similarity(metric, start, stop)
+            sims[np.arange(stop - start), np.arange(start, stop)] = 0.0  # never a neighbour of itself
+            # Stable sort: ties are kept in drug id order
+            order = np.argsort(-sims, axis=1, kind='stable')[:, :k]
+            top = np.take_along_axis(sims, order, axis=1)
+            keep = top > 0
+            rows.append(np.repeat(np.arange(start, stop), keep.sum(axis=1)))
+            cols.append(order[keep])
+            values.append(top[keep])
+        if not rows:
+            return sp.csr_matrix((n, n))
+        return sp.csr_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))), shape=(n, n))
+
+    def _block_similarity(self, metric, start, stop):
+        """
+        Dense similarities of drugs start..stop to every drug.
+        """
+        if metric == 'jaccard':
+            binary = self.binary
+            sizes = np.diff(binary.indptr).astype(np.float64)
+            shared = (binary[start:stop] @ binary.T).toarray()
+            union = sizes[start:stop, None] + sizes[None, :] - shared
+            return np.divide(shared, union, out=np.zeros_like(shared), where=union > 0)
+        if metric == 'cosine':
+            norms = np.sqrt(np.asarray(self.profiles.multiply(self.profiles).sum(axis=1)).ravel())
+            dots = (self.profiles[start:stop] @ self.profiles.T).toarray()
+            scale = norms[start:stop, None] * norms[None, :]
+            return np.divide(dots, scale, out=np.zeros_like(dots), where=scale > 0)
+        raise ValueError(f"Unknown similarity metric: {metric}")
+
+    @property
+    def binary(self):
+        """
+        0/1 copy of the profiles, built on first use.
+        """
+        if self._binary is None:
+            self._binary = self.profiles.copy()
+            self._binary.data = np.ones_like(self._binary.data)
+        return self._binary
+
+    # === Persistence ===
+
+    def save(self, path=SIMILARITY_PATH):
+        arrays = {}
+        for name, matrix in [('profiles', self.profiles)] + [(f'neighbors_{m}', x) for m, x in self.neighbors.items()]:
+            arrays.update({f'{name}_data': matrix.data, f'{name}_indices': matrix.indices,
+                           f'{name}_indptr': matrix.indptr, f'{name}_shape': np.array(matrix.shape)})
+        save_cache(path, SIMILARITY_FORMAT, self.fingerprint, top_k=self.top_k,
+                   metrics=np.array(list(self.neighbors), dtype=str),
+                   drug_names=np.array(self.drug_names, dtype=str), **arrays)
+
+    @classmethod
+    def load(cls, path=SIMILARITY_PATH, fingerprint=None):
+        """
+        Load a store written by save(); None unless data_store.load_cache()
+        accepts the file.
+        """
+        data = load_cache(path, SIMILARITY_FORMAT, fingerprint)
+        if data is None:
+            return None
+
+        def matrix(name):
+            return sp.csr_matrix((data[f'{name}_data'], data[f'{name}_indices'], data[f'{name}_indptr']),
+                                 shape=tuple(data[f'{name}_shape']))
+
+        neighbors = {metric: matrix(f'neighbors_{metric}') for metric in data['metrics'].tolist()}
+        return cls(data['drug_names'].tolist(), matrix('profiles'), neighbors, int(data['top_k']),
+                   data['fingerprint'])
+
+    # === Queries ===
+
+    def most_similar(self, drug, metric='jaccard', top_k=None):
+        """
+        The stored nearest neighbours of a drug.
+
+        Returns:
+            list of (drug_name, similarity) tuples, most similar first.
+        """
+        i = self.drug_index.get(drug)
+        if i is None:
+            return []
+        matrix = self.neighbors[metric]
+        start, end = matrix.indptr[i], matrix.indptr[i + 1]
+        ids, sims = matrix.indices[start:end], matrix.data[start:end]
+        order = np.lexsort((ids, -sims))[:top_k]
+        return [(self.drug_names[j], float(s)) for j, s in zip(ids[order].tolist(), sims[order].tolist())]
+
+    def similarity(self, drug_a, drug_b, metric='jaccard'):
+        """
+        Similarity of two drugs; 0.0 when either is unknown.
+        """
+        i, j = self.drug_index.get(drug_a), self.drug_index.get(drug_b)
+        if i is None or j is None:
+            return 0.0
+        if i == j:
+            return 1.0 if self.profiles[i].nnz else 0.0
+        matrix = self.neighbors[metric]
+        start, end = matrix.indptr[i], matrix.indptr[i + 1]
+        pos = np.flatnonzero(matrix.indices[start:end] == j)
+        if len(pos):
+            return float(matrix.data[start + pos[0]])
+        # Not among the stored neighbours: compute the pair exactly
+        return float(self._pair_similarity(metric, i, j))
+
+    def _pair_similarity(self, metric, i, j):
+        if metric == 'jaccard':
+            a = set(self.profiles.indices[self.profiles.indptr[i]:self.profiles.indptr[i + 1]].tolist())
+            b = set(self.profiles.indices[self.profiles.indptr[j]:self.profiles.indptr[j + 1]].tolist())
+            return len(a & b) / len(a | b) if a or b else 0.0
+        if metric == 'cosine':
+            a, b = self.profiles[i], self.profiles[j]
+            norm = np.sqrt(a.multiply(a).sum() * b.multiply(b).sum())
+            return a.multiply(b).sum() / norm if norm > 0 else 0.0
+        raise ValueError(f"Unknown similarity metric: {metric}")
+
+    def similarities(self, drug_a, drug_b):
+        """
+        dict of metric -> similarity for a pair of drugs.
+        """
+        return {f"{metric}_similarity": round(self.similarity(drug_a, drug_b, metric), 4) for metric in METRICS}
+
+
+def load_or_build_similarity_store(csv_path, store_path=SIMILARITY_PATH, top_k=50):
+    """
+    Return the similarity store of a clean table, reusing the saved store
+    when it was built from the same data with at least top_k neighbours,
+    and building and saving it otherwise.
+    """
+    fingerprint = dataset_fingerprint(csv_path)
+    store = SimilarityStore.load(store_path, fingerprint)
+    if store is None or store.top_k < top_k:
+        df = load_clean_table(csv_path, columns=['drug_name', 'side_effect', 'freq_pct'])
+        graph = SparseSideEffectGraph.from_edge_table(df, dtype=np.float64)
+        store = SimilarityStore.from_graph(graph, top_k=top_k, fingerprint=fingerprint)
+        store.save(store_path)
+    return store
+
+
+def pair_similarities(edge_table, drug_a, drug_b):
+    """
+    similarities() of one pair of drugs, computed from their rows of a clean
+    table alone, for callers without a store.
+    """
+    rows = edge_table[edge_table['drug_name'].isin([drug_a, drug_b])]
+    graph = SparseSideEffectGraph.from_edge_table(rows, dtype=np.float64)
+    return SimilarityStore.from_graph(graph, top_k=1).similarities(drug_a, drug_b)
@@ -0,0 +1,403 @@
+import numpy as np
+import networkx as nx
+import pandas as pd
+import scipy.sparse as sp
+
+from src.data_store import load_vocabularies, load_edge_arrays
+from src.graph_builder import build_graph_from_columns, drug_node_attrs, side_effect_node_attrs
+
+
+def numeric_array(values):
+    """
+    float64 array of attribute values, NaN where a value is missing or not
+    a number (such as "N/A").
+    """
+    try:
+        return np.array(values, dtype=float)  # None -> NaN
+    except (TypeError, ValueError):
+        return np.array([v if isinstance(v, (int, float)) else np.nan for v in values], dtype=float)
+
+
+class SparseSideEffectGraph:
+    """
+    Drug x side effect bipartite graph backed by a scipy.sparse CSR matrix.
+
+    Rows are drugs, columns are side effects and the stored values are edge
+    frequencies. An edge without a known frequency is stored as an explicit
+    NaN entry, so the sparsity pattern is exactly the edge set of the
+    equivalent nx.DiGraph. Node names are interned to row / column ids.
+
+    The query methods mirror the nx.DiGraph ones used in this project
+    (successors, predecessors, degree, has_edge, edge frequency), and bulk
+    analytics are available as vectorized per-drug arrays.
+
+    edge_data optionally holds extra per-edge float arrays (e.g. the
+    freq_min / freq_max / freq_count statistics) aligned with matrix.data,
+    with NaN where an edge has no value. drug_data holds per-drug arrays
+    indexed by drug id, such as the risk scores set by
+    risk_analyzer.calculate_and_add_risk_scores().
+
+    node_order and edge_order record the order of the nx graph the matrix
+    was built from (see from_networkx), so to_networkx() rebuilds the same
+    graph: node_order holds a drug id, or len(drug_names) + a side effect
+    id, per node (the id also gives the node's type), and edge_order the
+    matrix.data position of each edge.
+    """
+    def __init__(self, matrix, drug_names, side_effect_names, edge_data=None, node_order=None, edge_order=None):
+        self.matrix = sp.csr_matrix(matrix)
+        if not self.matrix.has_sorted_indices:
+            self.matrix.sort_indices()
+        self.edge_data = dict(edge_data or {})
+        self.drug_data = {}
+        self.node_order = None if node_order is None else np.asarray(node_order, dtype=np.int64)
+        self.edge_order = None if edge_order is None else np.asarray(edge_order, dtype=np.int64)
+        self.drug_names = list(drug_names)
+        self.side_effect_names = list(side_effect_names)
+        self.drug_index = {name: i for i, name in enumerate(self.drug_names)}
+        self.side_effect_index = {name: i for i, name in enumerate(self.side_effect_names)}
+        self._csc = None
+
+    # === Construction ===
+
+    @classmethod
+    def from_edge_arrays(cls, drug_ids, se_ids, freq, drug_names, side_effect_names, dtype=np.float32,
+                         edge_data=None):
+        """
+        Build from parallel edge arrays (interned ids and frequencies, NaN
+        where unknown). Repeated (drug_id, se_id) pairs keep their last
+        non-NaN frequency, like repeated add_edge calls on a DiGraph.
+        edge_data arrays are aligned with the input edges and follow the
+        same selection.
+        """
+        drug_ids = np.asarray(drug_ids, dtype=np.int64)
+        se_ids = np.asarray(se_ids, dtype=np.int64)
+        freq = np.asarray(freq, dtype=dtype)
+        shape = (len(drug_names), len(side_effect_names))
+
+        # Sort by (drug, side effect), NaN frequencies first within a pair,
+        # then keep the last row of every pair.
+        order = np.lexsort((~np.isnan(freq), se_ids, drug_ids))
+        drug_ids, se_ids, freq = drug_ids[order], se_ids[order], freq[order]
+        last = np.ones(len(order), dtype=bool)
+        if len(order):
+            last[:-1] = (drug_ids[1:] != drug_ids[:-1]) | (se_ids[1:] != se_ids[:-1])
+        drug_ids, se_ids, freq = drug_ids[last], se_ids[last], freq[last]
+        edge_data = {name: np.asarray(values, dtype=np.float64)[order][last]
+                     for name, values in (edge_data or {}).items()}
+
+        indptr = np.zeros(shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(drug_ids, minlength=shape[0]), out=indptr[1:])
+        matrix = sp.csr_matrix((freq, se_ids.astype(np.int32), indptr), shape=shape)
+        return cls(matrix, drug_names, side_effect_names, edge_data)
+
+    @classmethod
+    def from_edge_table(cls, df, dtype=np.float32):
+        """
+        Build from a clean edge table with drug_name, side_effect and
+        freq_pct columns. Ids follow sorted names; rows without a drug or
+        side effect name are skipped.
+        """
+        df = df.dropna(subset=['drug_name', 'side_effect'])
+        drug_ids, drug_names = pd.factorize(df['drug_name'].astype(str), sort=True)
+        se_ids, se_names = pd.factorize(df['side_effect'].astype(str), sort=True)
+        freq = pd.to_numeric(df['freq_pct'], errors='coerce').to_numpy(dtype=float)
+        return cls.from_edge_arrays(drug_ids, se_ids, freq, list(drug_names), list(se_names), dtype=dtype)
+
+    @classmethod
+    def from_processed(cls, processed_dir="data/processed"):
+        """
+        Build from the interned vocabularies and edge table written by the ETL.
+        Names the vocabularies keep from earlier runs get rows / columns
+        without edges.
+        """
+        drug_vocab, se_vocab = load_vocabularies(processed_dir)
+        edges = load_edge_arrays(processed_dir)
+        return cls.from_edge_arrays(edges['drug_id'], edges['se_id'], edges['freq'],
+                                    drug_vocab['drug_name'].tolist(), se_vocab['side_effect'].tolist())
+
+    @classmethod
+    def from_networkx(cls, G, dtype=np.float32, edge_attributes=()):
+        """
+        Build from a drug -> side effect nx.DiGraph. Edge endpoints are
+        indexed by their role: every edge source is a drug row and every
+        edge target a side effect column, so a name used both ways (which
+        build_graph_from_columns allows) gets a row and a column. Nodes
+        typed "drug" always get a row, and nodes without outgoing edges of
+        any other type a column. Ids follow the graph's node order, and the
+        node and edge order are kept in node_order / edge_order.
+        Non-numeric frequencies such as "N/A" are stored as unknown. Numeric
+        edge attributes named in edge_attributes are kept in edge_data.
+        """
+        drug_names, side_effect_names = [], []
+        for node, node_type in G.nodes(data='type'):
+            has_out = G.out_degree(node) > 0
+            if has_out or node_type == 'drug':
+                drug_names.append(node)
+            if G.in_degree(node) > 0 or (not has_out and node_type != 'drug'):
+                side_effect_names.append(node)
+
+        drug_index = {name: i for i, name in enumerate(drug_names)}
+        se_index = {name: i for i, name in enumerate(side_effect_names)}
+        drug_ids, targets, edge_dicts = [], [], []
+        # adjacency() yields the plain successor dicts, without view overhead
+        for u, nbrs in G.adjacency():
+            if nbrs:
+                drug_ids.extend([drug_index[u]] * len(nbrs))
+                targets.extend(nbrs)
+                edge_dicts.extend(nbrs.values())
+        se_ids = np.fromiter(map(se_index.__getitem__, targets), dtype=np.int64, count=len(targets))
+        freq = numeric_array([data.get('frequency') for data in edge_dicts])
+        extra = {name: numeric_array([data.get(name) for data in edge_dicts]) for name in edge_attributes}
+        graph = cls.from_edge_arrays(drug_ids, se_ids, freq, drug_names, side_effect_names,
+                                     dtype=dtype, edge_data=extra)
+
+        n_drugs = len(drug_names)
+        graph.node_order = np.fromiter(
+            (drug_index[node] if node_type == 'drug' or node not in se_index else n_drugs + se_index[node]
+             for node, node_type in G.nodes(data='type')),
+            dtype=np.int64, count=len(G))
+        graph.edge_order = graph.edge_positions(drug_ids, se_ids)
+        return graph
+
+    def _edge_attrs(self, positions):
+        freqs = self.matrix.data[positions].astype(float).tolist()
+        extra = {name: np.asarray(values, dtype=float)[positions].tolist() for name, values in self.edge_data.items()}
+        edge_attrs = []
+        for i, freq in enumerate(freqs):
+            if np.isnan(freq):
+                edge_attrs.append({'relation': 'causes'})
+                continue
+            edge = {'relation': 'causes', 'frequency': freq}
+            for name, values in extra.items():
+                if not np.isnan(values[i]):
+                    edge[name] = int(values[i]) if name == 'freq_count' else values[i]
+            edge_attrs.append(edge)
+        return edge_attrs
+
+    def _edge_rows(self):
+        return np.repeat(np.arange(len(self.drug_names)), np.diff(self.matrix.indptr))
+
+    def to_networkx(self, max_nodes=None):
+        """
+        Convert to an nx.DiGraph with the node and edge attributes that
+        build_side_effect_graph() sets (including edge_data values, and
+        drug_data values on the drug nodes).
+
+        A graph from from_networkx() or a snapshot is rebuilt in its
+        original node and edge order; max_nodes then keeps only the first
+        max_nodes nodes and the edges between them, like
+        graph.subgraph(list(graph.nodes)[:max_nodes]). Otherwise drugs come
+        first, and drugs without side effects are kept as isolated nodes.
+        """
+        rows = self._edge_rows()
+        drug_names = np.array(self.drug_names, dtype=object)
+        se_names = np.array(self.side_effect_names, dtype=object)
+        if self.node_order is None:
+            G = nx.DiGraph()
+            G.add_nodes_from((name, drug_node_attrs(name)) for name in self.drug_names)
+            G = build_graph_from_columns(drug_names[rows], se_names[self.matrix.indices],
+                                         self._edge_attrs(slice(None)),
+                                         drug_node_attrs, side_effect_node_attrs, graph=G)
+        else:
+            n_drugs = len(self.drug_names)
+            order = self.node_order if max_nodes is None else self.node_order[:max_nodes]
+            names = np.concatenate([drug_names, se_names])[order]
+            G = nx.DiGraph()
+            G.add_nodes_from((name, drug_node_attrs(name) if code < n_drugs else side_effect_node_attrs(name))
+                             for name, code in zip(names.tolist(), order.tolist()))
+            positions = self.edge_order
+            if max_nodes is not None:
+                kept_drugs = np.zeros(n_drugs, dtype=bool)
+                kept_se = np.zeros(len(self.side_effect_names), dtype=bool)
+                for name in names.tolist():
+                    if name in self.drug_index:
+                        kept_drugs[self.drug_index[name]] = True
+                    if name in self.side_effect_index:
+                        kept_se[self.side_effect_index[name]] = True
+                positions = positions[kept_drugs[rows[positions]] & kept_se[self.matrix.indices[positions]]]
+            G.add_edges_from(zip(drug_names[rows[positions]].tolist(),
+                                 se_names[self.matrix.indices[positions]].tolist(),
+                                 self._edge_attrs(positions)))
+
+        typed_drugs = [i for i in self.typed_drug_ids().tolist() if self.drug_names[i] in G]
+        for name, values in self.drug_data.items():
+            nx.set_node_attributes(G, {self.drug_names[i]: values[i].item() for i in typed_drugs
+                                       if not np.isnan(values[i])}, name)
+        return G
+
+    # === Node and edge queries ===
+
+    @property
+    def csc(self):
+        """
+        Column-major copy of the matrix, built on first use.
+        """
+        if self._csc is None:
+            self._csc = self.matrix.tocsc()
+            self._csc.sort_indices()
+        return self._csc
+
+    def number_of_nodes(self):
+        if self.node_order is not None:
+            return len(self.node_order)
+        return len(self.drug_index.keys() | self.side_effect_index.keys())
+
+    def number_of_edges(self):
+        return self.matrix.nnz
+
+    def typed_drug_ids(self):
+        """
+        Ids of the drugs that are drug nodes (not side effect nodes that also
+        have side effects of their own), in node order.
+        """
+        if self.node_order is None:
+            return np.arange(len(self.drug_names))
+        return self.node_order[self.node_order < len(self.drug_names)]
+
+    def edge_endpoints(self):
+        """
+        Drug and side effect name arrays of the edges, in edge order.
+        """
+        positions = slice(None) if self.edge_order is None else self.edge_order
+        drugs = np.array(self.drug_names, dtype=object)[self._edge_rows()[positions]]
+        return drugs, np.array(self.side_effect_names, dtype=object)[self.matrix.indices[positions]]
+
+    def edges(self, data=False):
+        """
+        Iterate (drug, side_effect) edges, or (drug, side_effect, attrs)
+        with data=True, in edge order.
+        """
+        drugs, side_effects = self.edge_endpoints()
+        if not data:
+            return zip(drugs.tolist(), side_effects.tolist())
+        positions = np.arange(self.matrix.nnz) if self.edge_order is None else self.edge_order
+        return zip(drugs.tolist(), side_effects.tolist(), self._edge_attrs(positions))
+
+    def __contains__(self, node):
+        return node in self.drug_index or node in self.side_effect_index
+
+    def is_drug(self, node):
+        return node in self.drug_index
+
+    def successors(self, drug):
+        """
+        Side effects of a drug, in side effect id order.
+        """
+        i = self.drug_index[drug]
+        indices = self.matrix.indices[self.matrix.indptr[i]:self.matrix.indptr[i + 1]]
+        return [self.side_effect_names[j] for j in indices]
+
+    def predecessors(self, side_effect):
+        """
+        Drugs causing a side effect, in drug id order.
+        """
+        j = self.side_effect_index[side_effect]
+        indices = self.csc.indices[self.csc.indptr[j]:self.csc.indptr[j + 1]]
+        return [self.drug_names[i] for i in indices]
+
+    def neighbors(self, node):
+        """
+        Neighbours of a node in either direction (like nx.Graph.neighbors on
+        the undirected view).
+        """
+        return self.successors(node) if node in self.drug_index else self.predecessors(node)
+
+    def out_degree(self, drug):
+        i = self.drug_index.get(drug)
+        return 0 if i is None else int(self.matrix.indptr[i + 1] - self.matrix.indptr[i])
+
+    def in_degree(self, side_effect):
+        j = self.side_effect_index.get(side_effect)
+        return 0 if j is None else int(self.csc.indptr[j + 1] - self.csc.indptr[j])
+
+    def degree(self, node):
+        return self.out_degree(node) if node in self.drug_index else self.in_degree(node)
+
+    def has_edge(self, drug, side_effect):
+        return self._edge_position(drug, side_effect) is not None
+
+    def edge_frequency(self, drug, side_effect, default=None):
+        """
+        Frequency of a drug -> side effect edge; default if the edge does not
+        exist or has no known frequency.
+        """
+        pos = self._edge_position(drug, side_effect)
+        if pos is None:
+            return default
+        freq = float(self.matrix.data[pos])
+        return default if np.isnan(freq) else freq
+
+    def edge_positions(self, drug_ids, se_ids):
+        """
+        matrix.data positions of existing (drug id, side effect id) edges.
+        """
+        n_se = max(len(self.side_effect_names), 1)
+        keys = self._edge_rows() * n_se + self.matrix.indices
+        return np.searchsorted(keys, np.asarray(drug_ids, dtype=np.int64) * n_se + np.asarray(se_ids))
+
+    def _edge_position(self, drug, side_effect):
+        i = self.drug_index.get(drug)
+        j = self.side_effect_index.get(side_effect)
+        if i is None or j is None:
+            return None
+        start, end = self.matrix.indptr[i], self.matrix.indptr[i + 1]
+        pos = start + np.searchsorted(self.matrix.indices[start:end], j)
+        if pos < end and self.matrix.indices[pos] == j:
+            return pos
+        return None
+
+    # === Bulk analytics ===
+
+    def out_degrees(self):
+        """
+        Number of side effects per drug, indexed by drug id.
+        """
+        return np.diff(self.matrix.indptr)
+
+    def in_degrees(self):
+        """
+        Number of drugs per side effect, indexed by side effect id.
+        """
+        return np.diff(self.csc.indptr)
+
+    def frequency_counts(self):
+        """
+        Number of edges with a known frequency per drug.
+        """
+        known = ~np.isnan(self.matrix.data)
+        rows = self._edge_rows()
+        return np.bincount(rows, weights=known, minlength=len(self.drug_names)).astype(np.int64)
+
+    def frequency_sums(self):
+        """
+        Sum of known edge frequencies per drug (float64).
+        """
+        data = np.nan_to_num(self.matrix.data.astype(np.float64), nan=0.0)
+        rows = self._edge_rows()
+        return np.bincount(rows, weights=data, minlength=len(self.drug_names))
+
+    def mean_frequencies(self):
+        """
+        Mean known edge frequency per drug; NaN for drugs without any.
+        """
+        counts = self.frequency_counts()
+        sums = self.frequency_sums()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+    def biadjacency(self, weighted=False):
+        """
+        Drug x side effect matrix for matrix products: 1.0 per edge, or the
+        edge frequency (0 where unknown) when weighted.
+        """
+        if weighted:
+            data = np.nan_to_num(self.matrix.data, nan=0.0)
+        else:
+            data = np.ones_like(self.matrix.data)
+        return sp.csr_matrix((data, self.matrix.indices, self.matrix.indptr), shape=self.matrix.shape)
+
+    def nbytes(self):
+        """
+        Bytes held by the matrix arrays (excluding the name vocabularies).
+        """
+        return self.matrix.data.nbytes + self.matrix.indices.nbytes + self.matrix.indptr.nbytes
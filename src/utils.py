@@ -1,20 +1,64 @@
+import heapq
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations, islice
+
 import networkx as nx
-from itertools import combinations
+import numpy as np
+import scipy.sparse as sp
+
+# Rows of the selected-drug matrix multiplied per block in bulk mode
+BULK_BLOCK_SIZE = 1024
 
-def generate_risk_hypotheses(G: nx.DiGraph, selected_drugs: list, min_overlap: int = 2):
+def generate_risk_hypotheses(G: nx.DiGraph, selected_drugs: list, min_overlap: int = 2,
+                             bulk: bool = False, top_k: int = None, index=None, similarity_store=None,
+                             workers: int = None, minhash_index=None):
     """
     Generate risk hypotheses based on overlapping side effects between selected drugs.
 
     Args:
         G (nx.DiGraph): The drug-side effect graph.
         selected_drugs (list): List of drugs to analyze.
-        min_overlap (int): Minimum number of shared side effects to consider.
+        min_overlap (int): Minimum number of shared side effects to consider;
+            0 or less returns every pair, also those sharing none.
+        bulk (bool): Count the overlaps of all pairs with a sparse matrix
+            product instead of pair by pair; use for large drug lists.
+        top_k (int): Only return the top_k hypotheses (by overlap count, ties
+            in pair order). In bulk mode the other pairs are never built.
+        index (SideEffectIndex): Optional inverted index built from the same
+            data as G. Pairs are then only compared when the index shows
+            at least min_overlap shared side effects.
+        similarity_store (SimilarityStore): Optional store; each hypothesis
+            then also has jaccard_similarity and cosine_similarity.
+        workers (int): Run bulk mode in a process pool of this many workers
+            (implies bulk); the result is the same as with bulk=True.
+        minhash_index (MinHashLSHIndex): Optional LSH index built from the
+            same data as G, used instead of index. Pairs are then only
+            compared when the index buckets them together, so the cost
+            follows the number of similar pairs. This is approximate: pairs
+            with dissimilar profiles are skipped even when they share
+            min_overlap side effects.
 
     Returns:
         list: A list of hypotheses with drug pairs, overlap counts, and shared side effects.
     """
+    if workers is not None and workers > 1:
+        hypotheses = _parallel_risk_hypotheses(G, selected_drugs, min_overlap, top_k, workers)
+        return _add_similarities(hypotheses, similarity_store)
+    if bulk or workers is not None:
+        hypotheses = _bulk_risk_hypotheses(G, selected_drugs, min_overlap, top_k)
+        return _add_similarities(hypotheses, similarity_store)
+
     hypotheses = []
-    for d1, d2 in combinations(selected_drugs, 2):
+    if min_overlap < 1:
+        pairs = combinations(selected_drugs, 2)
+    elif minhash_index is not None:
+        pairs = _lsh_candidate_pairs(minhash_index, selected_drugs)
+    elif index is not None:
+        pairs = _candidate_pairs(index, G, selected_drugs, min_overlap)
+    else:
+        pairs = combinations(selected_drugs, 2)
+    for d1, d2 in pairs:
         se1 = {v for u, v in G.edges(d1)} if d1 in G else set()
         se2 = {v for u, v in G.edges(d2)} if d2 in G else set()
         overlap = se1 & se2
@@ -28,14 +72,262 @@ def generate_risk_hypotheses(G: nx.DiGraph, selected_drugs: list, min_overlap: i
                 freq_scores.append((se, avg_freq))
 
             freq_scores.sort(key=lambda x: x[1], reverse=True)
-            top_effects = ", ".join([f"{se} (score: {score})" for se, score in freq_scores[:5]])
+            hypotheses.append(_hypothesis(d1, d2, len(overlap), freq_scores))
+
+    hypotheses.sort(key=lambda x: x["overlap_count"], reverse=True)
+    hypotheses = hypotheses[:top_k] if top_k is not None else hypotheses
+    return _add_similarities(hypotheses, similarity_store)
+
+def _add_similarities(hypotheses, similarity_store):
+    if similarity_store is not None:
+        for hypothesis in hypotheses:
+            hypothesis.update(similarity_store.similarities(*hypothesis["drug_pair"]))
+    return hypotheses
+
+def _candidate_pairs(index, G, selected_drugs, min_overlap):
+    """
+    Pairs of selected_drugs in combination order, pruned to those sharing
+    at least min_overlap side effects according to the index.
+    """
+    positions = {}
+    for pos, drug in enumerate(selected_drugs):
+        positions.setdefault(drug, []).append(pos)
+    for i, d1 in enumerate(selected_drugs):
+        se1 = [v for u, v in G.edges(d1)] if d1 in G else []
+        counts = index.shared_effect_counts(se1)
+        partners = sorted(pos for drug, count in counts.items() if count >= min_overlap
+                          for pos in positions.get(drug, []) if pos > i)
+        for j in partners:
+            yield d1, selected_drugs[j]
+
+def _lsh_candidate_pairs(minhash_index, selected_drugs):
+    """
+    Pairs of selected_drugs in combination order, pruned to those sharing
+    an LSH bucket.
+    """
+    positions = {}
+    for pos, drug in enumerate(selected_drugs):
+        positions.setdefault(drug, []).append(pos)
+    for i, d1 in enumerate(selected_drugs):
+        row = minhash_index.drug_index.get(d1)
+        if row is None:
+            continue
+        candidates = minhash_index.candidates(minhash_index.signatures[row]).tolist()
+        partners = sorted(pos for other in candidates
+                          for pos in positions.get(minhash_index.drug_names[other], []) if pos > i)
+        for j in partners:
+            yield d1, selected_drugs[j]
+
+def find_safer_alternatives(index, drug, side_effects, risk_map, similarity_store=None, minhash_index=None,
+                            max_candidates=100):
+    """
+    Drugs sharing side effects with a drug and having a lower risk score.
+    Candidates come from the inverted index, so only drugs with at least
+    one shared side effect are looked at. With a MinHashLSHIndex they are
+    instead the max_candidates drugs whose profiles most resemble
+    side_effects, found through its LSH buckets, so the cost no longer grows
+    with the number of drugs sharing a common side effect.
 
-            hypotheses.append({
-                "drug_pair": (d1, d2),
-                "overlap_count": len(overlap),
-                "top_shared_effects": top_effects,
-                "hypothesis": f"Combination of '{d1}' and '{d2}' may significantly increase the risk of: {top_effects}."
+    Returns:
+        list of dicts with drug, shared_effects, risk_score and
+        risk_reduction (plus jaccard_similarity and cosine_similarity when
+        a similarity store is given), in drug id order, or by decreasing
+        profile similarity with a MinHash index.
+    """
+    risk_query = risk_map[drug]
+    if minhash_index is not None:
+        neighbours = minhash_index.query(side_effects=side_effects, top_k=max_candidates + 1, exact=True)
+        counts = minhash_index.overlap_counts([other for other, _ in neighbours], side_effects)
+    else:
+        counts = index.shared_effect_counts(side_effects)
+    suggestions = []
+    for other, overlap in counts.items():
+        if other == drug or overlap == 0:
+            continue
+        risk_other = risk_map.get(other, float("inf"))
+        if risk_other < risk_query:
+            suggestions.append({
+                "drug": other,
+                "shared_effects": overlap,
+                "risk_score": risk_other,
+                "risk_reduction": risk_query - risk_other
             })
+            if similarity_store is not None:
+                suggestions[-1].update(similarity_store.similarities(drug, other))
+    return suggestions
 
-    hypotheses.sort(key=lambda x: x["overlap_count"], reverse=True)
+def _hypothesis(d1, d2, overlap_count, freq_scores):
+    top_effects = ", ".join([f"{se} (score: {score})" for se, score in freq_scores[:5]])
+    return {
+        "drug_pair": (d1, d2),
+        "overlap_count": overlap_count,
+        "top_shared_effects": top_effects,
+        "hypothesis": f"Combination of '{d1}' and '{d2}' may significantly increase the risk of: {top_effects}."
+    }
+
+def selected_drug_matrix(G, selected_drugs):
+    """
+    Frequency matrix of the selected drugs: one CSR row per entry of
+    selected_drugs (empty for drugs not in G), one column per side effect.
+    Edges without a frequency are stored as 0.0.
+
+    Returns:
+        (matrix, side_effect_names)
+    """
+    if hasattr(G, 'matrix'):  # SparseSideEffectGraph
+        indptr, indices, data = [0], [], []
+        for drug in selected_drugs:
+            row = G.drug_index.get(drug)
+            if row is not None:
+                start, end = G.matrix.indptr[row], G.matrix.indptr[row + 1]
+                indices.append(G.matrix.indices[start:end])
+                data.append(G.matrix.data[start:end])
+            indptr.append(indptr[-1] + (end - start if row is not None else 0))
+        indices = np.concatenate(indices) if indices else np.empty(0, dtype=np.int64)
+        data = np.nan_to_num(np.concatenate(data).astype(np.float64), nan=0.0) if data else np.empty(0)
+        matrix = sp.csr_matrix((data, indices, indptr), shape=(len(selected_drugs), len(G.side_effect_names)))
+        return matrix, G.side_effect_names
+
+    se_index = {}
+    indptr, indices, data = [0], [], []
+    for drug in selected_drugs:
+        if drug in G:
+            for _, se, freq in G.out_edges(drug, data="frequency", default=0):
+                indices.append(se_index.setdefault(se, len(se_index)))
+                data.append(freq)
+        indptr.append(len(indices))
+    matrix = sp.csr_matrix((np.array(data, dtype=np.float64), np.array(indices, dtype=np.int64), indptr),
+                           shape=(len(selected_drugs), len(se_index)))
+    return matrix, list(se_index)
+
+def _top_pairs(counts_block, row_offset, min_overlap, top_k, best):
+    """
+    Merge the pairs (i < j) of a block of the overlap matrix with at least
+    min_overlap shared effects into best = (counts, i, j), keeping the
+    top_k by count with ties in pair order.
+
+    With min_overlap <= 0 pairs without shared effects count too; they are
+    not stored in the sparse block, so it is scanned densely.
+    """
+    if min_overlap > 0:
+        block = sp.triu(counts_block, k=row_offset + 1).tocoo()
+        keep = block.data >= min_overlap
+        data, block_rows, block_cols = block.data[keep], block.row[keep], block.col[keep]
+    else:
+        dense = counts_block.toarray()
+        block_rows, block_cols = np.nonzero(np.triu(np.ones(dense.shape, dtype=bool), k=row_offset + 1))
+        data = dense[block_rows, block_cols]
+    counts = np.concatenate([best[0], data.astype(np.int64)])
+    rows = np.concatenate([best[1], block_rows.astype(np.int64) + row_offset])
+    cols = np.concatenate([best[2], block_cols.astype(np.int64)])
+    if top_k is not None and len(counts) > top_k > 0:
+        # Everything tied with the k-th largest count survives the cut,
+        # the exact order is settled by the sort below
+        threshold = np.partition(counts, len(counts) - top_k)[len(counts) - top_k]
+        keep = counts >= threshold
+        counts, rows, cols = counts[keep], rows[keep], cols[keep]
+    order = np.lexsort((cols, rows, -counts))[:top_k]
+    return counts[order], rows[order], cols[order]
+
+def _bulk_matrices(G, selected_drugs):
+    freqs, se_names = selected_drug_matrix(G, selected_drugs)
+    binary = freqs.copy()
+    binary.data = np.ones_like(binary.data)
+    return freqs, binary, binary.T.tocsc(), se_names
+
+def _scan_pairs(binary, binary_t, start, stop, min_overlap, top_k, block_size=BULK_BLOCK_SIZE):
+    """
+    Top pairs (i, j) with start <= i < stop, from blocks of rows of A·Aᵀ.
+    """
+    empty = np.empty(0, dtype=np.int64)
+    best = (empty, empty, empty)
+    for block_start in range(start, stop, block_size):
+        counts_block = binary[block_start:min(block_start + block_size, stop)] @ binary_t
+        best = _top_pairs(counts_block, block_start, min_overlap, top_k, best)
+    return best
+
+def _format_pairs(freqs, se_names, selected_drugs, best):
+    """
+    Hypotheses for the (count, i, j) pairs of best, in that order.
+    """
+    # side effect -> frequency per selected drug, built for result rows only
+    row_maps = {}
+
+    def row_map(i):
+        if i not in row_maps:
+            start, end = freqs.indptr[i], freqs.indptr[i + 1]
+            names = [se_names[se] for se in freqs.indices[start:end].tolist()]
+            row_maps[i] = dict(zip(names, freqs.data[start:end].tolist()))
+        return row_maps[i]
+
+    hypotheses = []
+    for overlap_count, i, j in zip(*(values.tolist() for values in best)):
+        freqs_i, freqs_j = row_map(i), row_map(j)
+        freq_scores = [(se, round((f1 + freqs_j[se]) / 2, 4)) for se, f1 in freqs_i.items() if se in freqs_j]
+        freq_scores.sort(key=lambda x: x[1], reverse=True)
+        hypotheses.append(_hypothesis(selected_drugs[i], selected_drugs[j], overlap_count, freq_scores))
     return hypotheses
+
+def _bulk_risk_hypotheses(G, selected_drugs, min_overlap, top_k, block_size=BULK_BLOCK_SIZE):
+    """
+    Bulk mode of generate_risk_hypotheses(): the shared side effect counts
+    of all pairs are the entries of A·Aᵀ for the binary selected-drug
+    matrix A, computed one block of rows at a time so only the running
+    top_k pairs are kept.
+    """
+    freqs, binary, binary_t, se_names = _bulk_matrices(G, selected_drugs)
+    best = _scan_pairs(binary, binary_t, 0, len(selected_drugs), min_overlap, top_k, block_size)
+    return _format_pairs(freqs, se_names, selected_drugs, best)
+
+# === Parallel mode ===
+
+# Matrices of the current parallel run. Worker processes receive them once
+# through the pool initializer: with the fork start method they share the
+# parent's pages copy-on-write instead of unpickling a copy.
+_SHARED_BULK_DATA = None
+
+def _init_hypothesis_worker(shared):
+    global _SHARED_BULK_DATA
+    _SHARED_BULK_DATA = shared
+
+def _hypothesis_shard(args):
+    """
+    Scan and format the pairs whose first drug is in rows start..stop.
+    """
+    start, stop, min_overlap, top_k = args
+    freqs, binary, binary_t, se_names, selected_drugs = _SHARED_BULK_DATA
+    best = _scan_pairs(binary, binary_t, start, stop, min_overlap, top_k)
+    hypotheses = _format_pairs(freqs, se_names, selected_drugs, best)
+    return list(zip(best[0].tolist(), best[1].tolist(), best[2].tolist(), hypotheses))
+
+def shard_bounds(n, shards):
+    """
+    Row boundaries splitting the i < j pairs of n rows into shards with
+    about the same number of pairs each.
+    """
+    pairs_before = np.concatenate([[0], np.cumsum(np.arange(n - 1, -1, -1))])
+    targets = np.linspace(0, pairs_before[-1], shards + 1)
+    bounds = np.unique(np.searchsorted(pairs_before, targets, side='left'))
+    bounds[0], bounds[-1] = 0, n
+    return np.unique(bounds).tolist()
+
+def _parallel_risk_hypotheses(G, selected_drugs, min_overlap, top_k, workers, shards=None):
+    """
+    Parallel bulk mode: the pair space is cut into row shards of about equal
+    pair counts, each worker computes and formats the top pairs of its
+    shards, and the sorted shard results are merged into the global top_k
+    (count descending, ties in pair order), the same result as bulk mode.
+    """
+    freqs, binary, binary_t, se_names = _bulk_matrices(G, selected_drugs)
+    selected_drugs = list(selected_drugs)
+    bounds = shard_bounds(len(selected_drugs), shards or workers * 4)
+    tasks = [(start, stop, min_overlap, top_k) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+    ctx = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+    shared = (freqs, binary, binary_t, se_names, selected_drugs)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_hypothesis_worker,
+                             initargs=(shared,)) as executor:
+        results = list(executor.map(_hypothesis_shard, tasks))
+
+    merged = heapq.merge(*results, key=lambda item: (-item[0], item[1], item[2]))
+    return [hypothesis for _, _, _, hypothesis in islice(merged, top_k)]
@@ -1,27 +1,51 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+
 from pyvis.network import Network
 import networkx as nx
+import numpy as np
+import pandas as pd
+
+from src.graph_clusters import cluster_edges, cluster_risk, detect_clusters
+from src.graph_layout import force_layout, graph_edge_arrays, node_positions
+
 
-def visualize_graph(graph, output_path="graph.html", max_nodes=300):
-    
+def _static_position(positions, node):
+    """
+    add_node options pinning a node to its precomputed position.
+    """
+    if positions is None:
+        return {}
+    x, y = positions[node]
+    return {"x": x, "y": y, "physics": False}
+
+
+def visualize_graph(graph, output_path="graph.html", max_nodes=300, static_layout=False):
+    """
+    With static_layout=True node positions are computed here with a NumPy
+    force layout and physics is disabled, so the page does not have to
+    settle a layout in the browser before it is usable.
+    """
     net = Network(height="750px", width="100%", notebook=False, bgcolor="#222222", font_color="white")
 
     # Optional: limit nodes for performance
     subgraph = graph.subgraph(list(graph.nodes)[:max_nodes])
+    positions = node_positions(subgraph) if static_layout else None
 
-    # Customize nodes
-    for node in subgraph.nodes():
-        degree = subgraph.degree(node)
-        subgraph.nodes[node]['size'] = 10 + degree  # Base size + degree
-
+    # Customize nodes; sizes are not written back to the caller's graph
     for node, data in subgraph.nodes(data=True):
-        size = data.get("size", 10)  # Use the calculated size
+        size = 10 + subgraph.degree(node)  # Base size + degree
         net.add_node(
             node,
             label=data.get("label", node),
             color=data.get("color", "#97c2fc"),
             group=data.get("type", "unknown"),  # Group by node type
             size=size,
-            title=f"Node: {node}<br>Degree: {subgraph.degree(node)}"  # Tooltip with additional info
+            title=f"Node: {node}<br>Degree: {subgraph.degree(node)}",  # Tooltip with additional info
+            **_static_position(positions, node)
         )
 
     # Add edges with optional titles
@@ -34,41 +58,55 @@ def visualize_graph(graph, output_path="graph.html", max_nodes=300):
             width=edge_data.get("weight", 2)  # Edge thickness based on weight
         )
 
-    # Apply layout algorithm with adjusted parameters to reduce edge overlap
-    net.force_atlas_2based(
-        gravity=-30,  # Adjust gravity to spread nodes further apart
-        central_gravity=0.01, 
-        spring_length=150,  # Increase spring length to reduce edge overlap
-        spring_strength=0.1  # Adjust spring strength for better spacing
-    )
-
-    net.from_nx(subgraph)
+    if static_layout:
+        net.toggle_physics(False)
+    else:
+        # Apply layout algorithm with adjusted parameters to reduce edge overlap
+        net.force_atlas_2based(
+            gravity=-30,  # Adjust gravity to spread nodes further apart
+            central_gravity=0.01, 
+            spring_length=150,  # Increase spring length to reduce edge overlap
+            spring_strength=0.1  # Adjust spring strength for better spacing
+        )
 
     print(f"Generating interactive graph with {len(subgraph.nodes)} nodes and {len(subgraph.edges)} edges...")
 
-    net.show_buttons(filter_=['physics'])  # Add physics control buttons for user customization
+    if not static_layout:
+        net.show_buttons(filter_=['physics'])  # Add physics control buttons for user customization
     net.write_html(output_path, notebook=False, open_browser=False)
     print(f"Graph saved as {output_path}")
 
 
-def visualize_complete_graph(graph, output_path="complete_graph.html"):
+def visualize_complete_graph(graph, output_path="complete_graph.html", static_layout=False, clustered=False,
+                             max_cluster_size=500):
+        """
+        static_layout=True precomputes node positions and disables physics,
+        as in visualize_graph.
 
-        net = Network(height="750px", width="100%", notebook=False, bgcolor="#222222", font_color="white")
+        clustered=True renders level of detail for graphs too big for one
+        page (see _write_clustered_graph): output_path only draws one node
+        per cluster of at most max_cluster_size nodes, and the members of
+        each cluster are loaded from the clusters/ directory next to it.
+        Positions are always precomputed in this mode.
+        """
+        if clustered:
+            _write_clustered_graph(graph, output_path, max_cluster_size=max_cluster_size)
+            return
 
-        # Customize nodes
-        for node in graph.nodes():
-            degree = graph.degree(node)
-            graph.nodes[node]['size'] = 10 + degree  # Base size + degree
+        net = Network(height="750px", width="100%", notebook=False, bgcolor="#222222", font_color="white")
+        positions = node_positions(graph) if static_layout else None
 
+        # Customize nodes; sizes are not written back to the caller's graph
         for node, data in graph.nodes(data=True):
-            size = data.get("size", 10)  # Use the calculated size
+            size = 10 + graph.degree(node)  # Base size + degree
             net.add_node(
                 node,
                 label=data.get("label", node),
                 color=data.get("color", "#97c2fc"),
                 group=data.get("type", "unknown"),  # Group by node type
                 size=size,
-                title=f"Node: {node}<br>Degree: {graph.degree(node)}"  # Tooltip with additional info
+                title=f"Node: {node}<br>Degree: {graph.degree(node)}",  # Tooltip with additional info
+                **_static_position(positions, node)
             )
 
         # Add edges with optional titles
@@ -82,12 +120,522 @@ def visualize_complete_graph(graph, output_path="complete_graph.html"):
             )
 
         # Apply layout algorithm
-        net.force_atlas_2based()
-
-        net.from_nx(graph)
+        if static_layout:
+            net.toggle_physics(False)
+        else:
+            net.force_atlas_2based()
 
         print(f"Generating complete interactive graph with {len(graph.nodes)} nodes and {len(graph.edges)} edges...")
 
-        net.show_buttons(filter_=['physics'])  # Add physics control buttons for user customization
+        if not static_layout:
+            net.show_buttons(filter_=['physics'])  # Add physics control buttons for user customization
         net.write_html(output_path, notebook=False, open_browser=False)
         print(f"Complete graph saved as {output_path}")
+
+
+# === Level-of-detail clustered rendering ===
+
+VIS_NETWORK_JS = "https://cdnjs.cloudflare.com/ajax/libs/vis-network/9.1.2/dist/vis-network.min.js"
+VIS_NETWORK_CSS = "https://cdnjs.cloudflare.com/ajax/libs/vis-network/9.1.2/dist/dist/vis-network.min.css"
+
+_CLUSTER_PAGE = """<html>
+<head>
+<meta charset="utf-8">
+<link rel="stylesheet" href="%(css)s" />
+<script src="%(js)s"></script>
+<style>
+  body { margin: 0; background-color: #222222; color: white; font-family: sans-serif; }
+  #network { width: 100%%; height: 750px; }
+  #hint { padding: 0.5rem; font-size: 0.9rem; color: #bbbbbb; }
+</style>
+</head>
+<body>
+<div id="hint">Double-click a cluster to expand it, and one of its members to collapse it again.</div>
+<div id="network"></div>
+<script>
+const GRAPH = %(graph)s;
+const nodes = new vis.DataSet(GRAPH.nodes);
+const edges = new vis.DataSet(GRAPH.edges);
+const network = new vis.Network(document.getElementById("network"), {nodes: nodes, edges: edges}, {
+  physics: {enabled: false},
+  interaction: {hover: true, tooltipDelay: 100},
+  nodes: {font: {color: "white"}},
+  edges: {color: {inherit: false}, smooth: false}
+});
+const loaded = {};
+const expanded = {};
+
+function edgesOf(nodeIds) {
+  const ids = new Set(nodeIds);
+  return edges.getIds({filter: e => ids.has(e.from) || ids.has(e.to)});
+}
+
+function linkEdges(cluster) {
+  // Member -> cluster edges towards the clusters that are still collapsed
+  return cluster.links
+    .filter(link => !expanded[link[1]])
+    .map(link => ({id: "l" + cluster.id + ":" + link[0] + ":" + link[1], from: link[0], to: "cluster:" + link[1],
+                   width: Math.min(1 + Math.log(link[2]), 6), color: "#555555",
+                   title: link[2] + " edge(s) into cluster " + link[1]}));
+}
+
+function crossEdges(cluster) {
+  // Member edges into the clusters that are expanded too (both clusters
+  // list them under the same id)
+  return cluster.cross.filter(edge => expanded[edge.cluster]);
+}
+
+function expand(cluster) {
+  const superId = "cluster:" + cluster.id;
+  expanded[cluster.id] = cluster;
+  edges.remove(edgesOf([superId]));
+  nodes.remove(superId);
+  nodes.add(cluster.nodes);
+  edges.add(cluster.edges);
+  edges.add(linkEdges(cluster));
+  edges.update(crossEdges(cluster));
+}
+
+function collapse(id) {
+  const cluster = expanded[id];
+  delete expanded[id];
+  const memberIds = cluster.nodes.map(n => n.id);
+  edges.remove(edgesOf(memberIds));
+  nodes.remove(memberIds);
+  const superId = "cluster:" + id;
+  nodes.add(GRAPH.nodes.filter(n => n.id === superId));
+  edges.add(GRAPH.edges.filter(e => (e.from === superId && nodes.get(e.to)) || (e.to === superId && nodes.get(e.from))));
+  // Expanded clusters link their members to this cluster again
+  Object.values(expanded).forEach(other => edges.update(linkEdges(other)));
+}
+
+window.sideEffectNetCluster = function (cluster) {
+  loaded[cluster.id] = cluster;
+  expand(cluster);
+};
+
+network.on("doubleClick", function (params) {
+  if (!params.nodes.length) return;
+  const node = nodes.get(params.nodes[0]);
+  if (node.cluster === undefined) return;
+  if (!node.member) {
+    if (loaded[node.cluster]) { expand(loaded[node.cluster]); return; }
+    const script = document.createElement("script");
+    script.src = GRAPH.clusterDir + "/c" + node.cluster + ".js";
+    document.body.appendChild(script);
+  } else {
+    collapse(node.cluster);
+  }
+});
+</script>
+</body>
+</html>
+"""
+
+
+def _vis_node(graph, node, degree, x, y, **options):
+    data = graph.nodes[node]
+    return {
+        "id": str(node),
+        "label": str(data.get("label", node)),
+        "color": data.get("color", "#97c2fc"),
+        "group": data.get("type", "unknown"),
+        "size": 10 + degree,
+        "title": f"Node: {node}<br>Degree: {degree}",
+        "x": x,
+        "y": y,
+        **options,
+    }
+
+
+def _write_clustered_graph(graph, output_path, max_cluster_size=500, spacing=60.0, seed=0):
+    """
+    Level-of-detail rendering of a large graph.
+
+    The graph is split into communities (see graph_clusters.detect_clusters)
+    and the page at output_path only draws one node per cluster, sized by
+    its member count with its drugs' mean and max risk_score in the
+    tooltip, and one edge per pair of connected clusters. Double-clicking a
+    cluster loads clusters/c<id>.js (next to the page) and replaces the
+    cluster by its members (laid out around it), linked to the clusters
+    that are still collapsed and by their own edges to the members of
+    expanded ones; double-clicking a member collapses the cluster again.
+    The page and each data file hold at most one level of detail, so
+    neither grows with the size of the whole graph. vis-network comes from
+    the shared assets next to the page (see publish_assets).
+    """
+    output_dir = os.path.dirname(output_path) or "."
+    clusters = detect_clusters(graph, max_cluster_size=max_cluster_size, seed=seed)
+    membership, counts = cluster_edges(graph, clusters)
+
+    # Clusters are placed far enough apart to leave room for their members
+    between = [(a, b) for a, b in counts if a != b]
+    top = force_layout(len(clusters), [a for a, _ in between], [b for _, b in between], seed=seed)
+    top *= spacing * 2 * np.sqrt(max(len(cluster) for cluster in clusters)) if clusters else spacing
+
+    super_nodes, super_edges = [], []
+    for c, cluster in enumerate(clusters):
+        drugs = sum(1 for node in cluster if graph.nodes[node].get("type") == "drug")
+        mean_risk, max_risk = cluster_risk(graph, cluster)
+        risk = "n/a" if mean_risk is None else f"{mean_risk:.3f} (max {max_risk:.3f})"
+        hubs = sorted(cluster, key=graph.degree, reverse=True)[:5]
+        super_nodes.append({
+            "id": f"cluster:{c}",
+            "cluster": c,
+            "label": f"Cluster {c} ({len(cluster)})",
+            "shape": "dot",
+            "size": 10 + 3 * float(np.sqrt(len(cluster))),
+            "color": "#f2a65a" if drugs else "#f26c6c",
+            "title": (f"Cluster {c}<br>Drugs: {drugs}<br>Side effects: {len(cluster) - drugs}"
+                      f"<br>Risk score: {risk}<br>Hubs: {', '.join(map(str, hubs))}"),
+            "x": round(float(top[c, 0]), 1),
+            "y": round(float(top[c, 1]), 1),
+        })
+    for (a, b), n in counts.items():
+        if a != b:
+            super_edges.append({"id": f"e{a}:{b}", "from": f"cluster:{a}", "to": f"cluster:{b}", "value": n,
+                                "title": f"{n} edge(s)", "color": "#cccccc"})
+
+    # Member edges between clusters, listed in the data of both clusters
+    cross = [[] for _ in clusters]
+    for u, v, data in graph.edges(data=True):
+        a, b = membership[u], membership[v]
+        if a != b:
+            edge = {"id": "x:" + json.dumps([str(u), str(v)]), "from": str(u), "to": str(v),
+                    "title": data.get("title", "causes"), "color": data.get("color", "#cccccc"),
+                    "width": data.get("weight", 2)}
+            cross[a].append(dict(edge, cluster=b))
+            cross[b].append(dict(edge, cluster=a))
+
+    cluster_dir = os.path.join(output_dir, "clusters")
+    os.makedirs(cluster_dir, exist_ok=True)
+    for c, cluster in enumerate(clusters):
+        subgraph = graph.subgraph(cluster)
+        nodes, src, dst = graph_edge_arrays(subgraph)
+        pos = force_layout(len(nodes), src, dst, seed=seed) * spacing + top[c]
+        links = {}
+        for node in cluster:
+            for other in nx.all_neighbors(graph, node):
+                if membership[other] != c:
+                    key = (str(node), membership[other])
+                    links[key] = links.get(key, 0) + 1
+        payload = {
+            "id": c,
+            "nodes": [_vis_node(graph, node, graph.degree(node), round(x, 1), round(y, 1), cluster=c, member=True)
+                      for node, (x, y) in zip(nodes, pos.tolist())],
+            "edges": [{"from": str(u), "to": str(v), "title": data.get("title", "causes"),
+                       "color": data.get("color", "#cccccc"), "width": data.get("weight", 2)}
+                      for u, v, data in subgraph.edges(data=True)],
+            "links": [[node, other, n] for (node, other), n in links.items()],
+            "cross": cross[c],
+        }
+        with open(os.path.join(cluster_dir, f"c{c}.js"), "w", encoding="utf-8") as f:
+            f.write(f"sideEffectNetCluster({json.dumps(payload)});\n")
+
+    publish_assets(output_dir)
+    graph_json = _inline_json({"nodes": super_nodes, "edges": super_edges, "clusterDir": "clusters"})
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(_CLUSTER_PAGE % {"css": f"{ASSET_DIR}/vis-9.1.2/vis-network.css",
+                                 "js": f"{ASSET_DIR}/vis-9.1.2/vis-network.min.js", "graph": graph_json})
+    print(f"Clustered graph with {len(clusters)} clusters saved as {output_path}")
+
+
+# === Streaming vis.js output ===
+
+# pyvis' force_atlas_2based() defaults
+FORCE_ATLAS_OPTIONS = {
+    "physics": {
+        "solver": "forceAtlas2Based",
+        "forceAtlas2Based": {"gravitationalConstant": -50, "centralGravity": 0.01, "springLength": 100,
+                             "springConstant": 0.08, "damping": 0.4, "avoidOverlap": 0},
+    }
+}
+STATIC_OPTIONS = {"physics": {"enabled": False}}
+
+_STREAM_PAGE_HEAD = """<html>
+<head>
+<meta charset="utf-8">
+<link rel="stylesheet" href="%(css)s" />
+<script src="%(js)s"></script>
+<style>
+  body { margin: 0; background-color: %(bgcolor)s; }
+  #network { width: 100%%; height: %(height)s; }
+</style>
+</head>
+<body>
+<div id="network"></div>
+<script>
+const nodes = new vis.DataSet(["""
+
+_STREAM_PAGE_MIDDLE = """]);
+const edges = new vis.DataSet(["""
+
+_STREAM_PAGE_TAIL = """]);
+const network = new vis.Network(document.getElementById("network"), {nodes: nodes, edges: edges}, %(options)s);
+</script>
+</body>
+</html>
+"""
+
+
+def _inline_json(value):
+    # "</" would end the inline script early
+    return json.dumps(value).replace("</", "<\\/")
+
+
+def _write_json_items(f, items):
+    for i, item in enumerate(items):
+        if i:
+            f.write(",")
+        f.write(_inline_json(item))
+
+
+def write_vis_html(output_path, nodes, edges, options=None, height="750px", bgcolor="#222222"):
+    """
+    Write a vis.js page, streaming the node and edge dicts of the given
+    iterables into it one at a time so no copy of the graph is built.
+    """
+    options = FORCE_ATLAS_OPTIONS if options is None else options
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(_STREAM_PAGE_HEAD % {"css": VIS_NETWORK_CSS, "js": VIS_NETWORK_JS,
+                                     "height": height, "bgcolor": bgcolor})
+        _write_json_items(f, nodes)
+        f.write(_STREAM_PAGE_MIDDLE)
+        _write_json_items(f, edges)
+        f.write(_STREAM_PAGE_TAIL % {"options": json.dumps(options)})
+    return output_path
+
+
+def graph_vis_elements(graph, positions=None, font_color="white"):
+    """
+    Generators of the vis.js nodes and edges of a graph, styled as by
+    visualize_complete_graph. The graph is only read.
+
+    Returns:
+        (nodes, edges) generators of dicts.
+    """
+    def nodes():
+        for node, data in graph.nodes(data=True):
+            degree = graph.degree(node)
+            item = {"id": node, "label": data.get("label", node), "shape": "dot", "font": {"color": font_color},
+                    "group": data.get("type", "unknown"), "size": 10 + degree,
+                    "title": f"Node: {node}<br>Degree: {degree}"}
+            if positions is not None:
+                item["x"], item["y"] = positions[node]
+                item["physics"] = False
+            yield item
+
+    def edges():
+        for src, dst, data in graph.edges(data=True):
+            yield {"from": src, "to": dst, "title": data.get("title", "causes"),
+                   "color": data.get("color", "#cccccc"), "width": data.get("weight", 2)}
+
+    return nodes(), edges()
+
+
+def edge_array_vis_elements(drugs, side_effects, font_color="white", static_layout=False):
+    """
+    Generators of the vis.js nodes and edges of drug -> side effect edge
+    arrays (e.g. the columns of the clean table), without building a graph.
+    As in build_graph_from_columns, duplicate edges are drawn once and a
+    name used both ways takes the type of its last occurrence. With
+    static_layout the nodes get fixed positions as in node_positions().
+
+    Returns:
+        (nodes, edges) generators of dicts.
+    """
+    drugs = np.asarray(drugs, dtype=object)
+    side_effects = np.asarray(side_effects, dtype=object)
+    # Rows without a drug or side effect name have no edge
+    keep = pd.notna(drugs) & pd.notna(side_effects)
+    n = int(keep.sum())
+    interleaved = np.empty(2 * n, dtype=object)
+    interleaved[0::2] = drugs[keep]
+    interleaved[1::2] = side_effects[keep]
+    codes, names = pd.factorize(interleaved)
+    last = np.zeros(len(names), dtype=np.int64)
+    np.maximum.at(last, codes, np.arange(2 * n))
+    is_drug = last % 2 == 0
+
+    pairs = np.unique(codes.reshape(-1, 2), axis=0)
+    degree = np.bincount(pairs.ravel(), minlength=len(names))
+    positions = None
+    if static_layout:
+        positions = (force_layout(len(names), pairs[:, 0], pairs[:, 1]) * 60.0).round(1).tolist()
+
+    def nodes():
+        for i, (name, drug, d) in enumerate(zip(names.tolist(), is_drug.tolist(), degree.tolist())):
+            item = {"id": name, "label": name, "shape": "dot", "font": {"color": font_color},
+                    "group": "drug" if drug else "side_effect", "size": 10 + d,
+                    "title": f"Node: {name}<br>Degree: {d}"}
+            if positions is not None:
+                item["x"], item["y"] = positions[i]
+                item["physics"] = False
+            yield item
+
+    def edges():
+        for src, dst in pairs.tolist():
+            yield {"from": names[src], "to": names[dst], "title": "causes", "color": "#cccccc", "width": 2}
+
+    return nodes(), edges()
+
+
+def stream_graph_html(graph, output_path="complete_graph.html", static_layout=False, data_format=None):
+    """
+    Render a whole graph like visualize_complete_graph, in a single pass
+    over the graph and without PyVis or changes to the graph.
+
+    With a data_format (see write_vis_page) the page loads the shared
+    assets and a separate data file instead of embedding everything.
+    """
+    positions = node_positions(graph) if static_layout else None
+    nodes, edges = graph_vis_elements(graph, positions)
+    options = STATIC_OPTIONS if static_layout else None
+    if data_format is None:
+        write_vis_html(output_path, nodes, edges, options=options)
+    else:
+        write_vis_page(output_path, nodes, edges, options=options, data_format=data_format)
+    print(f"Complete graph with {graph.number_of_nodes()} nodes and {graph.number_of_edges()} edges saved as {output_path}")
+    return output_path
+
+
+def stream_edge_arrays_html(drugs, side_effects, output_path="complete_graph.html", static_layout=False):
+    """
+    Render drug -> side effect edge arrays like stream_graph_html, without
+    building a graph first.
+    """
+    nodes, edges = edge_array_vis_elements(drugs, side_effects, static_layout=static_layout)
+    write_vis_html(output_path, nodes, edges, options=STATIC_OPTIONS if static_layout else None)
+    print(f"Complete graph of {len(drugs)} edge rows saved as {output_path}")
+    return output_path
+
+
+# === Shared assets and external data files ===
+
+LIB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lib")
+ASSET_DIR = "assets"
+DATA_DIR = "data"
+
+# data_format -> suffix of the data files of write_vis_page
+DATA_FORMATS = {"js": ".js", "json": ".json", "json.gz": ".json.gz"}
+
+_PAGE_LOADER = """// Draws a graph page written by write_vis_page()
+function sideEffectNetLoad(url, format, options) {
+  const draw = function (data) {
+    new vis.Network(document.getElementById("network"),
+                    {nodes: new vis.DataSet(data.nodes), edges: new vis.DataSet(data.edges)}, options);
+  };
+  if (format === "js") {
+    // A script tag also works for pages opened from file://
+    window.sideEffectNetGraph = draw;
+    const script = document.createElement("script");
+    script.src = url;
+    document.body.appendChild(script);
+    return;
+  }
+  fetch(url).then(response => response.arrayBuffer()).then(function (buffer) {
+    const bytes = new Uint8Array(buffer);
+    // Servers may already have undone the gzip encoding
+    if (bytes[0] !== 0x1f || bytes[1] !== 0x8b) return JSON.parse(new TextDecoder().decode(bytes));
+    return new Response(new Blob([bytes]).stream().pipeThrough(new DecompressionStream("gzip"))).json();
+  }).then(draw);
+}
+"""
+
+_DATA_PAGE = """<html>
+<head>
+<meta charset="utf-8">
+<link rel="stylesheet" href="%(assets)s/vis-9.1.2/vis-network.css" />
+<script src="%(assets)s/vis-9.1.2/vis-network.min.js"></script>
+<script src="%(assets)s/graph_page.js"></script>
+<style>
+  body { margin: 0; background-color: %(bgcolor)s; }
+  #network { width: 100%%; height: %(height)s; }
+</style>
+</head>
+<body>
+<div id="network"></div>
+<script>sideEffectNetLoad(%(url)s, %(format)s, %(options)s);</script>
+</body>
+</html>
+"""
+
+
+def _same_content(path, content):
+    """
+    Whether the file at path exists and holds exactly content (bytes).
+    """
+    if not os.path.exists(path) or os.path.getsize(path) != len(content):
+        return False
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).digest() == hashlib.sha1(content).digest()
+
+
+def publish_assets(output_dir):
+    """
+    Copy the vis-network, tom-select and bindings assets of lib/ (plus the
+    page loader) into output_dir/assets once, for all pages in output_dir
+    to share. Files already there with the same content (SHA-1) are kept.
+
+    Returns:
+        Path of the asset directory.
+    """
+    asset_dir = os.path.join(output_dir, ASSET_DIR)
+    for root, _, files in os.walk(LIB_DIR):
+        target_root = os.path.join(asset_dir, os.path.relpath(root, LIB_DIR))
+        os.makedirs(target_root, exist_ok=True)
+        for name in files:
+            source, target = os.path.join(root, name), os.path.join(target_root, name)
+            with open(source, "rb") as f:
+                content = f.read()
+            if not _same_content(target, content):
+                shutil.copy2(source, target)
+    loader = os.path.join(asset_dir, "graph_page.js")
+    content = _PAGE_LOADER.encode("utf-8")
+    if not _same_content(loader, content):
+        with open(loader, "wb") as f:
+            f.write(content)
+    return asset_dir
+
+
+def write_vis_page(output_path, nodes, edges, options=None, data_format="js", height="750px",
+                   bgcolor="#222222", assets=True):
+    """
+    Write a vis.js page that loads its nodes and edges from a data file.
+
+    The page itself is a few hundred bytes: vis-network comes from the
+    asset directory next to it (see publish_assets) and the nodes and
+    edges are streamed to data/<page name><suffix>:
+        js: a script calling the page loader; also works from file://.
+        json: plain JSON, fetched (needs the pages to be served over http).
+        json.gz: gzip-compressed JSON, fetched and decompressed in the page.
+
+    Set assets=False when the assets were already published, e.g. when
+    writing many pages into one directory.
+
+    Returns:
+        (page path, data file path)
+    """
+    if data_format not in DATA_FORMATS:
+        raise ValueError(f"Unknown data format: {data_format}")
+    output_dir = os.path.dirname(output_path) or "."
+    if assets:
+        publish_assets(output_dir)
+
+    name = os.path.splitext(os.path.basename(output_path))[0]
+    data_name = f"{DATA_DIR}/{name}{DATA_FORMATS[data_format]}"
+    data_path = os.path.join(output_dir, data_name)
+    os.makedirs(os.path.dirname(data_path), exist_ok=True)
+    opener = gzip.open if data_format == "json.gz" else open
+    with opener(data_path, "wt", encoding="utf-8") as f:
+        f.write('sideEffectNetGraph({"nodes": [' if data_format == "js" else '{"nodes": [')
+        _write_json_items(f, nodes)
+        f.write('], "edges": [')
+        _write_json_items(f, edges)
+        f.write(']});\n' if data_format == "js" else ']}')
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(_DATA_PAGE % {"assets": ASSET_DIR, "height": height, "bgcolor": bgcolor,
+                              "url": json.dumps(data_name), "format": json.dumps(data_format),
+                              "options": json.dumps(FORCE_ATLAS_OPTIONS if options is None else options)})
+    return output_path, data_path